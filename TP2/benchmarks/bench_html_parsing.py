@@ -0,0 +1,77 @@
+"""
+Benchmark de extracción HTML.
+Compara parse_html + extract_metadata (dos árboles BeautifulSoup y varios
+recorridos) contra extract_page (una sola pasada con eventos de lxml).
+
+Uso:
+  python benchmarks/bench_html_parsing.py
+  python benchmarks/bench_html_parsing.py --links 20000 --repeat 3
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper.html_parser import parse_html
+from scraper.metadata_extractor import extract_metadata
+from scraper.page_extractor import extract_page
+
+def build_page(num_links: int) -> str:
+    """Genera una página sintética con links, imágenes, headers y meta tags"""
+    parts = [
+        '<!DOCTYPE html><html><head><meta charset="utf-8">',
+        '<title>Página de prueba</title>',
+        '<meta name="description" content="Benchmark de parsing">',
+        '<meta property="og:title" content="Benchmark">',
+        '<meta name="twitter:card" content="summary">',
+        '</head><body>'
+    ]
+    for i in range(num_links):
+        if i % 50 == 0:
+            parts.append(f'<h{i % 6 + 1}>Sección {i}</h{i % 6 + 1}>')
+        parts.append(
+            f'<div class="item"><p>Texto de relleno número {i} con <b>formato</b>.</p>'
+            f'<a href="https://example.com/pagina/{i}">Link {i}</a>'
+            f'<img src="https://cdn.example.com/img/{i}.jpg" alt="img {i}"></div>'
+        )
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+def bench(func, html: str, repeat: int) -> float:
+    """Devuelve el mejor tiempo (segundos) de repeat ejecuciones"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(html)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def legacy(html: str) -> dict:
+    result = parse_html(html)
+    result['meta_tags'] = extract_metadata(html)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de extracción HTML')
+    parser.add_argument('--links', type=int, nargs='+', default=[1000, 5000, 20000],
+                        help='Cantidad de links por página (default: 1000 5000 20000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Repeticiones por caso (default: 5)')
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+
+    print(f"{'links':>8} {'tamaño':>10} {'bs4 x2 (ms)':>12} {'1 pasada (ms)':>14} {'speedup':>8}")
+    for num_links in args.links:
+        html = build_page(num_links)
+        assert legacy(html) == extract_page(html), "Los resultados no coinciden"
+        old = bench(legacy, html, args.repeat)
+        new = bench(extract_page, html, args.repeat)
+        size_kb = len(html.encode('utf-8')) / 1024
+        print(f"{num_links:>8} {size_kb:>8.0f}KB {old * 1000:>12.1f} {new * 1000:>14.1f} {old / new:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
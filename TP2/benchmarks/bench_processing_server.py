@@ -0,0 +1,170 @@
+"""
+Benchmark del Servidor B: front-end asyncio vs. versión con threads.
+Levanta cada variante en un subproceso con tareas falsas (sleep) para medir
+sólo el costo del front-end, y la carga con N clientes concurrentes que
+abren una conexión por solicitud (protocolo legacy).
+
+Reporta conexiones/s, solicitudes rechazadas por sobrecarga, tareas con
+error, threads y memoria (RSS) máxima del proceso servidor.
+
+Uso:
+  python benchmarks/bench_processing_server.py
+  python benchmarks/bench_processing_server.py --clients 200 --duration 10 --task-ms 50
+"""
+
+import os
+import sys
+import time
+import socket
+import struct
+import signal
+import asyncio
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.protocol import build_message, parse_message
+
+TASK_SECONDS = 0.02
+
+def fake_task(*args, **kwargs):
+    """
+    Tarea falsa: simula trabajo de los workers sin red ni Chrome. Acepta
+    cualquier firma de las process_* y devuelve un resultado no vacío para
+    que el servidor la cuente como exitosa.
+    """
+    time.sleep(TASK_SECONDS)
+    return {}
+
+def serve(mode: str, port: int, processes: int, task_ms: int):
+    """Corre el servidor indicado con las tareas reemplazadas por fake_task"""
+    global TASK_SECONDS
+    TASK_SECONDS = task_ms / 1000
+
+    import logging
+    logging.disable(logging.INFO)
+    import server_processing
+    server_processing.process_screenshot = fake_task
+    server_processing.process_performance = fake_task
+    server_processing.process_thumbnails = fake_task
+
+    if mode == 'threaded':
+        server_processing.init_pool(processes)
+        server = server_processing.ThreadedTCPServer(
+            ('127.0.0.1', port), server_processing.ProcessingRequestHandler
+        )
+        server.serve_forever()
+    else:
+        server = server_processing.AsyncProcessingServer('127.0.0.1', port, num_processes=processes)
+        asyncio.run(server.serve_forever())
+
+def read_proc_status(pid: int) -> dict:
+    """Lee VmRSS (KB) y Threads de /proc/<pid>/status"""
+    values = {}
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if key in ('VmRSS', 'Threads'):
+                values[key] = int(value.split()[0])
+    return values
+
+async def run_load(port: int, clients: int, duration: float, pid: int) -> dict:
+    """Genera carga y muestrea el proceso servidor"""
+    done = 0
+    errors = 0
+    rejected = 0
+    task_errors = 0
+    peak = {'VmRSS': 0, 'Threads': 0}
+    deadline = time.perf_counter() + duration
+    message = build_message({'url': 'https://example.com', 'images': []})
+
+    async def client():
+        nonlocal done, errors, rejected, task_errors
+        while time.perf_counter() < deadline:
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(message)
+                await writer.drain()
+                (length,) = struct.unpack('!I', await reader.readexactly(4))
+                response = parse_message(await reader.readexactly(length))
+                writer.close()
+                await writer.wait_closed()
+                done += 1
+                if response.get('overloaded'):
+                    rejected += 1
+                    continue
+                task_errors += 'error' in response or sum(
+                    status != 'ok' for status in response.get('task_status', {}).values()
+                )
+            except (OSError, asyncio.IncompleteReadError):
+                errors += 1
+
+    async def sampler():
+        while time.perf_counter() < deadline:
+            status = read_proc_status(pid)
+            for key in peak:
+                peak[key] = max(peak[key], status.get(key, 0))
+            await asyncio.sleep(0.1)
+
+    start = time.perf_counter()
+    await asyncio.gather(sampler(), *(client() for _ in range(clients)))
+    elapsed = time.perf_counter() - start
+    return {
+        'conn_per_s': done / elapsed,
+        'errors': errors,
+        'rejected': rejected,
+        'task_errors': task_errors,
+        'peak_rss_mb': peak['VmRSS'] / 1024,
+        'peak_threads': peak['Threads']
+    }
+
+def wait_for_port(port: int, timeout: float = 10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"El servidor no abrió el puerto {port}")
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del Servidor B: asyncio vs. threads')
+    parser.add_argument('--clients', type=int, default=100, help='Clientes concurrentes (default: 100)')
+    parser.add_argument('--duration', type=float, default=5, help='Segundos de carga por variante (default: 5)')
+    parser.add_argument('--processes', type=int, default=4, help='Procesos del pool (default: 4)')
+    parser.add_argument('--task-ms', type=int, default=20, help='Duración de cada tarea falsa (default: 20)')
+    parser.add_argument('--serve', choices=['asyncio', 'threaded'], help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.processes, args.task_ms)
+        return
+
+    print(f"{args.clients} clientes, {args.duration}s, {args.processes} procesos, tareas de {args.task_ms}ms")
+    print(f"{'modo':>10} {'conn/s':>10} {'errores':>8} {'rechazadas':>10} {'tareas err':>10} {'RSS máx':>10} {'threads máx':>12}")
+    for mode in ('threaded', 'asyncio'):
+        port = free_port()
+        proc = subprocess.Popen([
+            sys.executable, os.path.abspath(__file__), '--serve', mode, '--port', str(port),
+            '--processes', str(args.processes), '--task-ms', str(args.task_ms)
+        ], start_new_session=True)
+        try:
+            wait_for_port(port)
+            result = asyncio.run(run_load(port, args.clients, args.duration, proc.pid))
+        finally:
+            # Terminar también los workers del pool (mismo grupo de procesos)
+            os.killpg(proc.pid, signal.SIGTERM)
+            proc.wait()
+        print(f"{mode:>10} {result['conn_per_s']:>10.1f} {result['errors']:>8} {result['rejected']:>10} {result['task_errors']:>10} "
+              f"{result['peak_rss_mb']:>8.1f}MB {result['peak_threads']:>12}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark de serialización.
+Mide el tiempo de encode/decode y el tamaño del mensaje para cada codec
+registrado, sobre respuestas sintéticas con la forma de las de
+scrape_handler (cientos de links, meta tags, screenshot y thumbnails).
+
+Casos:
+  v1 json       Frame multiplexado versión 1: todo JSON, binarios en base64
+  v2 <codec>    Frame versión 2 con el codec negociado (binarios crudos)
+  meta <codec>  Solo scraping_data, sin binarios: costo puro del codec
+
+Uso:
+  python benchmarks/bench_serialization.py
+  python benchmarks/bench_serialization.py --links 200 1000 --thumbnails 10 --repeat 50
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.protocol import (
+    build_message, parse_message, build_binary_message, parse_binary_message, MUX_HEADER
+)
+from common.serialization import CODECS
+
+def build_response(num_links: int, num_thumbnails: int, screenshot_kb: int) -> dict:
+    """Genera una respuesta con la forma de la de /scrape"""
+    rng = random.Random(num_links)
+    return {
+        'url': 'https://example.com/articulo',
+        'timestamp': '2025-01-01T12:00:00Z',
+        'scraping_data': {
+            'title': 'Página de prueba con un título bastante largo',
+            'links': [f'https://example.com/seccion/{i}/pagina-{rng.randint(0, 10**6)}'
+                      for i in range(num_links)],
+            'meta_tags': {
+                'description': 'Descripción de la página ' * 4,
+                'keywords': 'scraping, asyncio, multiprocessing',
+                'og:title': 'Página de prueba',
+                'og:image': 'https://cdn.example.com/og.jpg',
+                'twitter:card': 'summary_large_image'
+            },
+            'structure': {f'h{i}': rng.randint(0, 40) for i in range(1, 7)},
+            'images_count': num_links // 3
+        },
+        'processing_data': {
+            'screenshot': rng.randbytes(screenshot_kb * 1024),
+            'performance': {'load_time_ms': 1234, 'total_size_kb': 2048.5, 'num_requests': 87},
+            'thumbnails': [rng.randbytes(4 * 1024) for _ in range(num_thumbnails)]
+        },
+        'status': 'success'
+    }
+
+def bench(encode, decode, repeat: int) -> tuple:
+    """Devuelve (mejor encode en s, mejor decode en s, tamaño en bytes)"""
+    best_encode = best_decode = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        payload = encode()
+        best_encode = min(best_encode, time.perf_counter() - start)
+        start = time.perf_counter()
+        decode(payload)
+        best_decode = min(best_decode, time.perf_counter() - start)
+    return best_encode, best_decode, len(payload)
+
+def cases(response: dict):
+    """Genera (nombre, encode, decode) para cada caso a medir"""
+    yield ('v1 json',
+           lambda: build_message(response, 1),
+           lambda frame: parse_message(frame[MUX_HEADER.size:]))
+    for name, codec in CODECS.items():
+        yield (f'v2 {name}',
+               lambda codec=codec: build_binary_message(response, 1, codec),
+               lambda frame, codec=codec: parse_binary_message(frame[MUX_HEADER.size:], codec))
+    for name, codec in CODECS.items():
+        yield (f'meta {name}',
+               lambda codec=codec: codec.encode(response['scraping_data']),
+               lambda payload, codec=codec: codec.decode(payload))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de serialización')
+    parser.add_argument('--links', type=int, nargs='+', default=[200, 1000],
+                        help='Cantidad de links por respuesta (default: 200 1000)')
+    parser.add_argument('--thumbnails', type=int, default=10, help='Thumbnails de 4KB (default: 10)')
+    parser.add_argument('--screenshot-kb', type=int, default=500, help='Tamaño del screenshot (default: 500)')
+    parser.add_argument('--repeat', type=int, default=20, help='Repeticiones por caso (default: 20)')
+    args = parser.parse_args()
+
+    print(f"Codecs registrados: {', '.join(CODECS)}")
+    for num_links in args.links:
+        response = build_response(num_links, args.thumbnails, args.screenshot_kb)
+        print(f"\n{num_links} links, {args.thumbnails} thumbnails, screenshot {args.screenshot_kb}KB")
+        print(f"{'caso':>14} {'tamaño':>10} {'encode (ms)':>12} {'decode (ms)':>12} {'msg/s':>8}")
+        for name, encode, decode in cases(response):
+            encode_s, decode_s, size = bench(encode, decode, args.repeat)
+            rate = 1 / (encode_s + decode_s)
+            print(f"{name:>14} {size / 1024:>8.1f}KB {encode_s * 1000:>12.2f} "
+                  f"{decode_s * 1000:>12.2f} {rate:>8.0f}")
+
+if __name__ == '__main__':
+    main()
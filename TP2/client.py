@@ -4,11 +4,352 @@ Interactúa con el servidor de scraping para enviar URLs y recibir resultados.
 """
 
 import requests
+import aiohttp
+import asyncio
 import json
 import argparse
+import math
+import os
+import random
 import sys
+import time
 from urllib.parse import urljoin
 
+# Status HTTP que vale la pena reintentar en modo --async
+RETRY_STATUS = {429, 502, 503, 504}
+
+def print_summary(data: dict):
+    """
+    Muestra un resumen de un resultado de scraping. Un resultado
+    'degraded' trae los datos de scraping sin procesamiento: se muestran
+    igual, con el error del Servidor B como advertencia.
+    """
+    if data.get('status') in ('success', 'degraded'):
+        scraping = data.get('scraping_data', {})
+        processing = data.get('processing_data', {})
+        
+        if data['status'] == 'degraded':
+            print(f"\n⚠ Éxito parcial")
+            print(f"  ⚠ Procesamiento no disponible: {processing.get('error', 'Error desconocido')}")
+        else:
+            print(f"\n✓ Éxito")
+        print(f"  - Título: {scraping.get('title', 'N/A')}")
+        print(f"  - Links: {len(scraping.get('links', []))}")
+        print(f"  - Imágenes: {scraping.get('images_count', 0)}")
+        print(f"  - Metadatos: {len(scraping.get('meta_tags', {}))}")
+        
+        if processing.get('performance'):
+            perf = processing['performance']
+            print(f"  - Tiempo de carga: {perf.get('load_time_ms', 'N/A')}ms")
+            print(f"  - Tamaño: {perf.get('total_size_kb', 'N/A')}KB")
+        
+        if processing.get('screenshot'):
+            print(f"  - Screenshot: OK ({len(processing['screenshot'])//1024}KB)")
+        
+        if processing.get('thumbnails'):
+            print(f"  - Thumbnails: {len(processing['thumbnails'])}")
+        
+        if data.get('timings'):
+            print_timings(data['timings'])
+    else:
+        print(f"✗ Error: {data.get('error', 'Error desconocido')}")
+
+def print_timings(timings: dict):
+    """Muestra los spans del bloque 'timings' ordenados por inicio"""
+    print(f"  - Traza {timings['trace_id']}: {timings['total_ms']}ms")
+    for span in timings['spans']:
+        print(f"      [{span['server']}] {span['name']:<20} "
+              f"+{span['start_ms']:>8}ms  {span['duration_ms']:>8}ms")
+
+def scrape_serial(urls: list, args, results: list):
+    """Scrapea las URLs de a una con GET /scrape"""
+    for url in urls:
+        try:
+            print(f"\n{'='*60}")
+            print(f"Scrapeando: {url}")
+            print('='*60)
+            
+            # Construir endpoint
+            endpoint = urljoin(args.server, '/scrape')
+            
+            # Hacer solicitud
+            params = {'url': url}
+            if args.timings:
+                params['timings'] = '1'
+            response = requests.get(
+                endpoint,
+                params=params,
+                timeout=120
+            )
+            
+            if response.status_code == 200:
+                data = response.json()
+                
+                if args.output:
+                    results.append(data)
+                else:
+                    # Mostrar resultado formateado
+                    print(json.dumps(data, indent=2, ensure_ascii=False))
+                
+                # Mostrar resumen
+                print_summary(data)
+            else:
+                print(f"✗ Error HTTP {response.status_code}: {response.text}")
+        
+        except requests.Timeout:
+            print(f"✗ Timeout: La solicitud tardó demasiado")
+        except requests.ConnectionError:
+            print(f"✗ Error de conexión: ¿Está el servidor ejecutándose?")
+        except Exception as e:
+            print(f"✗ Error: {str(e)}")
+
+def scrape_batch(urls: list, args, results: list):
+    """
+    Envía todas las URLs juntas a POST /scrape/batch y procesa cada
+    resultado NDJSON a medida que el servidor lo termina.
+    """
+    endpoint = urljoin(args.server, '/scrape/batch')
+    payload = {'urls': urls}
+    if args.concurrency:
+        payload['concurrency'] = args.concurrency
+    
+    try:
+        with requests.post(endpoint, json=payload, stream=True, timeout=(10, 300)) as response:
+            if response.status_code != 200:
+                print(f"✗ Error HTTP {response.status_code}: {response.text}")
+                return
+            
+            done = 0
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                done += 1
+                
+                print(f"\n{'='*60}")
+                print(f"[{done}/{len(urls)}] {data.get('url', 'N/A')}")
+                print('='*60)
+                
+                if args.output:
+                    results.append(data)
+                else:
+                    print(json.dumps(data, indent=2, ensure_ascii=False))
+                print_summary(data)
+    
+    except requests.Timeout:
+        print(f"✗ Timeout: La solicitud tardó demasiado")
+    except requests.ConnectionError:
+        print(f"✗ Error de conexión: ¿Está el servidor ejecutándose?")
+    except Exception as e:
+        print(f"✗ Error: {str(e)}")
+
+def scrape_jobs(urls: list, args, results: list):
+    """
+    Crea un trabajo asíncrono por URL con POST /jobs y consulta
+    GET /jobs/{id} hasta que terminan, mostrando cada etapa apenas se
+    completa. Ninguna solicitud HTTP queda abierta esperando al Servidor B.
+    """
+    endpoint = urljoin(args.server, '/jobs')
+    jobs = {}
+    try:
+        for url in urls:
+            payload = {'url': url}
+            if args.webhook:
+                payload['webhook'] = args.webhook
+            response = requests.post(endpoint, json=payload, timeout=10)
+            if response.status_code != 202:
+                print(f"✗ {url}: Error HTTP {response.status_code}: {response.text}")
+                continue
+            job_id = response.json()['job_id']
+            jobs[job_id] = set()
+            print(f"Trabajo {job_id} creado para {url}")
+        
+        while jobs:
+            time.sleep(args.poll_interval)
+            for job_id, seen in list(jobs.items()):
+                data = requests.get(f'{endpoint}/{job_id}', timeout=10).json()
+                for stage, status in data.get('stages', {}).items():
+                    if status in ('done', 'failed') and stage not in seen:
+                        seen.add(stage)
+                        mark = '✓' if status == 'done' else '✗'
+                        print(f"  {mark} [{job_id[:8]}] {stage} ({data['url']})")
+                if data.get('status') in ('done', 'failed'):
+                    del jobs[job_id]
+                    if args.output:
+                        results.append(data)
+                    else:
+                        print(json.dumps(data, indent=2, ensure_ascii=False))
+                    if data['status'] == 'done':
+                        data['status'] = 'success'
+                    print_summary(data)
+    
+    except requests.Timeout:
+        print(f"✗ Timeout: La solicitud tardó demasiado")
+    except requests.ConnectionError:
+        print(f"✗ Error de conexión: ¿Está el servidor ejecutándose?")
+    except Exception as e:
+        print(f"✗ Error: {str(e)}")
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 10.0) -> float:
+    """Backoff exponencial con jitter completo"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ordenada"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+async def fetch_with_retries(session: aiohttp.ClientSession, endpoint: str, url: str,
+                             retries: int, counters: dict) -> dict:
+    """
+    Hace GET /scrape para una URL reintentando timeouts, errores de conexión
+    y status transitorios (429/502/503/504). Respeta Retry-After si viene.
+    
+    Returns:
+        El resultado del servidor, o un dict de error con la URL
+    """
+    for attempt in range(retries + 1):
+        delay = backoff_delay(attempt)
+        try:
+            async with session.get(endpoint, params={'url': url}) as response:
+                if response.status in RETRY_STATUS and attempt < retries:
+                    retry_after = response.headers.get('Retry-After', '')
+                    if retry_after.isdigit():
+                        delay = float(retry_after) + random.uniform(0, 0.5)
+                else:
+                    try:
+                        data = await response.json(content_type=None)
+                    except (ValueError, aiohttp.ContentTypeError):
+                        data = {'error': (await response.text())[:200]}
+                    if response.status != 200:
+                        data.setdefault('error', f'HTTP {response.status}')
+                        data['status'] = 'failed'
+                    data.setdefault('url', url)
+                    return data
+        except asyncio.TimeoutError:
+            if attempt == retries:
+                return {'url': url, 'error': 'Timeout: La solicitud tardó demasiado', 'status': 'failed'}
+        except aiohttp.ClientError as e:
+            if attempt == retries:
+                return {'url': url, 'error': f'Error de conexión: {e}', 'status': 'failed'}
+        
+        counters['retries'] += 1
+        await asyncio.sleep(delay)
+
+async def scrape_async(urls, args) -> dict:
+    """
+    Scrapea las URLs con N solicitudes concurrentes a GET /scrape.
+    Las URLs se consumen de a poco desde el iterable y cada resultado se
+    escribe apenas llega (JSON Lines si hay -o), así la memoria no crece
+    con el tamaño de la lista.
+    
+    Returns:
+        Resumen con cantidades, throughput y latencias
+    """
+    endpoint = urljoin(args.server, '/scrape')
+    concurrency = args.concurrency or 10
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    counters = {'ok': 0, 'degraded': 0, 'failed': 0, 'retries': 0}
+    latencies = []
+    output = open(args.output, 'w') if args.output else None
+    
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    
+    async def worker(session):
+        while True:
+            url = await queue.get()
+            if url is None:
+                return
+            start = time.perf_counter()
+            data = await fetch_with_retries(session, endpoint, url, args.retries, counters)
+            elapsed = time.perf_counter() - start
+            latencies.append(elapsed)
+            
+            status = data.get('status')
+            if status == 'success':
+                counters['ok'] += 1
+            elif status == 'degraded':
+                counters['degraded'] += 1
+            else:
+                counters['failed'] += 1
+            done = counters['ok'] + counters['degraded'] + counters['failed']
+            
+            if output:
+                output.write(json.dumps(data, ensure_ascii=False) + '\n')
+            if status in ('success', 'degraded'):
+                title = data.get('scraping_data', {}).get('title', 'N/A')
+                mark = '✓' if status == 'success' else '⚠'
+                line = f"[{done}] {mark} {url} ({elapsed * 1000:.0f}ms) - {title}"
+                if status == 'degraded':
+                    error = data.get('processing_data', {}).get('error', 'Error desconocido')
+                    line += f" (sin procesamiento: {error})"
+                print(line)
+            else:
+                print(f"[{done}] ✗ {url} ({elapsed * 1000:.0f}ms) - {data.get('error', 'Error desconocido')}")
+    
+    started = time.perf_counter()
+    try:
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            workers = [asyncio.create_task(worker(session)) for _ in range(concurrency)]
+            for url in urls:
+                await queue.put(url)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+    finally:
+        if output:
+            output.close()
+    
+    total_time = time.perf_counter() - started
+    latencies.sort()
+    total = counters['ok'] + counters['degraded'] + counters['failed']
+    return {
+        'total': total,
+        'ok': counters['ok'],
+        'degraded': counters['degraded'],
+        'failed': counters['failed'],
+        'retries': counters['retries'],
+        'elapsed_s': round(total_time, 2),
+        'requests_per_s': round(total / total_time, 2) if total_time > 0 else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000),
+        'p95_ms': round(percentile(latencies, 95) * 1000)
+    }
+
+def print_async_summary(summary: dict):
+    """Muestra el resumen de throughput y latencia del modo --async"""
+    print(f"\n{'='*60}")
+    print(f"Completadas: {summary['total']} ({summary['ok']} ok, {summary['degraded']} degradadas, "
+          f"{summary['failed']} con error, "
+          f"{summary['retries']} reintentos)")
+    print(f"Tiempo total: {summary['elapsed_s']}s - {summary['requests_per_s']} req/s")
+    print(f"Latencia: p50 {summary['p50_ms']}ms, p95 {summary['p95_ms']}ms")
+
+def read_urls(args, parser):
+    """Devuelve un iterador de URLs desde -u, -f o stdin"""
+    if not args.url and not args.file:
+        if sys.stdin.isatty():
+            parser.print_help()
+            sys.exit(1)
+        # Leer URLs de stdin si está redirigido
+        return (line.strip() for line in sys.stdin if line.strip())
+    if args.url:
+        return iter([args.url])
+    # Leer URLs de archivo
+    if not os.path.isfile(args.file):
+        print(f"Error: Archivo no encontrado: {args.file}", file=sys.stderr)
+        sys.exit(1)
+    return read_url_file(args.file)
+
+def read_url_file(path: str):
+    """Genera las URLs no vacías del archivo, cerrándolo al terminar"""
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield line.strip()
+
 def main():
     parser = argparse.ArgumentParser(
         description='Cliente para el servidor de scraping',
@@ -17,6 +358,9 @@ def main():
 Ejemplos de uso:
   python client.py -s http://localhost:8081 -u https://example.com
   python client.py --server http://192.168.1.100:8081 --url https://google.com
+  python client.py -f urls.txt --batch --concurrency 20 -o resultados.json
+  python client.py -f urls.txt --async --concurrency 50 -o resultados.jsonl
+  python client.py -f urls.txt --jobs --webhook http://localhost:9000/hook
         """
     )
     
@@ -42,88 +386,89 @@ Ejemplos de uso:
     parser.add_argument(
         '-o', '--output',
         type=str,
-        help='Guardar resultado en archivo JSON'
+        help='Guardar resultado en archivo JSON (JSON Lines en modo --async)'
+    )
+    
+    parser.add_argument(
+        '--batch',
+        action='store_true',
+        help='Enviar todas las URLs en un solo lote a /scrape/batch'
+    )
+    
+    parser.add_argument(
+        '--async',
+        dest='async_mode',
+        action='store_true',
+        help='Hacer solicitudes concurrentes con asyncio/aiohttp'
+    )
+    
+    parser.add_argument(
+        '--jobs',
+        action='store_true',
+        help='Crear trabajos asíncronos con POST /jobs y consultar su avance'
+    )
+    
+    parser.add_argument(
+        '--webhook',
+        type=str,
+        default=None,
+        help='URL a la que el servidor avisa cuando termina cada trabajo (modo --jobs)'
+    )
+    
+    parser.add_argument(
+        '--poll-interval',
+        type=float,
+        default=1.0,
+        help='Segundos entre consultas del estado de los trabajos en modo --jobs (default: 1)'
+    )
+    
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=None,
+        help='Solicitudes simultáneas en modo --async (default: 10) o scrapes pedidos al servidor en modo --batch'
+    )
+    
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=120,
+        help='Timeout por solicitud en segundos en modo --async (default: 120)'
+    )
+    
+    parser.add_argument(
+        '--retries',
+        type=int,
+        default=2,
+        help='Reintentos con backoff y jitter por URL en modo --async (default: 2)'
+    )
+    
+    parser.add_argument(
+        '--timings',
+        action='store_true',
+        help='Pedir y mostrar los tiempos de cada etapa en ambos servidores (modo serial)'
     )
     
     args = parser.parse_args()
     
-    if not args.url and not args.file:
-        if sys.stdin.isatty():
-            parser.print_help()
-            sys.exit(1)
-        else:
-            # Leer URLs de stdin si está redirigido
-            urls = [line.strip() for line in sys.stdin if line.strip()]
-    elif args.url:
-        urls = [args.url]
-    else:
-        # Leer URLs de archivo
-        try:
-            with open(args.file, 'r') as f:
-                urls = [line.strip() for line in f if line.strip()]
-        except FileNotFoundError:
-            print(f"Error: Archivo no encontrado: {args.file}", file=sys.stderr)
-            sys.exit(1)
+    urls = read_urls(args, parser)
+    
+    if args.async_mode:
+        summary = asyncio.run(scrape_async(urls, args))
+        print_async_summary(summary)
+        if args.output:
+            print(f"\n✓ Resultados guardados en {args.output}")
+        return
     
+    urls = list(urls)
     results = []
     
-    for url in urls:
-        try:
-            print(f"\n{'='*60}")
-            print(f"Scrapeando: {url}")
-            print('='*60)
-            
-            # Construir endpoint
-            endpoint = urljoin(args.server, '/scrape')
-            
-            # Hacer solicitud
-            response = requests.get(
-                endpoint,
-                params={'url': url},
-                timeout=120
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if args.output:
-                    results.append(data)
-                else:
-                    # Mostrar resultado formateado
-                    print(json.dumps(data, indent=2, ensure_ascii=False))
-                
-                # Mostrar resumen
-                if data.get('status') == 'success':
-                    scraping = data.get('scraping_data', {})
-                    processing = data.get('processing_data', {})
-                    
-                    print(f"\n✓ Éxito")
-                    print(f"  - Título: {scraping.get('title', 'N/A')}")
-                    print(f"  - Links: {len(scraping.get('links', []))}")
-                    print(f"  - Imágenes: {scraping.get('images_count', 0)}")
-                    print(f"  - Metadatos: {len(scraping.get('meta_tags', {}))}")
-                    
-                    if processing.get('performance'):
-                        perf = processing['performance']
-                        print(f"  - Tiempo de carga: {perf.get('load_time_ms', 'N/A')}ms")
-                        print(f"  - Tamaño: {perf.get('total_size_kb', 'N/A')}KB")
-                    
-                    if processing.get('screenshot'):
-                        print(f"  - Screenshot: OK ({len(processing['screenshot'])//1024}KB)")
-                    
-                    if processing.get('thumbnails'):
-                        print(f"  - Thumbnails: {len(processing['thumbnails'])}")
-                else:
-                    print(f"✗ Error: {data.get('error', 'Error desconocido')}")
-            else:
-                print(f"✗ Error HTTP {response.status_code}: {response.text}")
-        
-        except requests.Timeout:
-            print(f"✗ Timeout: La solicitud tardó demasiado")
-        except requests.ConnectionError:
-            print(f"✗ Error de conexión: ¿Está el servidor ejecutándose?")
-        except Exception as e:
-            print(f"✗ Error: {str(e)}")
+    if args.jobs:
+        scrape_jobs(urls, args, results)
+    elif args.batch:
+        scrape_batch(urls, args, results)
+    else:
+        scrape_serial(urls, args, results)
     
     # Guardar resultados si se especificó archivo de salida
     if args.output and results:
@@ -136,4 +481,4 @@ Ejemplos de uso:
             sys.exit(1)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
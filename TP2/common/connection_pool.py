@@ -0,0 +1,283 @@
+"""
+Pool de conexiones persistentes y multiplexadas hacia el Servidor B.
+Cada conexión negocia la versión del protocolo (HANDSHAKE_MAGIC, con
+vuelta a MUX_MAGIC si el servidor no lo entiende) y luego transporta frames
+con request_id, de modo que muchas solicitudes en vuelo comparten pocos
+sockets y las respuestas pueden llegar en cualquier orden.
+"""
+
+import asyncio
+import logging
+from common.protocol import (
+    MUX_MAGIC, MUX_HEADER, HANDSHAKE_MAGIC, SUPPORTED_VERSIONS, DEFAULT_MAX_MESSAGE_SIZE,
+    build_hello, read_hello, encode_frame, decode_frame, read_frame
+)
+from common.serialization import available_codecs, get_codec, DEFAULT_CODEC
+
+logger = logging.getLogger(__name__)
+
+# Tiempo máximo de espera de la respuesta al handshake
+HANDSHAKE_TIMEOUT = 5
+
+# Tiempo máximo para abrir una conexión y negociar el protocolo
+CONNECT_TIMEOUT = 5
+
+class MultiplexedConnection:
+    """Conexión TCP única que atiende varias solicitudes concurrentes"""
+
+    def __init__(self, host: str, port: int, max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE,
+                 versions: tuple = SUPPORTED_VERSIONS, codecs: list = None):
+        self.host = host
+        self.port = port
+        self.max_message_size = max_message_size
+        self.versions = versions
+        self.codecs = codecs or available_codecs()
+        self.version = None
+        self.codec = None
+        self.peer_max_message_size = None
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._pending = {}
+        self._next_id = 0
+        self._write_lock = asyncio.Lock()
+        self.closed = True
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Cantidad de solicitudes esperando respuesta en esta conexión"""
+        return len(self._pending)
+
+    async def _open(self):
+        self._reader, self._writer = await asyncio.open_connection(
+            self.host,
+            self.port,
+            limit=2**16  # 64KB buffer
+        )
+
+    async def _handshake(self) -> dict:
+        """
+        Ofrece las versiones soportadas y devuelve la respuesta del servidor.
+
+        Raises:
+            ValueError: Si el servidor no responde con un handshake válido
+        """
+        self._writer.write(build_hello({
+            'versions': list(self.versions),
+            'codecs': list(self.codecs),
+            'max_message_size': self.max_message_size
+        }))
+        await self._writer.drain()
+        try:
+            magic = await asyncio.wait_for(self._reader.readexactly(4), HANDSHAKE_TIMEOUT)
+            if magic != HANDSHAKE_MAGIC:
+                raise ValueError("Respuesta de handshake inválida")
+            return await asyncio.wait_for(read_hello(self._reader), HANDSHAKE_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError) as e:
+            raise ValueError(f"Handshake no soportado: {e!r}")
+
+    async def connect(self):
+        """Abre el socket, negocia la versión y arranca el lector de respuestas"""
+        await self._open()
+        hello = None
+        if max(self.versions) > 1:
+            try:
+                hello = await self._handshake()
+            except ValueError as e:
+                # Servidor anterior al handshake: se reabre en la versión 1
+                logger.info(f"{self.host}:{self.port} no negocia versión, se usa la 1 ({e})")
+                self._writer.close()
+                await self._open()
+
+        if hello is None:
+            if 1 not in self.versions:
+                raise ConnectionError("El servidor de procesamiento no soporta la versión pedida")
+            self._writer.write(MUX_MAGIC)
+            await self._writer.drain()
+            self.version = 1
+        elif 'error' in hello:
+            self._writer.close()
+            raise ConnectionError(f"Handshake rechazado: {hello['error']}")
+        else:
+            self.version = hello['version']
+            self.codec = get_codec(hello.get('codec', DEFAULT_CODEC))
+            self.peer_max_message_size = hello.get('max_message_size')
+
+        self.closed = False
+        self._reader_task = asyncio.create_task(self._read_loop())
+        logger.info(
+            f"Conexión multiplexada abierta con {self.host}:{self.port} "
+            f"(versión {self.version}, codec {self.codec.name if self.codec else 'json'})"
+        )
+
+    def _allocate_id(self) -> int:
+        """Devuelve un request_id de 32 bits libre en esta conexión"""
+        while True:
+            self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+            if self._next_id not in self._pending:
+                return self._next_id
+
+    async def request(self, data: dict) -> dict:
+        """
+        Envía una solicitud y espera su respuesta
+
+        Raises:
+            ConnectionError: Si la conexión está cerrada o se cae
+            ValueError: Si la solicitud supera el límite anunciado por el servidor
+        """
+        if self.closed:
+            raise ConnectionError("Conexión con servidor de procesamiento cerrada")
+
+        request_id = self._allocate_id()
+        frame = encode_frame(data, request_id, self.version, self.codec)
+        if self.peer_max_message_size and len(frame) - MUX_HEADER.size > self.peer_max_message_size:
+            raise ValueError(f"Solicitud demasiado grande: {len(frame)} bytes")
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            async with self._write_lock:
+                self._writer.write(frame)
+                self.bytes_sent += len(frame)
+                await self._writer.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _read_loop(self):
+        """Despacha cada respuesta al future de su request_id"""
+        try:
+            while True:
+                request_id, payload = await read_frame(self._reader, self.max_message_size)
+                self.bytes_received += MUX_HEADER.size + len(payload)
+                future = self._pending.get(request_id)
+                if future is None or future.done():
+                    logger.warning(f"Respuesta para request_id desconocido: {request_id}")
+                    continue
+                try:
+                    future.set_result(decode_frame(payload, self.version, self.codec))
+                except Exception as e:
+                    future.set_exception(e)
+        except asyncio.CancelledError:
+            raise
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            logger.warning(f"Conexión con {self.host}:{self.port} cerrada: {e}")
+            self._fail_pending(ConnectionError("Conexión con servidor de procesamiento cerrada"))
+        except Exception as e:
+            logger.error(f"Error leyendo del servidor de procesamiento: {e}")
+            self._fail_pending(e)
+        finally:
+            self.closed = True
+
+    def _fail_pending(self, exc: Exception):
+        """Propaga un error a todas las solicitudes en vuelo"""
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(exc)
+
+    async def close(self):
+        """Cierra la conexión y cancela el lector"""
+        self.closed = True
+        if self._reader_task:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._fail_pending(ConnectionError("Conexión cerrada"))
+        if self._writer:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+
+class ProcessingConnectionPool:
+    """
+    Pool de conexiones multiplexadas de larga vida hacia el Servidor B.
+    Las conexiones se abren bajo demanda y se reabren si se caen.
+    """
+
+    def __init__(self, host: str, port: int, size: int = 4,
+                 max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE, codecs: list = None):
+        self.host = host
+        self.port = port
+        self.size = size
+        self.max_message_size = max_message_size
+        self.codecs = codecs
+        self._connections = [self._new_connection() for _ in range(size)]
+        self._connect_locks = [asyncio.Lock() for _ in range(size)]
+        self.requests = 0
+        self.connections_opened = 0
+        # Bytes de las conexiones ya reemplazadas
+        self._retired_sent = 0
+        self._retired_received = 0
+
+    def _new_connection(self) -> MultiplexedConnection:
+        return MultiplexedConnection(self.host, self.port, self.max_message_size, codecs=self.codecs)
+
+    @property
+    def in_flight(self) -> int:
+        """Solicitudes en vuelo sumando todas las conexiones"""
+        return sum(conn.in_flight for conn in self._connections)
+
+    @property
+    def bytes_sent(self) -> int:
+        return self._retired_sent + sum(conn.bytes_sent for conn in self._connections)
+
+    @property
+    def bytes_received(self) -> int:
+        return self._retired_received + sum(conn.bytes_received for conn in self._connections)
+
+    async def _acquire(self) -> MultiplexedConnection:
+        """Elige la conexión con menos solicitudes en vuelo, abriéndola si hace falta"""
+        index = min(
+            range(self.size),
+            key=lambda i: (self._connections[i].in_flight, self._connections[i].closed)
+        )
+        async with self._connect_locks[index]:
+            conn = self._connections[index]
+            if conn.closed:
+                await conn.close()
+                self._retired_sent += conn.bytes_sent
+                self._retired_received += conn.bytes_received
+                conn = self._new_connection()
+                # Se guarda antes de conectar: si falla, el próximo intento la reemplaza
+                self._connections[index] = conn
+                await asyncio.wait_for(conn.connect(), CONNECT_TIMEOUT)
+                self.connections_opened += 1
+            return conn
+
+    async def request(self, data: dict, timeout: float = None) -> dict:
+        """
+        Envía una solicitud por alguna de las conexiones del pool.
+
+        Args:
+            data: Diccionario a enviar
+            timeout: Timeout total en segundos para la respuesta
+
+        Raises:
+            asyncio.TimeoutError: Si no llega la respuesta a tiempo
+            ConnectionError: Si la conexión se cae antes de la respuesta
+        """
+        self.requests += 1
+        conn = await self._acquire()
+        return await asyncio.wait_for(conn.request(data), timeout=timeout)
+
+    def stats(self) -> dict:
+        """Estado del pool para el endpoint de estadísticas"""
+        return {
+            'connections': self.size,
+            'connections_open': sum(not conn.closed for conn in self._connections),
+            'connections_opened': self.connections_opened,
+            'requests': self.requests,
+            'in_flight': self.in_flight,
+            'protocol_versions': sorted({conn.version for conn in self._connections if not conn.closed}),
+            'codecs': sorted({conn.codec.name for conn in self._connections if not conn.closed and conn.codec})
+        }
+
+    async def close(self):
+        """Cierra todas las conexiones del pool"""
+        for conn in self._connections:
+            await conn.close()
@@ -0,0 +1,283 @@
+"""
+Métricas en formato de texto de Prometheus (versión 0.0.4), sin
+dependencias externas. Pensadas para quedar siempre activas: observar un
+valor es una búsqueda binaria y un par de sumas, y los gauges que reflejan
+estado ya existente (colas, conexiones) se leen recién al exportar, con
+callbacks, sin costo en el camino de cada solicitud.
+
+Uso:
+    registry = Registry()
+    stages = registry.histogram('tp2_stage_duration_seconds', 'Duración por etapa', ['stage'])
+    with stages.labels('fetch_html').time():
+        ...
+    registry.gauge_callback('tp2_in_flight', 'Solicitudes en curso', lambda: server.in_flight)
+    text = registry.render()
+"""
+
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Límites de los buckets por defecto, en segundos: de 5ms a 1 minuto
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Tamaño máximo de la solicitud HTTP que acepta serve_metrics
+MAX_REQUEST_SIZE = 8192
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names: tuple, values: tuple, extra: str = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Timer:
+    """Context manager que observa la duración del bloque"""
+    __slots__ = ('_child', '_start')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._child.observe(time.perf_counter() - self._start)
+
+class _Value:
+    """Valor de un counter o gauge para una combinación de labels"""
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+class _Buckets:
+    """Histograma para una combinación de labels"""
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds: tuple):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+class Metric:
+    """
+    Métrica con nombre, ayuda y labels opcionales. labels(*valores)
+    devuelve (y guarda) el hijo de esa combinación; conviene conservar la
+    referencia en el código caliente para no buscarla cada vez.
+    """
+    type = None
+
+    def __init__(self, name: str, help: str, label_names=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._children = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """
+        Raises:
+            ValueError: Si la cantidad de valores no coincide con los labels
+        """
+        if len(values) != len(self.label_names):
+            raise ValueError(f"{self.name} espera los labels {self.label_names}")
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _samples(self):
+        """Genera (sufijo, labels, valor) de cada muestra"""
+        for values, child in list(self._children.items()):
+            yield '', _labels(self.label_names, values), child.value
+
+    def render(self) -> list:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        for suffix, labels, value in self._samples():
+            lines.append(f'{self.name}{suffix}{labels} {_format_value(value)}')
+        return lines
+
+class Counter(Metric):
+    """Contador que solo crece"""
+    type = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        """Incrementa el contador sin labels"""
+        self.labels().inc(amount)
+
+class Gauge(Metric):
+    """Valor que sube y baja"""
+    type = 'gauge'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+class Histogram(Metric):
+    """Histograma acumulativo con buckets fijos"""
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, label_names=(), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), list(child.counts)):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield '_bucket', _labels(self.label_names, values, le), cumulative
+            labels = _labels(self.label_names, values)
+            yield '_sum', labels, child.sum
+            yield '_count', labels, child.count
+
+class CallbackMetric(Metric):
+    """
+    Counter o gauge cuyo valor se lee de un callback al exportar. El
+    callback devuelve un número, o un dict {tupla de valores de labels: número}.
+    """
+
+    def __init__(self, name: str, help: str, callback, label_names=(), type: str = 'gauge'):
+        super().__init__(name, help, label_names)
+        self.callback = callback
+        self.type = type
+
+    def _samples(self):
+        try:
+            values = self.callback()
+        except Exception as e:
+            logger.error(f"Error leyendo la métrica {self.name}: {e}")
+            return
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            if not isinstance(label_values, tuple):
+                label_values = (label_values,)
+            yield '', _labels(self.label_names, label_values), value
+
+class Registry:
+    """Conjunto de métricas de un servidor"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Raises:
+            ValueError: Si ya hay una métrica con ese nombre
+        """
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, label_names=()) -> Counter:
+        return self.register(Counter(name, help, label_names))
+
+    def gauge(self, name: str, help: str, label_names=()) -> Gauge:
+        return self.register(Gauge(name, help, label_names))
+
+    def histogram(self, name: str, help: str, label_names=(),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, label_names, buckets))
+
+    def gauge_callback(self, name: str, help: str, callback, label_names=()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, callback, label_names, 'gauge'))
+
+    def counter_callback(self, name: str, help: str, callback, label_names=()) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help, callback, label_names, 'counter'))
+
+    def get(self, name: str) -> Metric:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Todas las métricas en formato de texto de Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+async def serve_metrics(registry: Registry, host: str, port: int) -> asyncio.AbstractServer:
+    """
+    Servidor HTTP mínimo en el event loop que responde cualquier GET con
+    las métricas del registry, para procesos que no usan aiohttp.web.
+
+    Returns:
+        El asyncio.Server escuchando en host:port
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), 5)
+            if not head.startswith(b'GET '):
+                status, body = '405 Method Not Allowed', b''
+            else:
+                status, body = '200 OK', registry.render().encode('utf-8')
+            writer.write(
+                f'HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n'
+                f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('ascii') + body
+            )
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port, limit=MAX_REQUEST_SIZE)
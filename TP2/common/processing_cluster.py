@@ -0,0 +1,461 @@
+"""
+Enlace del Servidor A con uno o varios Servidores B.
+Cada endpoint tiene su pool de conexiones multiplexadas y un circuit
+breaker: tras varias fallas seguidas el endpoint deja de recibir
+solicitudes por un rato y después se prueba con una sola solicitud
+(half-open). Las solicitudes se reparten por hashing consistente de la URL
+(o al endpoint con menos solicitudes en vuelo), los endpoints que no pasan
+el health check salen del reparto y, opcionalmente, las solicitudes se
+duplican en otro endpoint si la respuesta tarda más que el p95 de las
+anteriores (hedging).
+"""
+
+import time
+import bisect
+import asyncio
+import hashlib
+import logging
+from collections import deque
+from common.connection_pool import ProcessingConnectionPool
+from common.protocol import DEFAULT_MAX_MESSAGE_SIZE
+from common.urls import normalize_url
+
+logger = logging.getLogger(__name__)
+
+# Estados del circuit breaker
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Fallas seguidas que abren el circuito
+FAILURE_THRESHOLD = 5
+
+# Segundos que el circuito queda abierto antes de la solicitud de prueba
+RESET_TIMEOUT = 10
+
+# Latencias recientes que se usan para estimar el p95
+LATENCY_WINDOW = 200
+
+# Muestras mínimas antes de empezar a duplicar solicitudes
+HEDGE_MIN_SAMPLES = 20
+
+# Errores del enlace que cuentan como falla del endpoint
+LINK_ERRORS = (ConnectionError, OSError, asyncio.TimeoutError)
+
+# Modos de reparto entre endpoints
+HASH = 'hash'
+LEAST_LOADED = 'least-loaded'
+BALANCE_MODES = (HASH, LEAST_LOADED)
+
+# Puntos de cada endpoint en el anillo de hashing consistente
+HASH_REPLICAS = 100
+
+# Segundos entre health checks y timeout de cada uno
+HEALTH_INTERVAL = 5
+HEALTH_TIMEOUT = 2
+
+class CircuitOpen(ConnectionError):
+    """Circuito abierto: la solicitud no se envía al Servidor B"""
+
+class CircuitBreaker:
+    """
+    Circuit breaker de un endpoint.
+
+    - closed: pasan todas las solicitudes; failure_threshold fallas
+      seguidas abren el circuito.
+    - open: no pasa ninguna hasta que vence reset_timeout.
+    - half_open: pasa una única solicitud de prueba; si responde se
+      cierra el circuito y si falla se vuelve a abrir.
+    """
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self.trips = 0
+
+    @property
+    def available(self) -> bool:
+        """True si una solicitud nueva puede pasar (sin reservar la prueba)"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at >= self.reset_timeout
+        return not self._probing
+
+    def begin(self) -> bool:
+        """
+        Registra el inicio de una solicitud. Con el circuito abierto y el
+        tiempo de espera vencido pasa a half-open y reserva la prueba.
+
+        Returns:
+            False si la solicitud no puede pasar
+        """
+        if not self.available:
+            return False
+        if self.state != CLOSED:
+            self.state = HALF_OPEN
+            self._probing = True
+        return True
+
+    def success(self):
+        if self.state != CLOSED:
+            logger.info("Circuito cerrado: el Servidor B volvió a responder")
+        self.state = CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.trips += 1
+                logger.warning(f"Circuito abierto tras {self.failures} fallas seguidas")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Termina una solicitud sin resultado que cuente (cancelada o inválida)"""
+        self._probing = False
+
+    def stats(self) -> dict:
+        return {'state': self.state, 'failures': self.failures, 'trips': self.trips}
+
+class LatencyTracker:
+    """Ventana de latencias recientes para estimar percentiles"""
+
+    def __init__(self, size: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float:
+        """Percentil p (0-100) de la ventana, o None si está vacía"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+class ProcessingEndpoint:
+    """Un Servidor B: su pool de conexiones, su circuit breaker y su estado de salud"""
+
+    def __init__(self, host: str, port: int, pool: ProcessingConnectionPool,
+                 breaker: CircuitBreaker):
+        self.host = host
+        self.port = port
+        self.pool = pool
+        self.breaker = breaker
+        self.healthy = True
+
+    @property
+    def address(self) -> str:
+        return f'[{self.host}]:{self.port}' if ':' in self.host else f'{self.host}:{self.port}'
+
+    def stats(self) -> dict:
+        return {'address': self.address, 'healthy': self.healthy,
+                'circuit': self.breaker.stats(), **self.pool.stats()}
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+class HashRing:
+    """
+    Anillo de hashing consistente. Cada nodo ocupa replicas puntos del
+    anillo, así que al sacar un nodo solo sus claves pasan a otros nodos
+    (repartidas entre todos) y el resto conserva su asignación.
+    """
+
+    def __init__(self, nodes: list, key=str, replicas: int = HASH_REPLICAS):
+        """
+        Args:
+            nodes: Nodos del anillo
+            key: Función que da el nombre estable de un nodo
+            replicas: Puntos por nodo
+        """
+        points = sorted(
+            (_hash(f'{key(node)}#{i}'), index)
+            for index, node in enumerate(nodes) for i in range(replicas)
+        )
+        self._nodes = list(nodes)
+        self._hashes = [point for point, _ in points]
+        self._owners = [index for _, index in points]
+
+    def preference(self, key: str) -> list:
+        """Nodos distintos en el orden del anillo a partir de la clave"""
+        start = bisect.bisect(self._hashes, _hash(key))
+        order = []
+        seen = set()
+        for i in range(len(self._owners)):
+            index = self._owners[(start + i) % len(self._owners)]
+            if index not in seen:
+                seen.add(index)
+                order.append(self._nodes[index])
+                if len(order) == len(self._nodes):
+                    break
+        return order
+
+def parse_endpoints(value: str) -> list:
+    """
+    Parsea una lista 'host:puerto,host:puerto' (IPv6 entre corchetes).
+
+    Raises:
+        ValueError: Si algún elemento no tiene puerto numérico
+    """
+    endpoints = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, sep, port = item.rpartition(':')
+        if not sep or not port.isdigit():
+            raise ValueError(f"Endpoint inválido (se espera host:puerto): {item}")
+        endpoints.append((host.strip('[]') or 'localhost', int(port)))
+    return endpoints
+
+class ProcessingCluster:
+    """
+    Solicitudes al Servidor B repartidas entre varios endpoints, con la
+    misma interfaz que ProcessingConnectionPool (request, stats, close).
+
+    - Con balance='hash' cada URL va siempre al mismo endpoint, elegido
+      por hashing consistente de la URL normalizada (la misma clave que
+      la cache de resultados), así las caches de cada Servidor B (por
+      ejemplo la de thumbnails) se mantienen calientes. Con
+      balance='least-loaded' va al endpoint con menos solicitudes en vuelo.
+    - Un health check periódico ({"action": "stats"}) saca del reparto a
+      los endpoints que no responden: sus URLs pasan al siguiente endpoint
+      del anillo y vuelven cuando se recupera.
+    - Con todos los circuitos abiertos falla enseguida con CircuitOpen,
+      sin esperar un intento de conexión ni un timeout.
+    - Si la conexión con el endpoint elegido falla, la solicitud se
+      reintenta una vez en el siguiente endpoint disponible (las tareas
+      del Servidor B se pueden repetir sin efectos secundarios).
+    - Con hedge=True, si la respuesta tarda más que el p95 de las últimas
+      latencias se envía un duplicado a otro endpoint (o al mismo si es el
+      único) y se usa la primera respuesta. El Servidor B no cancela la
+      copia perdedora: el hedging cambia carga extra por menor latencia de cola.
+    """
+
+    def __init__(self, endpoints: list, size: int = 4,
+                 max_message_size: int = DEFAULT_MAX_MESSAGE_SIZE, codecs: list = None,
+                 failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT, hedge: bool = False,
+                 balance: str = HASH, health_interval: float = HEALTH_INTERVAL):
+        """
+        Args:
+            endpoints: Lista de (host, puerto) de los Servidores B
+            size: Conexiones persistentes por endpoint
+            max_message_size: Tamaño máximo de una respuesta
+            codecs: Codecs a ofrecer en el handshake
+            failure_threshold: Fallas seguidas que abren el circuito de un endpoint
+            reset_timeout: Segundos de circuito abierto antes de probar de nuevo
+            hedge: Duplicar las solicitudes lentas (más que el p95)
+            balance: Reparto entre endpoints: 'hash' o 'least-loaded'
+            health_interval: Segundos entre health checks; 0 los desactiva
+
+        Raises:
+            ValueError: Si no hay endpoints o el modo de reparto no existe
+        """
+        if not endpoints:
+            raise ValueError("Se requiere al menos un servidor de procesamiento")
+        if balance not in BALANCE_MODES:
+            raise ValueError(f"Modo de reparto desconocido: {balance}")
+        self.endpoints = [
+            ProcessingEndpoint(
+                host, port,
+                ProcessingConnectionPool(host, port, size=size,
+                                         max_message_size=max_message_size, codecs=codecs),
+                CircuitBreaker(failure_threshold, reset_timeout)
+            )
+            for host, port in endpoints
+        ]
+        self.ring = HashRing(self.endpoints, key=lambda endpoint: endpoint.address)
+        self.balance = balance
+        self.health_interval = health_interval
+        self._health_task = None
+        self.hedge = hedge
+        self.latency = LatencyTracker()
+        self.requests = 0
+        self.short_circuited = 0
+        self.rerouted = 0
+        self.failovers = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @property
+    def in_flight(self) -> int:
+        return sum(endpoint.pool.in_flight for endpoint in self.endpoints)
+
+    def _order(self, data: dict) -> list:
+        """Endpoints en orden de preferencia para la solicitud"""
+        if self.balance == HASH and data.get('url'):
+            return self.ring.preference(normalize_url(str(data['url'])))
+        return sorted(self.endpoints, key=lambda endpoint: endpoint.pool.in_flight)
+
+    def _pick(self, data: dict, exclude: ProcessingEndpoint = None) -> ProcessingEndpoint:
+        """
+        Primer endpoint disponible en el orden de preferencia, o None.
+        Si ninguno pasa el health check se ignora la salud y decide solo
+        el circuit breaker, para no degradar todo por un health check.
+        """
+        candidates = [endpoint for endpoint in self._order(data)
+                      if endpoint is not exclude and endpoint.breaker.available]
+        healthy = [endpoint for endpoint in candidates if endpoint.healthy]
+        candidates = healthy or candidates
+        return candidates[0] if candidates else None
+
+    def hedge_delay(self) -> float:
+        """Espera antes de duplicar una solicitud, o None si no se duplica"""
+        if not self.hedge or len(self.latency) < HEDGE_MIN_SAMPLES:
+            return None
+        return self.latency.percentile(95)
+
+    async def _attempt(self, endpoint: ProcessingEndpoint, data: dict, timeout: float) -> dict:
+        """Envía la solicitud a un endpoint y actualiza su breaker"""
+        if not endpoint.breaker.begin():
+            raise CircuitOpen(f"Circuito abierto para {endpoint.address}")
+        start = time.perf_counter()
+        try:
+            response = await endpoint.pool.request(data, timeout=timeout)
+        except LINK_ERRORS as e:
+            endpoint.breaker.failure()
+            logger.warning(f"Falla con el Servidor B {endpoint.address}: {e!r}")
+            raise
+        except BaseException:
+            endpoint.breaker.release()
+            raise
+        endpoint.breaker.success()
+        self.latency.record(time.perf_counter() - start)
+        return response
+
+    async def request(self, data: dict, timeout: float = None) -> dict:
+        """
+        Envía una solicitud al Servidor B que le corresponde.
+
+        Raises:
+            CircuitOpen: Si todos los circuitos están abiertos
+            asyncio.TimeoutError: Si no llega la respuesta a tiempo
+            ConnectionError: Si la conexión se cae antes de la respuesta
+        """
+        self.requests += 1
+        primary = self._pick(data)
+        if primary is None:
+            self.short_circuited += 1
+            raise CircuitOpen("Servidor de procesamiento no disponible (circuito abierto)")
+        if self.balance == HASH and data.get('url') and primary is not self._order(data)[0]:
+            self.rerouted += 1
+
+        try:
+            delay = self.hedge_delay()
+            if delay is None or (timeout is not None and delay >= timeout):
+                return await self._attempt(primary, data, timeout)
+            return await self._hedged(primary, data, timeout, delay)
+        except ConnectionError:
+            fallback = self._pick(data, exclude=primary)
+            if fallback is None:
+                raise
+            self.failovers += 1
+            logger.info(f"Reintentando en el Servidor B {fallback.address}")
+            return await self._attempt(fallback, data, timeout)
+
+    async def _hedged(self, primary: ProcessingEndpoint, data: dict, timeout: float,
+                      delay: float) -> dict:
+        """Envía la solicitud y, si no responde en delay segundos, un duplicado"""
+        started = time.perf_counter()
+        first = asyncio.ensure_future(self._attempt(primary, data, timeout))
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                backup = self._pick(data, exclude=primary) or (primary if primary.breaker.available else None)
+                if backup is not None:
+                    self.hedged += 1
+                    remaining = None if timeout is None else timeout - (time.perf_counter() - started)
+                    tasks.add(asyncio.ensure_future(self._attempt(backup, data, remaining)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        """Estado de cada endpoint y contadores de circuito y hedging"""
+        p95 = self.latency.percentile(95)
+        return {
+            'endpoints': [endpoint.stats() for endpoint in self.endpoints],
+            'balance': self.balance,
+            'requests': self.requests,
+            'in_flight': self.in_flight,
+            'short_circuited': self.short_circuited,
+            'rerouted': self.rerouted,
+            'failovers': self.failovers,
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'latency_p95_ms': round(p95 * 1000, 1) if p95 is not None else None
+        }
+
+    def start(self):
+        """Arranca el health check periódico (requiere un event loop en curso)"""
+        if self.health_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.ensure_future(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            try:
+                await self.check_health()
+            except Exception as e:
+                # Un error inesperado no puede cortar el health check para siempre
+                logger.error(f"Error en el health check de los Servidores B: {e!r}")
+            await asyncio.sleep(self.health_interval)
+
+    async def check_health(self):
+        """Consulta a todos los endpoints y actualiza su estado de salud"""
+        await asyncio.gather(*(self._check(endpoint) for endpoint in self.endpoints))
+
+    async def _check(self, endpoint: ProcessingEndpoint):
+        """
+        Un endpoint está sano si responde un dict a {'action': 'stats'};
+        cualquier error, incluida una respuesta ilegible, lo saca del reparto.
+        """
+        try:
+            reply = await endpoint.pool.request({'action': 'stats'}, timeout=HEALTH_TIMEOUT)
+            if not isinstance(reply, dict):
+                raise ValueError(f"Respuesta de stats inválida: {reply!r:.100}")
+            healthy = True
+        except Exception as e:
+            healthy = False
+            error = e
+        if healthy != endpoint.healthy:
+            if healthy:
+                logger.info(f"Servidor B {endpoint.address} vuelve al reparto")
+            else:
+                logger.warning(f"Servidor B {endpoint.address} sale del reparto: {error!r}")
+        endpoint.healthy = healthy
+
+    async def close(self):
+        """Detiene el health check y cierra los pools de todos los endpoints"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        for endpoint in self.endpoints:
+            await endpoint.pool.close()
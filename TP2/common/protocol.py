@@ -1,11 +1,188 @@
+import json
 import struct
-from common.serialization import to_json, from_json
+from common.serialization import to_json, from_json, get_codec, DEFAULT_CODEC
 
-def build_message(data: dict) -> bytes:
+# Preámbulo que abre una conexión multiplexada. Leído como longitud legacy
+# equivale a ~1.4GB, por encima de cualquier límite de mensaje, así que un
+# servidor puede distinguir ambos modos con los primeros 4 bytes.
+MUX_MAGIC = b'TP2M'
+
+# Preámbulo del handshake con negociación de versión. Un servidor viejo lo
+# lee como una longitud enorme y cierra la conexión, y el cliente vuelve a
+# MUX_MAGIC (versión 1).
+HANDSHAKE_MAGIC = b'TP2H'
+
+# Versiones del framing multiplexado:
+#   1: payload JSON (binarios en base64)
+#   2: metadata + adjuntos binarios crudos referenciados por índice; la
+#      metadata usa el codec negociado (json, msgpack o struct)
+SUPPORTED_VERSIONS = (1, 2)
+PROTOCOL_VERSION = max(SUPPORTED_VERSIONS)
+
+# Tamaño máximo por defecto de un mensaje
+DEFAULT_MAX_MESSAGE_SIZE = 10 * 1024 * 1024
+
+# Tamaño máximo del mensaje de handshake
+MAX_HELLO_SIZE = 64 * 1024
+
+# Clave con la que la metadata referencia un adjunto: {"$att": índice}
+ATTACHMENT_REF = '$att'
+
+LENGTH_HEADER = struct.Struct('!I')   # longitud
+MUX_HEADER = struct.Struct('!II')     # longitud, request_id
+BINARY_HEADER = struct.Struct('!IH')  # longitud de la metadata, cantidad de adjuntos
+
+def build_message(data: dict, request_id: int = None) -> bytes:
+    """
+    Serializa un mensaje con prefijo de longitud.
+    Si se indica request_id se usa el framing multiplexado
+    (longitud + request_id), que permite respuestas fuera de orden.
+    """
     payload = to_json(data).encode('utf-8')
-    length = struct.pack('!I', len(payload))
-    return length + payload
+    if request_id is None:
+        return LENGTH_HEADER.pack(len(payload)) + payload
+    return MUX_HEADER.pack(len(payload), request_id) + payload
 
 def parse_message(data: bytes) -> dict:
     # data should be the full payload (after reading length)
     return from_json(data.decode('utf-8'))
+
+def _extract_attachments(obj, attachments: list):
+    """Reemplaza los valores binarios por referencias y los junta en attachments"""
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        attachments.append(obj)
+        return {ATTACHMENT_REF: len(attachments) - 1}
+    if isinstance(obj, dict):
+        return {key: _extract_attachments(value, attachments) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_extract_attachments(value, attachments) for value in obj]
+    return obj
+
+def _resolve_attachments(obj, attachments: list):
+    """Reemplaza las referencias {"$att": i} por los bytes del adjunto i"""
+    if isinstance(obj, dict):
+        if len(obj) == 1 and ATTACHMENT_REF in obj:
+            return attachments[obj[ATTACHMENT_REF]]
+        return {key: _resolve_attachments(value, attachments) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [_resolve_attachments(value, attachments) for value in obj]
+    return obj
+
+def build_binary_message(data: dict, request_id: int, codec=None) -> bytes:
+    """
+    Serializa un frame de la versión 2:
+
+        longitud (4B) | request_id (4B) | meta_len (4B) | n (2B) |
+        len_0 ... len_n-1 (4B c/u) | metadata | adjunto_0 ... adjunto_n-1
+
+    Con un codec de texto (json) los valores bytes de data viajan crudos
+    como adjuntos, sin base64. Los codecs binarios los codifican en la
+    metadata y el frame no lleva adjuntos.
+    """
+    codec = codec or get_codec(DEFAULT_CODEC)
+    attachments = []
+    if codec.binary:
+        meta = codec.encode(data)
+    else:
+        meta = codec.encode(_extract_attachments(data, attachments))
+    lengths = struct.pack(f'!{len(attachments)}I', *(len(a) for a in attachments))
+    body_length = BINARY_HEADER.size + len(lengths) + len(meta) + sum(len(a) for a in attachments)
+    return b''.join([
+        MUX_HEADER.pack(body_length, request_id),
+        BINARY_HEADER.pack(len(meta), len(attachments)),
+        lengths,
+        meta,
+        *attachments
+    ])
+
+def parse_binary_message(data: bytes, codec=None) -> dict:
+    """
+    Deserializa el cuerpo de un frame de la versión 2 (después de longitud y request_id).
+
+    Raises:
+        ValueError: Si el frame está truncado o es inconsistente
+    """
+    try:
+        meta_length, count = BINARY_HEADER.unpack_from(data)
+        offset = BINARY_HEADER.size
+        lengths = struct.unpack_from(f'!{count}I', data, offset)
+    except struct.error as e:
+        raise ValueError(f"Frame binario inválido: {e}")
+    offset += 4 * count
+    if offset + meta_length + sum(lengths) != len(data):
+        raise ValueError("Frame binario inválido: longitudes inconsistentes")
+
+    view = memoryview(data)
+    meta = view[offset:offset + meta_length]
+    offset += meta_length
+    attachments = []
+    for length in lengths:
+        attachments.append(bytes(view[offset:offset + length]))
+        offset += length
+    codec = codec or get_codec(DEFAULT_CODEC)
+    data = codec.decode(bytes(meta))
+    if not attachments:
+        return data
+    try:
+        return _resolve_attachments(data, attachments)
+    except IndexError:
+        raise ValueError("Frame binario inválido: referencia a adjunto inexistente")
+
+def encode_frame(data: dict, request_id: int, version: int = PROTOCOL_VERSION, codec=None) -> bytes:
+    """Serializa un frame multiplexado según la versión y el codec negociados"""
+    if version >= 2:
+        return build_binary_message(data, request_id, codec)
+    return build_message(data, request_id)
+
+def decode_frame(payload: bytes, version: int = PROTOCOL_VERSION, codec=None) -> dict:
+    """
+    Deserializa el payload de un frame multiplexado según la versión y el codec negociados
+
+    Raises:
+        ValueError: Si el payload no es válido
+    """
+    if version >= 2:
+        return parse_binary_message(payload, codec)
+    return parse_message(payload)
+
+def build_hello(fields: dict) -> bytes:
+    """Mensaje de handshake: HANDSHAKE_MAGIC + longitud + JSON"""
+    payload = json.dumps(fields).encode('utf-8')
+    return HANDSHAKE_MAGIC + LENGTH_HEADER.pack(len(payload)) + payload
+
+def negotiate_version(offered) -> int:
+    """Devuelve la versión más alta ofrecida que también se soporta, o None"""
+    common = set(offered or ()) & set(SUPPORTED_VERSIONS)
+    return max(common) if common else None
+
+async def read_hello(reader) -> dict:
+    """
+    Lee el cuerpo de un handshake (después de HANDSHAKE_MAGIC).
+
+    Raises:
+        asyncio.IncompleteReadError: Si la conexión se cierra a mitad
+        ValueError: Si el mensaje es demasiado grande o no es JSON
+    """
+    length = LENGTH_HEADER.unpack(await reader.readexactly(LENGTH_HEADER.size))[0]
+    if length > MAX_HELLO_SIZE:
+        raise ValueError(f"Handshake demasiado grande: {length} bytes")
+    return parse_message(await reader.readexactly(length))
+
+async def read_frame(reader, max_size: int = None) -> tuple:
+    """
+    Lee un frame multiplexado desde un asyncio.StreamReader.
+    El límite se verifica con el header, antes de leer el cuerpo.
+
+    Returns:
+        Tupla (request_id, payload_bytes)
+
+    Raises:
+        asyncio.IncompleteReadError: Si la conexión se cierra a mitad de frame
+        ValueError: Si el frame supera max_size
+    """
+    header = await reader.readexactly(MUX_HEADER.size)
+    length, request_id = MUX_HEADER.unpack(header)
+    if max_size is not None and length > max_size:
+        raise ValueError(f"Mensaje demasiado grande: {length} bytes")
+    payload = await reader.readexactly(length)
+    return request_id, payload
@@ -1,8 +1,35 @@
+"""
+Serialización de mensajes.
+
+Los codecs que pueden viajar por la red entre el Servidor A y el Servidor B
+se registran en CODECS y se eligen por conexión durante el handshake:
+
+- json: stdlib, siempre disponible; los binarios viajan en base64.
+- msgpack: opcional (pip install msgpack); binarios nativos.
+- struct: stdlib, formato binario compacto con tipos etiquetados.
+
+pickle no se registra como codec: deserializar pickle de la red permite
+ejecutar código arbitrario. to_pickle/from_pickle quedan para uso local.
+"""
+
 import json
+import base64
 import pickle
+import struct
+
+try:
+    import msgpack
+except ImportError:  # msgpack es opcional
+    msgpack = None
+
+def _encode_binary(value):
+    """Los valores binarios viajan en JSON como base64"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(value).decode('ascii')
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
 
 def to_json(data: dict) -> str:
-    return json.dumps(data)
+    return json.dumps(data, default=_encode_binary)
 
 def from_json(data: str) -> dict:
     return json.loads(data)
@@ -12,3 +39,210 @@ def to_pickle(data: dict) -> bytes:
 
 def from_pickle(data: bytes) -> dict:
     return pickle.loads(data)
+
+class Codec:
+    """
+    Codec de mensajes.
+
+    Atributos:
+        name: Nombre con el que se negocia en el handshake
+        binary: True si codifica bytes de forma nativa (sin base64)
+    """
+    name = None
+    binary = False
+
+    def encode(self, data) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: bytes):
+        """
+        Raises:
+            ValueError: Si los datos no son válidos para el codec
+        """
+        raise NotImplementedError
+
+class JsonCodec(Codec):
+    name = 'json'
+
+    def encode(self, data) -> bytes:
+        return to_json(data).encode('utf-8')
+
+    def decode(self, data: bytes):
+        return json.loads(data)
+
+class MsgpackCodec(Codec):
+    name = 'msgpack'
+    binary = True
+
+    def encode(self, data) -> bytes:
+        return msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, data: bytes):
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except (msgpack.UnpackException, msgpack.ExtraData) as e:
+            raise ValueError(f"msgpack inválido: {e}")
+
+_U8 = struct.Struct('!B')
+_U32 = struct.Struct('!I')
+_I32 = struct.Struct('!i')
+_I64 = struct.Struct('!q')
+_F64 = struct.Struct('!d')
+
+class StructCodec(Codec):
+    """
+    Codec binario compacto solo con la stdlib. Cada valor lleva una etiqueta
+    de un byte; enteros y strings chicos usan longitudes de un byte.
+
+        N None  T True  F False
+        b int 0..255 (1B)  i int32  q int64  L int grande (texto)
+        d float64
+        s str <256 bytes (1B long.)  S str (4B long.)  y bytes (4B long.)
+        l lista (4B cantidad)  m dict (4B cantidad, clave y valor alternados)
+    """
+    name = 'struct'
+    binary = True
+
+    def encode(self, data) -> bytes:
+        out = bytearray()
+        self._encode(data, out)
+        return bytes(out)
+
+    def _encode(self, value, out: bytearray):
+        if value is None:
+            out += b'N'
+        elif value is True:
+            out += b'T'
+        elif value is False:
+            out += b'F'
+        elif isinstance(value, int):
+            if 0 <= value < 256:
+                out += b'b' + _U8.pack(value)
+            elif -2**31 <= value < 2**31:
+                out += b'i' + _I32.pack(value)
+            elif -2**63 <= value < 2**63:
+                out += b'q' + _I64.pack(value)
+            else:
+                text = str(value).encode('ascii')
+                out += b'L' + _U32.pack(len(text)) + text
+        elif isinstance(value, float):
+            out += b'd' + _F64.pack(value)
+        elif isinstance(value, str):
+            text = value.encode('utf-8')
+            if len(text) < 256:
+                out += b's' + _U8.pack(len(text))
+            else:
+                out += b'S' + _U32.pack(len(text))
+            out += text
+        elif isinstance(value, (bytes, bytearray, memoryview)):
+            out += b'y' + _U32.pack(len(value))
+            out += value
+        elif isinstance(value, (list, tuple)):
+            out += b'l' + _U32.pack(len(value))
+            for item in value:
+                self._encode(item, out)
+        elif isinstance(value, dict):
+            out += b'm' + _U32.pack(len(value))
+            for key, item in value.items():
+                self._encode(key, out)
+                self._encode(item, out)
+        else:
+            raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+    def decode(self, data: bytes):
+        data = bytes(data)
+        try:
+            value, offset = self._decode(data, 0)
+        except (IndexError, TypeError, struct.error, UnicodeDecodeError, RecursionError) as e:
+            # TypeError: clave de dict no hasheable (lista o dict)
+            raise ValueError(f"struct inválido: {e}")
+        if offset != len(data):
+            raise ValueError("struct inválido: bytes sobrantes")
+        return value
+
+    def _decode(self, data: bytes, offset: int) -> tuple:
+        tag = data[offset]
+        offset += 1
+        if tag == 0x73:  # s
+            length = data[offset]
+            end = offset + 1 + length
+            return data[offset + 1:end].decode('utf-8'), end
+        if tag == 0x62:  # b
+            return data[offset], offset + 1
+        if tag == 0x6d:  # m
+            count = _U32.unpack_from(data, offset)[0]
+            offset += 4
+            result = {}
+            for _ in range(count):
+                key, offset = self._decode(data, offset)
+                result[key], offset = self._decode(data, offset)
+            return result, offset
+        if tag == 0x6c:  # l
+            count = _U32.unpack_from(data, offset)[0]
+            offset += 4
+            result = []
+            for _ in range(count):
+                item, offset = self._decode(data, offset)
+                result.append(item)
+            return result, offset
+        if tag == 0x4e:  # N
+            return None, offset
+        if tag == 0x54:  # T
+            return True, offset
+        if tag == 0x46:  # F
+            return False, offset
+        if tag == 0x69:  # i
+            return _I32.unpack_from(data, offset)[0], offset + 4
+        if tag == 0x71:  # q
+            return _I64.unpack_from(data, offset)[0], offset + 8
+        if tag == 0x64:  # d
+            return _F64.unpack_from(data, offset)[0], offset + 8
+        if tag in (0x53, 0x79, 0x4c):  # S, y, L
+            length = _U32.unpack_from(data, offset)[0]
+            start = offset + 4
+            end = start + length
+            if end > len(data):
+                raise IndexError("longitud fuera de rango")
+            chunk = data[start:end]
+            if tag == 0x79:
+                return bytes(chunk), end
+            text = bytes(chunk).decode('utf-8')
+            return (int(text) if tag == 0x4c else text), end
+        raise ValueError(f"etiqueta desconocida: {tag:#x}")
+
+# Codecs disponibles por nombre, en orden de preferencia para la negociación
+CODECS = {}
+
+def register_codec(codec: Codec):
+    """Registra un codec para que pueda negociarse en el handshake"""
+    CODECS[codec.name] = codec
+
+if msgpack is not None:
+    register_codec(MsgpackCodec())
+register_codec(JsonCodec())
+register_codec(StructCodec())
+
+DEFAULT_CODEC = 'json'
+
+def available_codecs() -> list:
+    """Nombres de los codecs registrados, en orden de preferencia"""
+    return list(CODECS)
+
+def get_codec(name: str) -> Codec:
+    """
+    Devuelve el codec registrado con ese nombre
+
+    Raises:
+        ValueError: Si el codec no existe o no está instalado
+    """
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"Codec no disponible: {name}")
+
+def negotiate_codec(offered) -> str:
+    """Primer codec ofrecido por el cliente que también está registrado, o None"""
+    for name in offered or ():
+        if name in CODECS:
+            return name
+    return None
@@ -0,0 +1,191 @@
+"""
+Trazas de punta a punta de un scrape a través de ambos servidores.
+
+El Servidor A genera el trace ID y lo envía en el campo 'trace_id' de la
+solicitud al Servidor B, que devuelve los spans de sus tareas (espera en
+la cola del pool y ejecución en el worker) en el campo 'timings' de la
+respuesta. Los instantes son segundos desde epoch (time.time()) para poder
+juntar los spans de ambos hosts; si los relojes no están sincronizados los
+spans del Servidor B quedan corridos.
+
+Las trazas terminadas se pueden devolver al cliente (Trace.timings()) y
+escribir en formato Trace Event de Chrome (TraceWriter), que abren
+chrome://tracing, Perfetto y speedscope.
+
+Uso:
+    trace = Trace()
+    with trace.span('fetch_html'):
+        ...
+    trace.extend(response.pop('timings', []), server=SERVER_B)
+    trace.finish()
+"""
+
+import json
+import time
+import uuid
+import logging
+import itertools
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+SERVER_A = 'A'
+SERVER_B = 'B'
+
+# pid y nombre de cada servidor en el archivo de trazas
+TRACE_PROCESSES = {
+    SERVER_A: (1, 'Servidor A (scraping)'),
+    SERVER_B: (2, 'Servidor B (procesamiento)')
+}
+
+# Carril por defecto de los spans; los que corren en paralelo usan uno propio
+MAIN_LANE = 'main'
+
+# Largo máximo de un trace ID recibido por el protocolo
+MAX_TRACE_ID_LENGTH = 64
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+def make_span(name: str, start: float, end: float, lane: str = None) -> dict:
+    """Span serializable para el protocolo: instantes en segundos desde epoch"""
+    span = {'name': name, 'start': start, 'end': end}
+    if lane:
+        span['lane'] = lane
+    return span
+
+def traced_task(trace_id: str, func, *args) -> tuple:
+    """
+    Envoltorio que corre en el worker del pool: ejecuta func(*args) y
+    devuelve también cuándo empezó y terminó, medido dentro del worker.
+
+    Returns:
+        Tupla (resultado, inicio, fin)
+    """
+    start = time.time()
+    logger.debug(f"[{trace_id}] {getattr(func, '__name__', func)} iniciada")
+    result = func(*args)
+    return result, start, time.time()
+
+class Trace:
+    """
+    Spans de un scrape. Cada span tiene servidor, carril y nombre; los
+    del mismo carril no se superponen, así los visores los muestran como
+    una pila.
+    """
+
+    def __init__(self, trace_id: str = None, name: str = 'scrape'):
+        self.id = trace_id or new_trace_id()
+        self.name = name
+        self.start = time.time()
+        self.end = None
+        self.spans = []
+
+    @contextmanager
+    def span(self, name: str, lane: str = MAIN_LANE):
+        """Registra un span con la duración del bloque, aunque termine con error"""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add(name, start, lane=lane)
+
+    def add(self, name: str, start: float, end: float = None, lane: str = MAIN_LANE,
+            server: str = SERVER_A):
+        """Registra un span ya medido; sin end termina ahora"""
+        self.spans.append((server, lane, name, start, time.time() if end is None else end))
+
+    def extend(self, spans, server: str = SERVER_B):
+        """Agrega los spans recibidos de otro servidor, descartando los mal formados"""
+        if not isinstance(spans, list):
+            return
+        for span in spans:
+            try:
+                name, start, end = str(span['name']), float(span['start']), float(span['end'])
+            except (TypeError, KeyError, ValueError):
+                logger.warning(f"Span inválido en la traza {self.id}: {span!r}")
+                continue
+            self.add(name, start, end, lane=str(span.get('lane') or MAIN_LANE), server=server)
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.time()
+
+    def timings(self) -> dict:
+        """Bloque 'timings' de la respuesta: spans relativos al inicio de la traza"""
+        end = self.end or time.time()
+        return {
+            'trace_id': self.id,
+            'total_ms': round((end - self.start) * 1000, 1),
+            'spans': [
+                {
+                    'name': name,
+                    'server': server,
+                    'start_ms': round((start - self.start) * 1000, 1),
+                    'duration_ms': round((stop - start) * 1000, 1)
+                }
+                for server, _, name, start, stop in sorted(self.spans, key=lambda span: span[3])
+            ]
+        }
+
+class TraceWriter:
+    """
+    Escribe trazas en formato Trace Event de Chrome (JSON Array Format).
+    El formato admite que falte el ']' final, así cada traza se agrega al
+    terminar y el archivo sigue siendo legible aunque el servidor se corte.
+    Cada traza ocupa sus propios carriles (tid) dentro del proceso de cada
+    servidor. El archivo se reescribe al crear el TraceWriter.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'w', encoding='utf-8')
+        self._tids = itertools.count(1)
+        self.written = 0
+        self._write_events([
+            {'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': name}}
+            for pid, name in TRACE_PROCESSES.values()
+        ], header='[\n')
+
+    def _write_events(self, events: list, header: str = ''):
+        self._file.write(header + ''.join(json.dumps(event) + ',\n' for event in events))
+        self._file.flush()
+
+    def write(self, trace: Trace, label: str = None):
+        """Agrega una traza terminada al archivo"""
+        trace.finish()
+        label = label or trace.id
+        tids = {}
+        events = []
+
+        def tid(server: str, lane: str) -> int:
+            key = (server, lane)
+            if key not in tids:
+                tids[key] = next(self._tids)
+                events.append({
+                    'name': 'thread_name', 'ph': 'M', 'pid': TRACE_PROCESSES[server][0],
+                    'tid': tids[key], 'args': {'name': f'{label} [{lane}]'}
+                })
+            return tids[key]
+
+        def complete(name: str, server: str, lane: str, start: float, end: float, args=None) -> dict:
+            return {
+                'name': name, 'cat': 'tp2', 'ph': 'X',
+                'pid': TRACE_PROCESSES[server][0], 'tid': tid(server, lane),
+                'ts': round(start * 1e6), 'dur': round((end - start) * 1e6),
+                'args': args or {'trace_id': trace.id}
+            }
+
+        events.append(complete(trace.name, SERVER_A, MAIN_LANE, trace.start, trace.end,
+                               {'trace_id': trace.id, 'label': label}))
+        for server, lane, name, start, end in trace.spans:
+            events.append(complete(name, server if server in TRACE_PROCESSES else SERVER_B,
+                                   lane, start, end))
+        try:
+            self._write_events(events)
+            self.written += 1
+        except OSError as e:
+            logger.error(f"Error escribiendo la traza {trace.id} en {self.path}: {e}")
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,144 @@
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class PooledBrowser:
+    """Driver del pool junto con su contador de usos"""
+    __slots__ = ('driver', 'uses')
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+
+class BrowserPool:
+    """
+    Pool de navegadores headless de larga vida.
+
+    - Los navegadores se crean bajo demanda con driver_factory y se reusan
+      entre trabajos; entre uno y otro se resetean (about:blank y cookies).
+    - Cada navegador se recicla al llegar a max_uses para acotar fugas de
+      memoria del propio Chrome.
+    - Antes de entregar un navegador se verifica que responda (health check);
+      si falla, o si un trabajo termina con error, se descarta y se crea otro.
+
+    driver_factory es cualquier callable sin argumentos que devuelva un objeto
+    con la interfaz de un WebDriver de Selenium, lo que permite probar el pool
+    con un driver falso sin tener Chrome instalado.
+    """
+
+    def __init__(self, driver_factory, size: int = 1, max_uses: int = 50):
+        self.driver_factory = driver_factory
+        self.size = size
+        self.max_uses = max_uses
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.recycled = 0
+        self.crashed = 0
+        self.jobs = 0
+
+    def _quit(self, browser: PooledBrowser):
+        try:
+            browser.driver.quit()
+        except Exception as e:
+            logger.debug(f"Error cerrando navegador: {e}")
+
+    def _is_healthy(self, browser: PooledBrowser) -> bool:
+        """Verifica que el navegador siga respondiendo"""
+        try:
+            return browser.driver.execute_script('return 1') == 1
+        except Exception:
+            return False
+
+    def _reset(self, browser: PooledBrowser):
+        """Deja el navegador limpio para el próximo trabajo"""
+        browser.driver.get('about:blank')
+        browser.driver.delete_all_cookies()
+
+    def _take(self) -> PooledBrowser:
+        """Obtiene un navegador sano del pool o crea uno nuevo"""
+        while True:
+            try:
+                browser = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if self._is_healthy(browser):
+                return browser
+            logger.warning("Navegador sin respuesta, se descarta")
+            with self._lock:
+                self.crashed += 1
+            self._quit(browser)
+
+        browser = PooledBrowser(self.driver_factory())
+        with self._lock:
+            self.created += 1
+        return browser
+
+    @contextmanager
+    def browser(self):
+        """
+        Presta un driver para un trabajo.
+
+        Uso:
+            with pool.browser() as driver:
+                driver.get(url)
+        """
+        self._slots.acquire()
+        browser = None
+        try:
+            browser = self._take()
+            browser.uses += 1
+            with self._lock:
+                self.jobs += 1
+            try:
+                yield browser.driver
+            except Exception:
+                # El estado del navegador es desconocido tras un error: no se reusa
+                with self._lock:
+                    self.crashed += 1
+                self._quit(browser)
+                browser = None
+                raise
+
+            if browser.uses >= self.max_uses:
+                with self._lock:
+                    self.recycled += 1
+                self._quit(browser)
+                browser = None
+                return
+
+            try:
+                self._reset(browser)
+            except Exception as e:
+                logger.warning(f"No se pudo resetear el navegador, se descarta: {e}")
+                with self._lock:
+                    self.crashed += 1
+                self._quit(browser)
+                browser = None
+        finally:
+            if browser is not None:
+                self._idle.put(browser)
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """Contadores del pool"""
+        return {
+            'size': self.size,
+            'idle': self._idle.qsize(),
+            'created': self.created,
+            'recycled': self.recycled,
+            'crashed': self.crashed,
+            'jobs': self.jobs
+        }
+
+    def close(self):
+        """Cierra todos los navegadores ociosos"""
+        while True:
+            try:
+                self._quit(self._idle.get_nowait())
+            except queue.Empty:
+                return
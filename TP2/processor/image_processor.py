@@ -1,89 +1,292 @@
 from PIL import Image
 import requests
+from requests.adapters import HTTPAdapter
 import io
+import time
 import base64
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
+from processor.thumbnail_cache import ThumbnailCache, get_thumbnail_cache
 
 logger = logging.getLogger(__name__)
 
-def generate_thumbnails(image_urls: list, thumbnail_size: tuple = (100, 100)) -> list:
+# Máximo de imágenes a procesar por página
+MAX_IMAGES = 10
+
+# Tamaño máximo de descarga por imagen; las más grandes se descartan
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+
+# Tamaño de cada lectura al descargar en streaming
+CHUNK_SIZE = 64 * 1024
+
+# Timeout de conexión y de lectura de cada descarga, en segundos
+IMAGE_TIMEOUT = 10
+
+class ImageTooLarge(Exception):
+    """La imagen supera el tamaño máximo de descarga"""
+
+class DeadlineExceeded(Exception):
+    """El deadline de la solicitud venció mientras se procesaba la imagen"""
+
+def check_deadline(deadline: float = None) -> float:
+    """
+    Segundos que quedan hasta el deadline, acotados a IMAGE_TIMEOUT.
+
+    Raises:
+        DeadlineExceeded: Si el deadline ya venció
+    """
+    if deadline is None:
+        return IMAGE_TIMEOUT
+    remaining = deadline - time.time()
+    if remaining <= 0:
+        raise DeadlineExceeded("Deadline vencido")
+    return min(IMAGE_TIMEOUT, remaining)
+
+def create_session(pool_size: int) -> requests.Session:
+    """Crea una sesión HTTP con un pool de conexiones acotado a pool_size"""
+    session = requests.Session()
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0'
+    })
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+class ImageDownload:
+    """Resultado de una descarga: bytes y validadores, o 304 sin cuerpo"""
+    __slots__ = ('data', 'status', 'etag', 'last_modified')
+
+    def __init__(self, data: bytes, status: int = 200, etag: str = None, last_modified: str = None):
+        self.data = data
+        self.status = status
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status == 304
+
+def download_image(session: requests.Session, url: str, max_bytes: int = MAX_IMAGE_BYTES,
+                   etag: str = None, last_modified: str = None,
+                   deadline: float = None) -> ImageDownload:
+    """
+    Descarga una imagen en streaming cortando apenas supera max_bytes.
+    Con etag/last_modified hace un GET condicional y puede devolver 304.
+    Con deadline el timeout de conexión y lectura se acota a lo que
+    queda, y la descarga se corta entre chunks al vencer.
+
+    Raises:
+        ImageTooLarge: Si Content-Length o los bytes leídos superan max_bytes
+        DeadlineExceeded: Si el deadline vence antes de terminar
+        ValueError: Si la respuesta no es 200 ni 304
+        requests.RequestException: Errores de red
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    timeout = check_deadline(deadline)
+    with session.get(url, timeout=timeout, verify=False, stream=True, headers=headers) as response:
+        if response.status_code == 304 and headers:
+            return ImageDownload(None, 304, etag, last_modified)
+        if response.status_code != 200:
+            raise ValueError(f"HTTP {response.status_code}")
+
+        declared = response.headers.get('Content-Length')
+        if declared and declared.isdigit() and int(declared) > max_bytes:
+            raise ImageTooLarge(f"{declared} bytes")
+
+        buf = bytearray()
+        for chunk in response.iter_content(CHUNK_SIZE):
+            buf.extend(chunk)
+            if len(buf) > max_bytes:
+                raise ImageTooLarge(f"más de {max_bytes} bytes")
+            check_deadline(deadline)
+        return ImageDownload(
+            bytes(buf),
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified')
+        )
+
+def encode_thumbnail(data: bytes, thumbnail_size: tuple = (100, 100)) -> bytes:
+    """
+    Decodifica la imagen y genera un thumbnail JPEG.
+    Para JPEG usa draft() y el decoder reduce la escala (1/2, 1/4, 1/8)
+    durante la decodificación en lugar de decodificar a resolución completa.
+    """
+    img = Image.open(io.BytesIO(data))
+
+    if img.format == 'JPEG':
+        img.draft('RGB', thumbnail_size)
+
+    # Convertir a RGB si es necesario (para JPEG)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        img = img.convert('RGB')
+
+    # Crear thumbnail
+    img.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
+
+    # Guardar en buffer
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=85, optimize=True)
+    return buf.getvalue()
+
+def make_thumbnail(data: bytes, thumbnail_size: tuple = (100, 100)) -> str:
+    """Genera el thumbnail JPEG de la imagen en base64"""
+    return base64.b64encode(encode_thumbnail(data, thumbnail_size)).decode('utf-8')
+
+def cached_thumbnail(cache: ThumbnailCache, session: requests.Session, url: str,
+                     thumbnail_size: tuple, max_bytes: int = MAX_IMAGE_BYTES,
+                     deadline: float = None) -> bytes:
+    """
+    Obtiene el thumbnail pasando por el cache en disco:
+
+    1. URL fresca en el cache: se devuelve sin tocar la red.
+    2. URL vencida con validadores: GET condicional; un 304 reusa el thumbnail.
+    3. Descarga completa: si el hash de los bytes ya está en el cache
+       (la misma imagen en otra URL) no se vuelve a codificar.
+    """
+    entry = cache.lookup(url, thumbnail_size)
+    if entry and entry.fresh:
+        thumbnail = cache.get(entry.digest, thumbnail_size)
+        if thumbnail is not None:
+            cache.record(hits=1, bytes_saved=entry.source_size)
+            return thumbnail
+
+    download = None
+    if entry and (entry.etag or entry.last_modified):
+        download = download_image(session, url, max_bytes, entry.etag, entry.last_modified, deadline)
+        if download.not_modified:
+            thumbnail = cache.get(entry.digest, thumbnail_size)
+            if thumbnail is not None:
+                cache.link(url, thumbnail_size, entry.digest, entry.etag,
+                           entry.last_modified, entry.source_size)
+                cache.record(revalidated=1, bytes_saved=entry.source_size)
+                return thumbnail
+            # El thumbnail fue desalojado: hace falta la imagen completa
+            download = None
+
+    if download is None:
+        download = download_image(session, url, max_bytes, deadline=deadline)
+
+    digest = hashlib.sha256(download.data).hexdigest()
+    thumbnail = cache.get(digest, thumbnail_size)
+    if thumbnail is None:
+        check_deadline(deadline)
+        thumbnail = encode_thumbnail(download.data, thumbnail_size)
+        cache.put(digest, thumbnail_size, thumbnail)
+        cache.record(misses=1)
+    else:
+        cache.record(content_hits=1)
+
+    cache.link(url, thumbnail_size, digest, download.etag,
+               download.last_modified, len(download.data))
+    return thumbnail
+
+def process_image(session: requests.Session, url: str, thumbnail_size: tuple,
+                  max_bytes: int = MAX_IMAGE_BYTES, cache: ThumbnailCache = None,
+                  deadline: float = None) -> bytes:
+    """
+    Descarga y procesa una imagen. Devuelve el thumbnail JPEG, o None
+    si la imagen no se pudo procesar o no terminó antes del deadline.
+    """
+    try:
+        # Validar URL
+        parsed = urlparse(url)
+        if not parsed.scheme:
+            logger.warning(f"URL sin esquema: {url}")
+            return None
+
+        if not parsed.netloc:
+            logger.warning(f"URL sin dominio: {url}")
+            return None
+
+        # Descargar imagen (o tomarla del cache)
+        if cache is not None:
+            thumbnail = cached_thumbnail(cache, session, url, thumbnail_size, max_bytes, deadline)
+        else:
+            download = download_image(session, url, max_bytes, deadline=deadline)
+            check_deadline(deadline)
+            thumbnail = encode_thumbnail(download.data, thumbnail_size)
+
+        logger.info(f"Thumbnail generado para {url}")
+        return thumbnail
+
+    except ImageTooLarge as e:
+        logger.warning(f"Imagen demasiado grande ({e}): {url}")
+    except DeadlineExceeded:
+        logger.warning(f"Deadline vencido procesando la imagen: {url}")
+    except requests.Timeout:
+        logger.warning(f"Timeout descargando imagen: {url}")
+    except requests.RequestException as e:
+        logger.warning(f"Error descargando imagen {url}: {e}")
+    except ValueError as e:
+        logger.warning(f"Error descargando imagen {url}: {e}")
+    except Image.UnidentifiedImageError:
+        logger.warning(f"No es una imagen válida: {url}")
+    except Exception as e:
+        logger.warning(f"Error procesando imagen {url}: {e}")
+    return None
+
+def render_thumbnails(image_urls: list, thumbnail_size: tuple = (100, 100),
+                      max_workers: int = MAX_IMAGES, max_bytes: int = MAX_IMAGE_BYTES,
+                      cache: ThumbnailCache = None, deadline: float = None) -> list:
     """
     Genera thumbnails optimizados de las imágenes principales.
-    
+    Las imágenes se descargan y decodifican en paralelo con un pool de
+    threads y conexiones acotado, así la latencia por página sigue a la
+    imagen más lenta y no a la suma de todas.
+
     Args:
         image_urls: Lista de URLs de imágenes
         thumbnail_size: Tamaño del thumbnail (default: 100x100)
-    
+        max_workers: Descargas simultáneas (default: 10)
+        max_bytes: Tamaño máximo de descarga por imagen (default: 5MB)
+        cache: ThumbnailCache a usar (default: el cache del proceso, si está configurado)
+        deadline: Instante (time.time()) a partir del cual no se empiezan
+            imágenes nuevas; las descargas en curso acotan su timeout a
+            lo que queda y se cortan al vencer, y las que falten se omiten
+
     Returns:
-        Lista de thumbnails en base64
+        Lista de thumbnails JPEG (bytes), en el orden de las URLs
     """
     thumbnails = []
-    
+
     if not image_urls:
         logger.info("No hay imágenes para procesar")
         return thumbnails
-    
-    session = requests.Session()
-    session.headers.update({
-        'User-Agent': 'Mozilla/5.0'
-    })
-    
-    for url in image_urls[:10]:  # Limitar a 10 primeras imágenes
-        try:
-            # Validar URL
-            parsed = urlparse(url)
-            if not parsed.scheme:
-                logger.warning(f"URL sin esquema: {url}")
-                continue
-            
-            if not parsed.netloc:
-                logger.warning(f"URL sin dominio: {url}")
-                continue
-            
-            # Descargar imagen
-            response = session.get(
-                url,
-                timeout=10,
-                verify=False
-            )
-            
-            if response.status_code != 200:
-                logger.warning(f"Error descargando imagen {url}: HTTP {response.status_code}")
-                continue
-            
-            # Abrir imagen
-            img = Image.open(io.BytesIO(response.content))
-            
-            # Convertir a RGB si es necesario (para JPEG)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                img = img.convert('RGB')
-            
-            # Crear thumbnail
-            img.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
-            
-            # Guardar en buffer
-            buf = io.BytesIO()
-            img.save(buf, format='JPEG', quality=85, optimize=True)
-            
-            # Convertir a base64
-            thumbnail_b64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-            thumbnails.append(thumbnail_b64)
-            
-            logger.info(f"Thumbnail generado para {url}")
-            
-        except requests.Timeout:
-            logger.warning(f"Timeout descargando imagen: {url}")
-            continue
-        except requests.RequestException as e:
-            logger.warning(f"Error descargando imagen {url}: {e}")
-            continue
-        except Image.UnidentifiedImageError:
-            logger.warning(f"No es una imagen válida: {url}")
-            continue
-        except Exception as e:
-            logger.warning(f"Error procesando imagen {url}: {e}")
-            continue
-    
+
+    urls = image_urls[:MAX_IMAGES]  # Limitar a 10 primeras imágenes
+    workers = max(1, min(max_workers, len(urls)))
+    cache = cache or get_thumbnail_cache()
+
+    def render(url):
+        if deadline is not None and time.time() >= deadline:
+            logger.warning(f"Deadline vencido, se omite la imagen {url}")
+            return None
+        return process_image(session, url, thumbnail_size, max_bytes, cache, deadline)
+
+    with create_session(workers) as session, ThreadPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(render, urls)
+        thumbnails = [thumbnail for thumbnail in results if thumbnail is not None]
+
     logger.info(f"Generados {len(thumbnails)} thumbnails de {len(image_urls)} imágenes")
     return thumbnails
+
+def generate_thumbnails(image_urls: list, thumbnail_size: tuple = (100, 100),
+                        max_workers: int = MAX_IMAGES, max_bytes: int = MAX_IMAGE_BYTES,
+                        cache: ThumbnailCache = None) -> list:
+    """
+    Genera thumbnails optimizados de las imágenes principales.
+    Igual que render_thumbnails pero codificados en base64.
+
+    Returns:
+        Lista de thumbnails en base64, en el orden de las URLs
+    """
+    thumbnails = render_thumbnails(image_urls, thumbnail_size, max_workers, max_bytes, cache)
+    return [base64.b64encode(thumbnail).decode('utf-8') for thumbnail in thumbnails]
@@ -0,0 +1,67 @@
+import logging
+from common.metrics import Registry
+
+logger = logging.getLogger(__name__)
+
+class ProcessingMetrics:
+    """
+    Métricas del Servidor B. La duración de cada tarea y su espera en la
+    cola del planificador se observan al terminar; conexiones, solicitudes
+    en curso y profundidad de las colas se leen del servidor al exportar.
+    """
+
+    def __init__(self, server):
+        self.registry = registry = Registry()
+        self.stages = registry.histogram(
+            'tp2_stage_duration_seconds', 'Duración de cada tarea en el pool de procesos', ['stage']
+        )
+        self.queue_wait = registry.histogram(
+            'tp2_queue_wait_seconds', 'Espera de cada tarea en la cola del planificador', ['task']
+        )
+        self.bytes = registry.counter(
+            'tp2_bytes_total', 'Bytes de los mensajes intercambiados con los clientes', ['direction']
+        )
+        self.bytes_in = self.bytes.labels('in')
+        self.bytes_out = self.bytes.labels('out')
+
+        registry.gauge_callback(
+            'tp2_connections', 'Conexiones abiertas', lambda: server.connections
+        )
+        registry.gauge_callback(
+            'tp2_requests_in_flight', 'Solicitudes en curso', lambda: server.in_flight_requests
+        )
+        registry.gauge_callback(
+            'tp2_jobs_in_flight', 'Tareas encoladas o corriendo', lambda: server.in_flight_jobs
+        )
+        registry.gauge_callback(
+            'tp2_scheduler_queued', 'Tareas esperando en el planificador por tipo',
+            lambda: self._scheduler_tasks(server, 'queued'), ['task']
+        )
+        registry.gauge_callback(
+            'tp2_scheduler_running', 'Tareas corriendo en el pool por tipo',
+            lambda: self._scheduler_tasks(server, 'running'), ['task']
+        )
+        registry.counter_callback(
+            'tp2_requests_served_total', 'Solicitudes atendidas', lambda: server.requests_served
+        )
+        registry.counter_callback(
+            'tp2_requests_rejected_total', 'Solicitudes rechazadas por sobrecarga',
+            lambda: server.requests_rejected
+        )
+        registry.counter_callback(
+            'tp2_connections_rejected_total', 'Conexiones cerradas al aceptarlas por el límite',
+            lambda: server.connections_rejected
+        )
+        registry.counter_callback(
+            'tp2_tasks_timed_out_total', 'Tareas cortadas por el deadline',
+            lambda: server.tasks_timed_out
+        )
+
+    @staticmethod
+    def _scheduler_tasks(server, field: str) -> dict:
+        return {(task,): stats[field] for task, stats in server.scheduler.stats()['tasks'].items()}
+
+    def observe_task(self, task: str, wait: float, run: float):
+        """Observer del planificador: espera en cola y duración en el executor"""
+        self.queue_wait.labels(task).observe(wait)
+        self.stages.labels(task).observe(run)
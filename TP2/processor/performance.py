@@ -1,32 +1,131 @@
 import time
-import aiohttp
-import asyncio
 import logging
 from urllib.parse import urlparse
+from scraper.page_extractor import extract_page
+from processor.waterfall import run_waterfall
 
 logger = logging.getLogger(__name__)
 
-def analyze_performance(url: str) -> dict:
+RESOURCE_KINDS = ('stylesheets', 'scripts', 'images')
+
+def _error_result(message: str) -> dict:
+    return {
+        'error': message,
+        'load_time_ms': 0,
+        'total_size_kb': 0,
+        'num_requests': 0
+    }
+
+def _count_requests(resources: dict) -> int:
+    """La página principal más cada hoja de estilo, script e imagen referenciados"""
+    return 1 + sum(len(resources.get(kind) or ()) for kind in RESOURCE_KINDS)
+
+def performance_from_page(url: str, page: dict, measured_by: str = 'scraper') -> dict:
+    """
+    Calcula las métricas con las mediciones de la descarga de la página,
+    sin tocar la red.
+
+    Args:
+        url: URL analizada
+        page: Dict con load_time_ms, ttfb_ms, size_bytes, final_url y resources
+        measured_by: Quién descargó la página ('scraper' o 'processor')
+
+    Returns:
+        Dict con métricas de rendimiento
+    """
+    size_bytes = page.get('size_bytes') or 0
+    result = {
+        'load_time_ms': int(page.get('load_time_ms') or 0),
+        'ttfb_ms': int(page.get('ttfb_ms') or 0),
+        'total_size_kb': round(size_bytes / 1024, 2),
+        'num_requests': _count_requests(page.get('resources') or {}),
+        'measured_by': measured_by
+    }
+    logger.info(f"Performance calculado para {url}: {result['load_time_ms']}ms, {result['total_size_kb']}KB")
+    return result
+
+def add_waterfall(url: str, page: dict, result: dict, deadline: float = None) -> dict:
+    """
+    Descarga los recursos de la página y completa result con la cascada.
+    Las URLs relativas se resuelven contra page['final_url'] (la URL
+    después de las redirecciones), o contra url si no viene.
+    num_requests y total_size_kb pasan a contar lo realmente transferido.
+    Si la medición falla, o no queda tiempo antes de deadline, se
+    conservan las métricas estimadas.
+    """
+    budget = None if deadline is None else deadline - time.time()
+    if budget is not None and budget <= 0:
+        result['waterfall'] = {'error': 'Sin tiempo antes del deadline'}
+        return result
+    try:
+        waterfall = run_waterfall(
+            page.get('final_url') or url, page.get('resources') or {},
+            document_ms=page.get('load_time_ms') or 0,
+            document_bytes=page.get('size_bytes') or 0,
+            budget=budget
+        )
+    except Exception as e:
+        logger.error(f"Error midiendo la cascada de recursos para {url}: {e}")
+        result['waterfall'] = {'error': str(e)}
+        return result
+
+    result['num_requests'] = 1 + waterfall['resources']
+    result['total_size_kb'] = round(waterfall['transfer_bytes'] / 1024, 2)
+    result['waterfall'] = waterfall
+    return result
+
+def analyze_performance(url: str, page: dict = None, remeasure: bool = False,
+                        waterfall: bool = True, deadline: float = None) -> dict:
     """
     Analiza el rendimiento de carga de una página.
-    
+
+    Si se recibe page (las mediciones de la descarga del Servidor A) no se
+    vuelve a descargar el documento. Sin page, o con remeasure=True, se
+    descarga para medirlo de forma independiente. Con waterfall=True
+    además se descargan sus recursos para armar la cascada.
+
     Args:
         url: URL a analizar
-    
+        page: Mediciones de la descarga hecha por el Servidor A (opcional)
+        remeasure: Si es True se mide de nuevo aunque venga page
+        waterfall: Si es True se miden los recursos de la página
+        deadline: Instante (time.time()) en el que el análisis debe terminar;
+            las descargas se acotan para no pasarlo
+
     Returns:
         Dict con métricas de rendimiento
     """
+    measured_by = 'scraper'
+    if not page or remeasure:
+        page = measure_page(url, deadline)
+        if 'error' in page:
+            return page
+        measured_by = 'processor'
+
+    result = performance_from_page(url, page, measured_by)
+    if waterfall:
+        add_waterfall(url, page, result, deadline)
+    return result
+
+def measure_page(url: str, deadline: float = None) -> dict:
+    """
+    Descarga la página y mide el TTFB, el tiempo de carga y el tamaño, y
+    arma su inventario de recursos.
+
+    Args:
+        url: URL a analizar
+        deadline: Instante (time.time()) límite para la descarga
+
+    Returns:
+        Dict con la misma forma que las mediciones del Servidor A, o un
+        resultado de error
+    """
     try:
         # Validar URL
         parsed = urlparse(url)
         if not parsed.scheme or not parsed.netloc:
             logger.error(f"URL inválida: {url}")
-            return {
-                'error': 'URL inválida',
-                'load_time_ms': 0,
-                'total_size_kb': 0,
-                'num_requests': 0
-            }
+            return _error_result('URL inválida')
         
         import requests
         from requests.adapters import HTTPAdapter
@@ -48,53 +147,28 @@ def analyze_performance(url: str) -> dict:
         
         response = session.get(
             url,
-            timeout=30,
+            timeout=30 if deadline is None else max(0.1, min(30, deadline - time.time())),
             headers={'User-Agent': 'Mozilla/5.0'},
             allow_redirects=True,
             verify=True
         )
         
-        load_time_ms = int((time.time() - start) * 1000)
-        total_size_kb = len(response.content) / 1024
-        
-        # Contar headers para estimar número de requests
-        # (es una simplificación; idealmente usaríamos un navegador real)
-        num_requests = 1  # Al menos la principal
+        load_time_ms = (time.time() - start) * 1000
         
-        # Intentar contar recursos adicionales desde el HTML
-        try:
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(response.text, 'lxml')
-            # Contar recursos
-            css_files = len(soup.find_all('link', rel='stylesheet'))
-            js_files = len(soup.find_all('script', src=True))
-            img_files = len(soup.find_all('img'))
-            num_requests += css_files + js_files + img_files
-        except:
-            pass
+        # Inventario de recursos con el mismo extractor que usa el Servidor A
+        scraping_data = extract_page(response.text, resources=True)
         
-        result = {
+        return {
             'load_time_ms': load_time_ms,
-            'total_size_kb': round(total_size_kb, 2),
-            'num_requests': num_requests
+            'ttfb_ms': response.elapsed.total_seconds() * 1000,
+            'size_bytes': len(response.content),
+            'final_url': response.url,
+            'resources': scraping_data.get('resources', {})
         }
         
-        logger.info(f"Performance analizado para {url}: {load_time_ms}ms, {total_size_kb}KB")
-        return result
-        
     except requests.Timeout:
         logger.error(f"Timeout analizando performance para {url}")
-        return {
-            'error': 'Timeout',
-            'load_time_ms': 0,
-            'total_size_kb': 0,
-            'num_requests': 0
-        }
+        return _error_result('Timeout')
     except Exception as e:
         logger.error(f"Error analizando performance para {url}: {e}")
-        return {
-            'error': str(e),
-            'load_time_ms': 0,
-            'total_size_kb': 0,
-            'num_requests': 0
-        }
+        return _error_result(str(e))
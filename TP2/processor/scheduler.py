@@ -0,0 +1,253 @@
+import time
+import asyncio
+import logging
+import itertools
+from collections import deque, defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Costo relativo estimado de cada tipo de tarea: un screenshot ocupa un
+# worker (y un Chrome) mucho más que un análisis de rendimiento
+TASK_COSTS = {'screenshot': 8.0, 'thumbnails': 2.0, 'performance': 1.0}
+
+# Peso de cada prioridad en el reparto: con peso 4 un cliente recibe
+# cuatro veces más servicio que uno normal mientras ambos tienen cola
+PRIORITY_WEIGHTS = {'high': 4.0, 'normal': 1.0, 'low': 0.25}
+
+DEFAULT_PRIORITY = 'normal'
+
+# Cantidad de clientes con historial a partir de la cual se limpian los inactivos
+MAX_TRACKED_CLIENTS = 1024
+
+class ScheduledJob:
+    """Tarea esperando lugar en el pool, con su etiqueta de fin virtual"""
+    __slots__ = ('task', 'client', 'func', 'args', 'start', 'tag', 'seq', 'future',
+                 'exec_future', 'enqueued_at', 'dispatched_at')
+
+    def __init__(self, task: str, client: str, func, args: tuple, start: float, tag: float,
+                 seq: int, future: asyncio.Future):
+        self.task = task
+        self.client = client
+        self.func = func
+        self.args = args
+        self.start = start
+        self.tag = tag
+        self.seq = seq
+        self.future = future
+        self.exec_future = None
+        self.enqueued_at = time.perf_counter()
+        self.dispatched_at = None
+
+class QueueStats:
+    """Contadores de espera de un tipo de tarea"""
+    __slots__ = ('dispatched', 'total_wait', 'max_wait')
+
+    def __init__(self):
+        self.dispatched = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float):
+        self.dispatched += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+class FairScheduler:
+    """
+    Planificador delante del pool de procesos con colas separadas por tipo
+    de tarea y por cliente, y reparto por encolado justo ponderado (WFQ).
+
+    - Cada tarea recibe una etiqueta de fin virtual:
+      max(tiempo virtual, última etiqueta del cliente) + costo / peso.
+      Se despacha siempre la cabeza de cola con la etiqueta más chica, así
+      un cliente con cientos de screenshots encolados avanza a su ritmo y
+      no bloquea los análisis de rendimiento de los demás.
+    - Al pool nunca se le entregan más tareas que workers: el orden lo
+      decide el planificador y no la cola FIFO del executor.
+    - Los tipos de tarea pueden tener un límite de concurrencia propio
+      (screenshots, que usan mucha más memoria). Si un tipo está en su
+      límite se despacha el siguiente de otro tipo.
+    - Una tarea cancelada mientras espera se saca de la cola sin ocupar
+      un worker. Si ya se había despachado, su lugar se libera recién
+      cuando el executor la termina de verdad: cancelar la espera no
+      detiene un worker que ya la está ejecutando.
+    - Con observer, al terminar cada tarea se llama
+      observer(tarea, segundos en cola, segundos en el executor).
+    """
+
+    def __init__(self, executor, workers: int, limits: dict = None, costs: dict = None,
+                 observer=None):
+        """
+        Args:
+            executor: Executor donde corren las tareas
+            workers: Tareas simultáneas que se entregan al executor
+            limits: Límite de concurrencia por tipo de tarea (opcional)
+            costs: Costo relativo por tipo de tarea (default: TASK_COSTS)
+            observer: Callback con los tiempos de cada tarea terminada (opcional)
+        """
+        self.executor = executor
+        self.workers = max(1, workers)
+        self.limits = dict(limits or {})
+        self.costs = dict(costs or TASK_COSTS)
+        self._queues = defaultdict(dict)      # tarea -> cliente -> deque
+        self._last_tag = {}                   # cliente -> última etiqueta
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+        self._running = defaultdict(int)
+        self._stats = defaultdict(QueueStats)
+        self.observer = observer
+        self.running = 0
+
+    async def run(self, task: str, client: str, func, *args, priority: str = DEFAULT_PRIORITY):
+        """
+        Encola func(*args) y espera su resultado.
+
+        Args:
+            task: Tipo de tarea (screenshot, performance, thumbnails)
+            client: Identificador del cliente para el reparto justo
+            func: Función a ejecutar en el executor
+            priority: Prioridad de la solicitud (high, normal o low)
+
+        Raises:
+            ValueError: Si la prioridad no existe
+        """
+        try:
+            weight = PRIORITY_WEIGHTS[priority]
+        except KeyError:
+            raise ValueError(f"Prioridad desconocida: {priority}")
+
+        start = max(self._virtual_time, self._last_tag.get(client, 0.0))
+        tag = start + self.costs.get(task, 1.0) / weight
+        self._last_tag[client] = tag
+        job = ScheduledJob(task, client, func, args, start, tag, next(self._seq),
+                           asyncio.get_running_loop().create_future())
+        self._queues[task].setdefault(client, deque()).append(job)
+        self._dispatch()
+
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            if job.exec_future is None:
+                self._remove(job)
+            else:
+                # Solo tiene efecto si el executor todavía no la empezó
+                job.exec_future.cancel()
+            raise
+
+    def _remove(self, job: ScheduledJob):
+        """Saca de la cola una tarea que no llegó a empezar"""
+        queue = self._queues[job.task].get(job.client)
+        if queue is None:
+            return
+        try:
+            queue.remove(job)
+        except ValueError:
+            return
+        if not queue:
+            del self._queues[job.task][job.client]
+
+    def _next_job(self) -> ScheduledJob:
+        """Cabeza de cola con la etiqueta más chica entre los tipos con lugar"""
+        best = None
+        for task, clients in self._queues.items():
+            limit = self.limits.get(task)
+            if limit is not None and self._running[task] >= limit:
+                continue
+            for queue in clients.values():
+                head = queue[0]
+                if best is None or (head.tag, head.seq) < (best.tag, best.seq):
+                    best = head
+        return best
+
+    def _dispatch(self):
+        """Entrega tareas al executor mientras haya workers libres"""
+        loop = asyncio.get_running_loop()
+        while self.running < self.workers:
+            job = self._next_job()
+            if job is None:
+                return
+            self._remove(job)
+            self._advance(job.start)
+            # Future de concurrent.futures: se completa cuando la tarea
+            # termina en el executor, no cuando se cancela la espera
+            try:
+                job.exec_future = self.executor.submit(job.func, *job.args)
+            except Exception as e:
+                # Executor roto (BrokenProcessPool) o cerrado (RuntimeError):
+                # la tarea no ocupa lugar y el que espera recibe el error
+                logger.error(f"No se pudo enviar {job.task} al executor: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+                continue
+            job.dispatched_at = time.perf_counter()
+            self._stats[job.task].record(job.dispatched_at - job.enqueued_at)
+            self.running += 1
+            self._running[job.task] += 1
+            job.exec_future.add_done_callback(
+                lambda future, job=job: self._finished_threadsafe(loop, job, future)
+            )
+
+    def _finished_threadsafe(self, loop, job: ScheduledJob, future):
+        """Done callback del executor, que puede correr en otro thread"""
+        try:
+            loop.call_soon_threadsafe(self._finished, job, future)
+        except RuntimeError:
+            # El event loop ya se cerró: nadie espera el resultado
+            pass
+
+    def _advance(self, virtual_time: float):
+        """
+        Avanza el tiempo virtual al inicio de la tarea despachada. Las
+        etiquetas de clientes que quedaron atrás equivalen a no tener
+        historial, así que se descartan para no acumular clientes viejos.
+        """
+        if virtual_time <= self._virtual_time:
+            return
+        self._virtual_time = virtual_time
+        if len(self._last_tag) > MAX_TRACKED_CLIENTS:
+            self._last_tag = {client: tag for client, tag in self._last_tag.items()
+                              if tag > virtual_time}
+
+    def _finished(self, job: ScheduledJob, future):
+        self.running -= 1
+        self._running[job.task] -= 1
+        if self.observer is not None and not future.cancelled():
+            self.observer(job.task, job.dispatched_at - job.enqueued_at,
+                          time.perf_counter() - job.dispatched_at)
+        if not job.future.done():
+            if future.cancelled():
+                job.future.cancel()
+            elif future.exception() is not None:
+                job.future.set_exception(future.exception())
+            else:
+                job.future.set_result(future.result())
+        self._dispatch()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for clients in self._queues.values() for queue in clients.values())
+
+    def stats(self) -> dict:
+        """Profundidad de las colas, tareas en curso y tiempos de espera por tipo"""
+        tasks = {}
+        for task in sorted(set(self._stats) | set(self._queues) | set(self.limits)):
+            stats = self._stats[task]
+            tasks[task] = {
+                'queued': sum(len(queue) for queue in self._queues[task].values()),
+                'running': self._running[task],
+                'limit': self.limits.get(task),
+                'dispatched': stats.dispatched,
+                'avg_wait_ms': round(stats.total_wait / stats.dispatched * 1000, 1) if stats.dispatched else 0.0,
+                'max_wait_ms': round(stats.max_wait * 1000, 1)
+            }
+        clients = defaultdict(int)
+        for queues in self._queues.values():
+            for client, queue in queues.items():
+                clients[client] += len(queue)
+        return {
+            'workers': self.workers,
+            'running': self.running,
+            'queued': self.queued,
+            'tasks': tasks,
+            'queued_by_client': dict(clients)
+        }
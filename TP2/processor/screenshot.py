@@ -1,67 +1,116 @@
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
+from processor.browser_pool import BrowserPool
 import base64
 import logging
 import time
+from multiprocessing import util
 
 logger = logging.getLogger(__name__)
 
-def generate_screenshot(url: str, timeout: int = 30) -> str:
+# Usos máximos de cada navegador antes de reciclarlo
+BROWSER_MAX_USES = 50
+
+# Espera máxima de document.readyState y de la búsqueda de elementos, en segundos
+READY_WAIT = 10
+
+# Pool de navegadores del proceso actual (uno por worker del pool de procesos)
+_browser_pool = None
+
+def create_chrome_driver():
+    """Crea un Chrome headless configurado para tomar screenshots"""
+    # Configurar opciones de Chrome
+    options = Options()
+    options.add_argument('--headless=new')
+    options.add_argument('--start-maximized')
+    options.add_argument('--disable-blink-features=AutomationControlled')
+    options.add_argument('user-agent=Mozilla/5.0')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--no-sandbox')
+
+    # Crear driver
+    driver = webdriver.Chrome(options=options)
+    driver.implicitly_wait(READY_WAIT)
+    driver.set_window_size(1920, 1080)
+    return driver
+
+def get_browser_pool() -> BrowserPool:
     """
-    Genera un screenshot de la página web renderizada.
-    
+    Devuelve el pool de navegadores del proceso, creándolo la primera vez.
+    Cada worker del pool de procesos mantiene su propio navegador de larga vida.
+    """
+    global _browser_pool
+    if _browser_pool is None:
+        _browser_pool = BrowserPool(create_chrome_driver, size=1, max_uses=BROWSER_MAX_USES)
+        # Finalize corre también al salir de un worker de multiprocessing (atexit no)
+        util.Finalize(_browser_pool, _browser_pool.close, exitpriority=10)
+    return _browser_pool
+
+def capture_screenshot(url: str, timeout: int = 30, pool: BrowserPool = None,
+                       deadline: float = None) -> bytes:
+    """
+    Captura la página web renderizada como PNG.
+
     Args:
         url: URL de la página
         timeout: Timeout en segundos
-    
+        pool: BrowserPool a usar (default: el pool del proceso)
+        deadline: Instante (time.time()) límite; la carga de la página y
+            las esperas de Selenium se acotan a lo que queda
+
     Returns:
-        Imagen en base64, o None si hay error
+        Bytes del PNG, o None si hay error
     """
-    driver = None
+    end = time.time() + timeout
+    if deadline is not None:
+        end = min(end, deadline)
+
+    def remaining() -> float:
+        return max(0, end - time.time())
+
+    pool = pool or get_browser_pool()
     try:
-        # Configurar opciones de Chrome
-        options = Options()
-        options.headless = True
-        options.add_argument('--start-maximized')
-        options.add_argument('--disable-blink-features=AutomationControlled')
-        options.add_argument('user-agent=Mozilla/5.0')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--no-sandbox')
-        
-        # Crear driver
-        driver = webdriver.Chrome(options=options)
-        
-        # Configurar timeouts
-        driver.set_page_load_timeout(timeout)
-        driver.implicitly_wait(10)
-        
-        # Acceder a la URL
-        driver.set_window_size(1920, 1080)
-        logger.info(f"Cargando URL: {url}")
-        driver.get(url)
-        
-        # Esperar a que cargue el contenido (máximo 10 segundos)
-        try:
-            WebDriverWait(driver, 10).until(
-                lambda driver: driver.execute_script('return document.readyState') == 'complete'
-            )
-        except:
-            logger.warning(f"Timeout esperando document.readyState para {url}")
-        
-        # Tomar screenshot
-        screenshot_bytes = driver.get_screenshot_as_png()
-        screenshot_b64 = base64.b64encode(screenshot_bytes).decode('utf-8')
-        
-        logger.info(f"Screenshot generado exitosamente para {url}")
-        return screenshot_b64
-        
+        with pool.browser() as driver:
+            # Configurar timeouts
+            driver.set_page_load_timeout(remaining())
+            driver.implicitly_wait(min(READY_WAIT, remaining()))
+
+            # Acceder a la URL
+            logger.info(f"Cargando URL: {url}")
+            driver.get(url)
+
+            # Esperar a que cargue el contenido (máximo READY_WAIT segundos)
+            try:
+                WebDriverWait(driver, min(READY_WAIT, remaining())).until(
+                    lambda driver: driver.execute_script('return document.readyState') == 'complete'
+                )
+            except:
+                logger.warning(f"Timeout esperando document.readyState para {url}")
+
+            # Tomar screenshot
+            screenshot_bytes = driver.get_screenshot_as_png()
+
+            logger.info(f"Screenshot generado exitosamente para {url}")
+            return screenshot_bytes
+
     except Exception as e:
         logger.error(f"Error generando screenshot para {url}: {e}")
         return None
-    finally:
-        if driver:
-            try:
-                driver.quit()
-            except:
-                pass
+
+def generate_screenshot(url: str, timeout: int = 30, pool: BrowserPool = None) -> str:
+    """
+    Genera un screenshot de la página web renderizada.
+
+    Args:
+        url: URL de la página
+        timeout: Timeout en segundos
+        pool: BrowserPool a usar (default: el pool del proceso)
+
+    Returns:
+        Imagen en base64, o None si hay error
+    """
+    screenshot_bytes = capture_screenshot(url, timeout, pool)
+    if screenshot_bytes is None:
+        return None
+    return base64.b64encode(screenshot_bytes).decode('utf-8')
@@ -0,0 +1,242 @@
+import os
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Tiempo durante el cual una URL cacheada se usa sin volver a consultar al origen
+DEFAULT_TTL = 3600
+
+# Al desalojar se baja hasta este porcentaje del tope para no desalojar en cada put
+LOW_WATERMARK = 0.9
+
+# Cache configurado para el proceso actual (ver configure_thumbnail_cache)
+_cache = None
+_cache_config = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT NOT NULL,
+    thumb_size TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    source_size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (url, thumb_size)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT NOT NULL,
+    thumb_size TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (digest, thumb_size)
+);
+CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+COUNTERS = ('hits', 'revalidated', 'content_hits', 'misses', 'bytes_saved', 'evictions')
+
+UrlEntry = namedtuple('UrlEntry', 'digest etag last_modified source_size fresh')
+
+class ThumbnailCache:
+    """
+    Cache en disco de thumbnails direccionado por contenido.
+
+    - La clave primaria es la URL de la imagen (más el tamaño del thumbnail)
+      junto con sus validadores (ETag/Last-Modified): dentro del TTL se usa
+      sin tocar la red y después se revalida con un GET condicional.
+    - La clave secundaria es el SHA-256 de los bytes de la imagen, así la
+      misma imagen servida desde otra URL (CDN, query strings) no se vuelve
+      a codificar.
+    - Los thumbnails se guardan como archivos y el índice en SQLite (WAL),
+      por lo que varios procesos pueden compartir el mismo directorio.
+    - El tamaño total se acota desalojando los thumbnails usados hace más
+      tiempo (LRU).
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024, ttl: float = DEFAULT_TTL):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(directory, 'index.sqlite'),
+            timeout=30, isolation_level=None, check_same_thread=False
+        )
+        with self._lock:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.executescript(SCHEMA)
+            self._db.executemany(
+                'INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)',
+                [(name,) for name in COUNTERS]
+            )
+
+    @staticmethod
+    def _size_key(thumbnail_size: tuple) -> str:
+        return f'{thumbnail_size[0]}x{thumbnail_size[1]}'
+
+    def _blob_path(self, digest: str, size_key: str) -> str:
+        return os.path.join(self.directory, 'blobs', digest[:2], f'{digest}-{size_key}.jpg')
+
+    def lookup(self, url: str, thumbnail_size: tuple) -> UrlEntry:
+        """Devuelve la entrada de la URL, o None si no está cacheada"""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT digest, etag, last_modified, source_size, fetched_at '
+                'FROM urls WHERE url = ? AND thumb_size = ?',
+                (url, self._size_key(thumbnail_size))
+            ).fetchone()
+        if row is None:
+            return None
+        digest, etag, last_modified, source_size, fetched_at = row
+        fresh = time.time() - fetched_at < self.ttl
+        return UrlEntry(digest, etag, last_modified, source_size, fresh)
+
+    def get(self, digest: str, thumbnail_size: tuple) -> bytes:
+        """Devuelve el thumbnail de la imagen con ese hash, o None si no está"""
+        size_key = self._size_key(thumbnail_size)
+        try:
+            with open(self._blob_path(digest, size_key), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._db.execute(
+                'UPDATE blobs SET last_used = ? WHERE digest = ? AND thumb_size = ?',
+                (time.time(), digest, size_key)
+            )
+        return data
+
+    def put(self, digest: str, thumbnail_size: tuple, thumbnail: bytes):
+        """Guarda un thumbnail bajo el hash de la imagen original"""
+        size_key = self._size_key(thumbnail_size)
+        path = self._blob_path(digest, size_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Escritura atómica: otro proceso nunca ve un archivo a medias
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(thumbnail)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO blobs (digest, thumb_size, size, last_used) VALUES (?, ?, ?, ?)',
+                (digest, size_key, len(thumbnail), time.time())
+            )
+        self._evict()
+
+    def link(self, url: str, thumbnail_size: tuple, digest: str,
+             etag: str = None, last_modified: str = None, source_size: int = 0):
+        """Asocia la URL (con sus validadores) al hash de la imagen y renueva su frescura"""
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO urls '
+                '(url, thumb_size, digest, etag, last_modified, source_size, fetched_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (url, self._size_key(thumbnail_size), digest, etag, last_modified,
+                 source_size, time.time())
+            )
+
+    def record(self, **deltas):
+        """Suma a los contadores compartidos (hits, misses, bytes_saved, ...)"""
+        with self._lock:
+            self._db.executemany(
+                'UPDATE counters SET value = value + ? WHERE name = ?',
+                [(value, name) for name, value in deltas.items() if value]
+            )
+
+    def _evict(self):
+        """Desaloja los thumbnails menos usados hasta quedar bajo el tope"""
+        with self._lock:
+            total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM blobs').fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            target = int(self.max_bytes * LOW_WATERMARK)
+            victims = []
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                for digest, size_key, size in self._db.execute(
+                    'SELECT digest, thumb_size, size FROM blobs ORDER BY last_used'
+                ).fetchall():
+                    if total <= target:
+                        break
+                    victims.append((digest, size_key))
+                    total -= size
+                self._db.executemany(
+                    'DELETE FROM blobs WHERE digest = ? AND thumb_size = ?', victims
+                )
+                self._db.executemany(
+                    'DELETE FROM urls WHERE digest = ? AND thumb_size = ?', victims
+                )
+                self._db.execute(
+                    "UPDATE counters SET value = value + ? WHERE name = 'evictions'",
+                    (len(victims),)
+                )
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+        for digest, size_key in victims:
+            try:
+                os.unlink(self._blob_path(digest, size_key))
+            except FileNotFoundError:
+                pass
+        logger.info(f"Cache de thumbnails: {len(victims)} entradas desalojadas")
+
+    def stats(self) -> dict:
+        """Contadores compartidos por todos los procesos que usan el directorio"""
+        with self._lock:
+            counters = dict(self._db.execute('SELECT name, value FROM counters').fetchall())
+            entries, size = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs'
+            ).fetchone()
+        served = counters['hits'] + counters['revalidated'] + counters['content_hits']
+        lookups = served + counters['misses']
+        return {
+            **counters,
+            'entries': entries,
+            'bytes': size,
+            'max_bytes': self.max_bytes,
+            'hit_ratio': round(served / lookups, 3) if lookups else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def configure_thumbnail_cache(directory: str, max_bytes: int):
+    """
+    Configura el cache del proceso. Se llama en el proceso principal y como
+    initializer de cada worker del pool; con directory vacío o max_bytes 0
+    queda deshabilitado.
+    """
+    global _cache, _cache_config
+    if _cache is not None:
+        _cache.close()
+    _cache = None
+    _cache_config = (directory, max_bytes) if directory and max_bytes > 0 else None
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    """Devuelve el cache del proceso, abriéndolo la primera vez (None si está deshabilitado)"""
+    global _cache
+    if _cache is None and _cache_config is not None:
+        _cache = ThumbnailCache(*_cache_config)
+    return _cache
@@ -0,0 +1,203 @@
+import time
+import asyncio
+import logging
+import aiohttp
+from urllib.parse import urljoin, urlparse
+
+logger = logging.getLogger(__name__)
+
+# Máximo de recursos a descargar por página
+MAX_RESOURCES = 100
+
+# Conexiones simultáneas en total y por host (similar a un navegador)
+LIMIT = 20
+LIMIT_PER_HOST = 6
+
+# Timeout por recurso en segundos
+RESOURCE_TIMEOUT = 10
+
+# Tamaño máximo a leer por recurso; el resto no se descarga
+MAX_RESOURCE_BYTES = 10 * 1024 * 1024
+
+# Tamaño de cada lectura al descargar
+CHUNK_SIZE = 64 * 1024
+
+# Cantidad de recursos más lentos que se informan
+SLOWEST = 5
+
+RESOURCE_TYPES = {'stylesheets': 'css', 'scripts': 'js', 'images': 'img'}
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+class ResourceTiming:
+    """
+    Tiempos de una descarga, en segundos desde el inicio de la cascada.
+    Los hooks de aiohttp completan dns y connect solo cuando la descarga
+    resuelve el nombre o abre una conexión nueva; si reutiliza una
+    conexión del pool quedan en None.
+    """
+    __slots__ = ('url', 'type', 'start', 'dns_start', 'dns_end', 'connect_start',
+                 'connect_end', 'headers', 'end', 'size', 'status', 'error')
+
+    def __init__(self, url: str, type_: str):
+        self.url = url
+        self.type = type_
+        self.start = self.dns_start = self.dns_end = None
+        self.connect_start = self.connect_end = self.headers = self.end = None
+        self.size = 0
+        self.status = None
+        self.error = None
+
+    @staticmethod
+    def _span(start, end):
+        return _ms(end - start) if start is not None and end is not None else None
+
+    def as_dict(self) -> dict:
+        return {
+            'url': self.url,
+            'type': self.type,
+            'status': self.status,
+            'start_ms': _ms(self.start),
+            'dns_ms': self._span(self.dns_start, self.dns_end),
+            'connect_ms': self._span(self.connect_start, self.connect_end),
+            'ttfb_ms': self._span(self.start, self.headers),
+            'download_ms': self._span(self.headers, self.end),
+            'total_ms': self._span(self.start, self.end),
+            'size_bytes': self.size,
+            **({'error': self.error} if self.error else {})
+        }
+
+def create_trace_config(origin: float) -> aiohttp.TraceConfig:
+    """
+    Hooks de aiohttp que anotan en el ResourceTiming pasado como
+    trace_request_ctx el inicio, la resolución DNS, la conexión y la
+    llegada de los headers de cada descarga.
+    """
+    def mark(attribute):
+        async def hook(session, context, params):
+            timing = context.trace_request_ctx
+            if timing is not None and getattr(timing, attribute) is None:
+                setattr(timing, attribute, time.perf_counter() - origin)
+        return hook
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(mark('start'))
+    trace_config.on_dns_resolvehost_start.append(mark('dns_start'))
+    trace_config.on_dns_resolvehost_end.append(mark('dns_end'))
+    trace_config.on_connection_create_start.append(mark('connect_start'))
+    trace_config.on_connection_create_end.append(mark('connect_end'))
+    trace_config.on_request_end.append(mark('headers'))
+    return trace_config
+
+def collect_resources(base_url: str, resources: dict, limit: int = MAX_RESOURCES) -> list:
+    """
+    Resuelve las URLs del inventario contra la página y descarta las
+    repetidas y las que no son HTTP (data:, javascript:, ...).
+
+    Returns:
+        Lista de ResourceTiming en el orden del documento
+    """
+    timings = []
+    seen = set()
+    for kind, type_ in RESOURCE_TYPES.items():
+        for src in resources.get(kind) or ():
+            url = urljoin(base_url, src)
+            if urlparse(url).scheme not in ('http', 'https') or url in seen:
+                continue
+            seen.add(url)
+            timings.append(ResourceTiming(url, type_))
+            if len(timings) >= limit:
+                return timings
+    return timings
+
+async def _fetch(session: aiohttp.ClientSession, timing: ResourceTiming, origin: float,
+                 max_bytes: int):
+    """Descarga un recurso contando los bytes sin guardarlos"""
+    try:
+        async with session.get(timing.url, trace_request_ctx=timing) as response:
+            timing.status = response.status
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                timing.size += len(chunk)
+                if timing.size >= max_bytes:
+                    timing.error = 'Recurso truncado'
+                    break
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        timing.error = str(e) or type(e).__name__
+    except asyncio.CancelledError:
+        timing.error = 'Cancelado por deadline'
+        raise
+    finally:
+        timing.end = time.perf_counter() - origin
+        if timing.start is None:
+            timing.start = timing.end
+
+async def measure_waterfall(base_url: str, resources: dict, limit: int = LIMIT,
+                            limit_per_host: int = LIMIT_PER_HOST,
+                            timeout: float = RESOURCE_TIMEOUT,
+                            max_resources: int = MAX_RESOURCES,
+                            max_bytes: int = MAX_RESOURCE_BYTES,
+                            document_ms: float = 0, document_bytes: int = 0,
+                            budget: float = None) -> dict:
+    """
+    Descarga en paralelo los recursos de la página sobre un pool de
+    conexiones acotado (en total y por host) y mide cada descarga.
+
+    Args:
+        base_url: URL de la página, para resolver las URLs relativas
+        resources: Inventario con stylesheets, scripts e images
+        limit: Conexiones simultáneas en total
+        limit_per_host: Conexiones simultáneas por host
+        timeout: Timeout por recurso en segundos
+        max_resources: Máximo de recursos a descargar
+        max_bytes: Máximo de bytes a leer por recurso
+        document_ms: Tiempo de carga del documento, que precede a los recursos
+        document_bytes: Tamaño del documento
+        budget: Segundos para toda la cascada; al vencer se cancelan las
+            descargas pendientes y se informan como fallidas
+
+    Returns:
+        Dict con la cascada compacta: cantidad de recursos, bytes
+        transferidos (documento incluido), duración del camino crítico
+        y los recursos más lentos
+    """
+    timings = collect_resources(base_url, resources, max_resources)
+    if not timings:
+        return {'resources': 0, 'failed': 0, 'transfer_bytes': document_bytes,
+                'critical_path_ms': _ms(document_ms / 1000), 'slowest': []}
+
+    origin = time.perf_counter()
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host, ssl=False)
+    async with aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=timeout),
+        headers={'User-Agent': 'Mozilla/5.0'},
+        trace_configs=[create_trace_config(origin)]
+    ) as session:
+        tasks = [asyncio.ensure_future(_fetch(session, t, origin, max_bytes)) for t in timings]
+        _, pending = await asyncio.wait(tasks, timeout=budget)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    # Una tarea cancelada antes de entrar en _fetch queda sin tiempos
+    for t in timings:
+        if t.end is None:
+            t.error = t.error or 'Cancelado por deadline'
+    measured = [t for t in timings if t.start is not None and t.end is not None]
+
+    slowest = sorted(measured, key=lambda t: t.end - t.start, reverse=True)[:SLOWEST]
+    failed = sum(1 for t in timings if t.error or (t.status or 0) >= 400)
+    return {
+        'resources': len(timings),
+        'failed': failed,
+        'transfer_bytes': document_bytes + sum(t.size for t in timings),
+        # Todos los recursos salen en paralelo después del documento, así que
+        # el camino crítico es el documento más el recurso que termina último
+        'critical_path_ms': _ms(document_ms / 1000 + max((t.end for t in measured), default=0)),
+        'slowest': [t.as_dict() for t in slowest]
+    }
+
+def run_waterfall(base_url: str, resources: dict, **kwargs) -> dict:
+    """Versión sincrónica de measure_waterfall para los workers del pool"""
+    return asyncio.run(measure_waterfall(base_url, resources, **kwargs))
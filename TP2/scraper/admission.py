@@ -0,0 +1,156 @@
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+# Límites del Retry-After sugerido, en segundos
+MIN_RETRY_AFTER = 1
+MAX_RETRY_AFTER = 60
+
+# Peso de cada scrape nuevo en el promedio móvil de duración
+EWMA_ALPHA = 0.2
+
+class Overloaded(Exception):
+    """El servidor no admite más trabajo por ahora; reintentar en retry_after segundos"""
+
+    def __init__(self, message: str, retry_after: int = MIN_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class AdmissionControl:
+    """
+    Control de admisión: a lo sumo limit scrapes en curso y una cola de
+    espera acotada. Cuando la cola está llena, o un scrape espera más de
+    queue_timeout segundos, se rechaza con Overloaded en lugar de aceptar
+    todo y dejar que la latencia crezca sin límite.
+
+    Los lugares se entregan en orden de llegada. El Retry-After sugerido
+    se estima con el promedio móvil de duración de los scrapes y la
+    cantidad de trabajo por delante.
+
+    Uso:
+        async with admission.slot():
+            ...
+    """
+
+    def __init__(self, limit: int = 50, max_queue: int = 100, queue_timeout: float = 10):
+        """
+        Args:
+            limit: Scrapes simultáneos; 0 desactiva el control
+            max_queue: Scrapes que pueden esperar lugar
+            queue_timeout: Segundos máximos de espera en la cola
+        """
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.running = 0
+        self._waiters = deque()
+        self._avg_duration = None
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Segundos estimados hasta que se libere lugar para un scrape más"""
+        if not self._avg_duration or not self.enabled:
+            return MIN_RETRY_AFTER
+        waves = (self.queued + 1) / self.limit
+        return min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, math.ceil(self._avg_duration * waves)))
+
+    async def acquire(self):
+        """
+        Espera un lugar para un scrape.
+
+        Raises:
+            Overloaded: Si la cola está llena o la espera supera queue_timeout
+        """
+        if not self.enabled:
+            return
+        if self.running < self.limit and not self._waiters:
+            self.running += 1
+            self.admitted += 1
+            return
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            logger.warning(f"Scrape rechazado: {self.running} en curso y {self.queued} en espera")
+            raise Overloaded(f"Servidor sobrecargado: {self.running} scrapes en curso y "
+                             f"{self.queued} en espera", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                self.timed_out += 1
+                raise Overloaded(f"Servidor sobrecargado: sin lugar tras {self.queue_timeout}s "
+                                 f"de espera", self.retry_after())
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release()
+            raise
+        self.admitted += 1
+
+    def _abandon(self, waiter: asyncio.Future) -> bool:
+        """
+        Saca de la cola a quien dejó de esperar. Devuelve True si el lugar
+        ya le había sido entregado (y por lo tanto lo tiene que liberar o usar).
+        """
+        if waiter.done():
+            return True
+        waiter.cancel()
+        self._waiters.remove(waiter)
+        return False
+
+    def release(self, duration: float = None):
+        """
+        Libera el lugar de un scrape terminado, entregándoselo directamente
+        al primero de la cola si hay alguien esperando.
+        """
+        if not self.enabled:
+            return
+        if duration is not None:
+            self._avg_duration = duration if self._avg_duration is None else (
+                EWMA_ALPHA * duration + (1 - EWMA_ALPHA) * self._avg_duration
+            )
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.running -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        """Ocupa un lugar mientras dura el bloque y registra su duración"""
+        await self.acquire()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        """Contadores para el endpoint de estadísticas"""
+        return {
+            'limit': self.limit,
+            'running': self.running,
+            'queued': self.queued,
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'avg_duration_ms': round(self._avg_duration * 1000, 1) if self._avg_duration else None
+        }
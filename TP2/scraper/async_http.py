@@ -1,27 +1,185 @@
 import aiohttp
 import asyncio
+import codecs
 import logging
+import re
+import time
 from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
-async def fetch_html(url: str, timeout: int = 30) -> str:
+# Headers estándar para todas las descargas
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+# Tamaño máximo de una página; la descarga se corta apenas se supera
+MAX_PAGE_SIZE = 50 * 1024 * 1024
+
+# Tamaño de cada lectura del cuerpo de la respuesta
+CHUNK_SIZE = 64 * 1024
+
+# Bytes iniciales en los que se busca <meta charset> (como el prescan de HTML5)
+SNIFF_SIZE = 1024
+
+# Codificación si no la indican ni el header, ni un BOM, ni un <meta>
+DEFAULT_ENCODING = 'utf-8'
+
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+META_CHARSET = re.compile(
+    rb'<meta[^>]+?charset\s*=\s*["\']?\s*([a-zA-Z0-9_.:-]+)',
+    re.IGNORECASE
+)
+
+class PageTooLarge(ValueError):
+    """La página supera el tamaño máximo de descarga"""
+
+class StreamDecoder:
     """
-    Descarga el HTML de una URL de forma asíncrona usando aiohttp.
-    
+    Decodifica el cuerpo de una respuesta HTML a medida que llega.
+
+    La codificación se toma del charset del header Content-Type; si no lo
+    hay, de un BOM o de un <meta charset> en los primeros SNIFF_SIZE bytes
+    (se acumulan hasta tenerlos), y si no, se usa UTF-8. Los bytes inválidos
+    se reemplazan en lugar de abortar la descarga.
+    """
+
+    def __init__(self, charset: str = None):
+        self.encoding = None
+        self._decoder = None
+        self._pending = b''
+        if charset:
+            self._set_encoding(charset)
+
+    def _set_encoding(self, name: str) -> bool:
+        try:
+            encoding = codecs.lookup(name).name
+        except LookupError:
+            return False
+        self.encoding = encoding
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        return True
+
+    def _sniff(self):
+        for bom, encoding in BOMS:
+            if self._pending.startswith(bom):
+                self._set_encoding(encoding)
+                return
+        match = META_CHARSET.search(self._pending[:SNIFF_SIZE])
+        declared = match.group(1).decode('ascii').lower() if match else None
+        # Como en HTML5: un <meta> legible en ASCII no puede declarar UTF-16
+        if declared and declared.startswith(('utf-16', 'utf16')):
+            declared = 'utf-8'
+        if not (declared and self._set_encoding(declared)):
+            self._set_encoding(DEFAULT_ENCODING)
+
+    def feed(self, chunk: bytes) -> str:
+        """Devuelve el texto decodificable hasta el momento (puede ser vacío)"""
+        if self._decoder is None:
+            self._pending += chunk
+            if len(self._pending) < SNIFF_SIZE:
+                return ''
+            self._sniff()
+            chunk, self._pending = self._pending, b''
+        return self._decoder.decode(chunk)
+
+    def finish(self) -> str:
+        """Decodifica lo que quede pendiente al terminar la respuesta"""
+        if self._decoder is None:
+            self._sniff()
+        chunk, self._pending = self._pending, b''
+        return self._decoder.decode(chunk, final=True)
+
+class ConnectionStats:
+    """
+    Contadores de uso del pool de conexiones HTTP.
+    Se alimentan con los trace hooks de aiohttp y permiten confirmar
+    que los scrapes repetidos a un mismo dominio reutilizan conexiones.
+    """
+    def __init__(self):
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+    def to_dict(self) -> dict:
+        """Devuelve los contadores junto con el ratio de reutilización"""
+        total = self.connections_created + self.connections_reused
+        return {
+            'requests': self.requests,
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused,
+            'reuse_ratio': round(self.connections_reused / total, 3) if total else 0.0,
+            'dns_cache_hits': self.dns_cache_hits,
+            'dns_cache_misses': self.dns_cache_misses
+        }
+
+def _build_trace_config(stats: ConnectionStats) -> aiohttp.TraceConfig:
+    """Crea un TraceConfig que actualiza los contadores de stats"""
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_request_start(session, ctx, params):
+        stats.requests += 1
+
+    async def on_connection_create_end(session, ctx, params):
+        stats.connections_created += 1
+
+    async def on_connection_reuseconn(session, ctx, params):
+        stats.connections_reused += 1
+
+    async def on_dns_cache_hit(session, ctx, params):
+        stats.dns_cache_hits += 1
+
+    async def on_dns_cache_miss(session, ctx, params):
+        stats.dns_cache_misses += 1
+
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+    trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+    trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+    return trace_config
+
+def create_session(limit: int = 100, limit_per_host: int = 10,
+                   stats: ConnectionStats = None) -> aiohttp.ClientSession:
+    """
+    Crea una ClientSession con pool de conexiones pensada para ser compartida
+    entre todas las descargas (keep-alive, sesiones TLS y cache DNS).
+
     Args:
-        url: URL a descargar
-        timeout: Timeout en segundos (default: 30)
-    
+        limit: Máximo de conexiones simultáneas en total
+        limit_per_host: Máximo de conexiones simultáneas por host
+        stats: ConnectionStats opcional donde registrar reutilización y hits
+
     Returns:
-        Contenido HTML como string
-    
+        ClientSession lista para usar; quien la crea debe cerrarla
+    """
+    connector = aiohttp.TCPConnector(
+        limit=limit,
+        limit_per_host=limit_per_host,
+        ttl_dns_cache=300,  # Cache DNS por 5 minutos
+        enable_cleanup_closed=True
+    )
+    trace_configs = [_build_trace_config(stats)] if stats is not None else None
+    return aiohttp.ClientSession(
+        connector=connector,
+        headers=DEFAULT_HEADERS,
+        trace_configs=trace_configs
+    )
+
+def validate_url(url: str):
+    """
+    Valida que la URL sea http(s) y tenga dominio.
+
     Raises:
         ValueError: Si la URL es inválida
-        asyncio.TimeoutError: Si se excede el timeout
-        aiohttp.ClientError: Para otros errores de cliente
     """
-    # Validar que la URL sea válida
     try:
         parsed = urlparse(url)
         if not parsed.scheme in ('http', 'https'):
@@ -30,49 +188,163 @@ async def fetch_html(url: str, timeout: int = 30) -> str:
             raise ValueError(f"URL inválida: sin dominio")
     except Exception as e:
         raise ValueError(f"URL inválida: {str(e)}")
-    
+
+class FetchResult:
+    """
+    Resultado de una descarga con sus validadores HTTP de cache.
+    final_url es la URL después de seguir las redirecciones, contra la
+    que se resuelven los recursos relativos de la página.
+    """
+    def __init__(self, url: str, html: str = None, status: int = 200,
+                 etag: str = None, last_modified: str = None,
+                 size: int = 0, encoding: str = None,
+                 ttfb_ms: float = None, load_time_ms: float = None,
+                 final_url: str = None):
+        self.url = url
+        self.final_url = final_url or url
+        self.html = html
+        self.status = status
+        self.etag = etag
+        self.last_modified = last_modified
+        self.size = size
+        self.encoding = encoding
+        self.ttfb_ms = ttfb_ms
+        self.load_time_ms = load_time_ms
+
+    @property
+    def not_modified(self) -> bool:
+        """True si el origen respondió 304 a un GET condicional"""
+        return self.status == 304
+
+async def read_body(response: aiohttp.ClientResponse, url: str, max_size: int,
+                    parser=None, keep_html: bool = True) -> tuple:
+    """
+    Lee el cuerpo por chunks, decodificándolo de forma incremental.
+    Corta apenas el tamaño declarado o leído supera max_size, así la memoria
+    por descarga queda acotada aunque el origen mande gigabytes.
+
+    Returns:
+        Tupla (html o None, bytes leídos, codificación)
+
+    Raises:
+        PageTooLarge: Si la página supera max_size
+    """
+    if response.content_length is not None and response.content_length > max_size:
+        raise PageTooLarge(f"Página demasiado grande ({response.content_length} bytes): {url}")
+
+    decoder = StreamDecoder(response.charset)
+    parts = [] if keep_html else None
+    size = 0
+
+    def emit(text: str):
+        if text:
+            if parser is not None:
+                parser.feed(text)
+            if parts is not None:
+                parts.append(text)
+
+    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+        size += len(chunk)
+        if size > max_size:
+            raise PageTooLarge(f"Página demasiado grande (más de {max_size} bytes): {url}")
+        emit(decoder.feed(chunk))
+    emit(decoder.finish())
+
+    return (''.join(parts) if parts is not None else None), size, decoder.encoding
+
+async def fetch_page(url: str, timeout: int = 30, session: aiohttp.ClientSession = None,
+                     etag: str = None, last_modified: str = None,
+                     max_size: int = MAX_PAGE_SIZE, parser=None,
+                     keep_html: bool = True) -> FetchResult:
+    """
+    Descarga una página de forma asíncrona usando aiohttp.
+    Si se indican validadores (etag / last_modified) hace un GET condicional
+    y el resultado puede ser 304 sin contenido.
+
+    El cuerpo se lee en streaming con un tope duro de tamaño. Con parser
+    (cualquier objeto con feed(str), p. ej. PageExtractor) cada chunk
+    decodificado se le pasa apenas llega, así el parseo se superpone con la
+    descarga; con keep_html=False además no se guarda el HTML completo.
+
+    Args:
+        url: URL a descargar
+        timeout: Timeout en segundos (default: 30)
+        session: ClientSession compartida (ver create_session). Si no se
+            indica, se crea una sesión temporal sólo para esta descarga.
+        etag: ETag de una respuesta anterior (If-None-Match)
+        last_modified: Last-Modified de una respuesta anterior (If-Modified-Since)
+        max_size: Tamaño máximo en bytes (default: 50MB)
+        parser: Parser incremental al que se le pasa el HTML por chunks
+        keep_html: Si es False, FetchResult.html queda en None
+
+    Returns:
+        FetchResult con el HTML y los validadores de la respuesta
+
+    Raises:
+        PageTooLarge: Si la página supera max_size
+        ValueError: Si la URL es inválida
+        asyncio.TimeoutError: Si se excede el timeout
+        aiohttp.ClientError: Para otros errores de cliente
+    """
+    # Validar que la URL sea válida
+    validate_url(url)
+
     # Configurar timeout
     timeout_config = aiohttp.ClientTimeout(total=timeout)
-    
-    # Configurar conector con límites
-    connector = aiohttp.TCPConnector(
-        limit=100,  # Máximo 100 conexiones simultáneas
-        limit_per_host=10,  # Máximo 10 por host
-        ttl_dns_cache=300,  # Cache DNS por 5 minutos
-        enable_cleanup_closed=True
-    )
-    
+
+    headers = dict(DEFAULT_HEADERS)
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    owns_session = session is None
+    if owns_session:
+        session = create_session()
+
     try:
-        async with aiohttp.ClientSession(
-            connector=connector,
-            timeout=timeout_config
-        ) as session:
-            # Headers estándar
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            
-            async with session.get(url, headers=headers, ssl=False) as response:
-                # Verificar status code
-                if response.status == 404:
-                    raise ValueError(f"Página no encontrada (404): {url}")
-                elif response.status == 403:
-                    raise ValueError(f"Acceso denegado (403): {url}")
-                elif response.status >= 400:
-                    raise ValueError(f"Error HTTP {response.status}: {url}")
-                
-                response.raise_for_status()
-                
-                # Limitar tamaño del contenido (máximo 50MB)
-                max_size = 50 * 1024 * 1024
-                content = await response.text()
-                
-                if len(content.encode('utf-8')) > max_size:
-                    logger.warning(f"Contenido muy grande ({len(content)} bytes) para {url}")
-                
-                logger.info(f"HTML descargado exitosamente de {url} ({len(content)} bytes)")
-                return content
-    
+        start = time.perf_counter()
+        async with session.get(url, headers=headers, timeout=timeout_config, ssl=False) as response:
+            ttfb_ms = (time.perf_counter() - start) * 1000
+            if response.status == 304 and (etag or last_modified):
+                logger.info(f"Contenido sin cambios (304) para {url}")
+                return FetchResult(
+                    url,
+                    status=304,
+                    etag=response.headers.get('ETag', etag),
+                    last_modified=response.headers.get('Last-Modified', last_modified)
+                )
+
+            # Verificar status code
+            if response.status == 404:
+                raise ValueError(f"Página no encontrada (404): {url}")
+            elif response.status == 403:
+                raise ValueError(f"Acceso denegado (403): {url}")
+            elif response.status >= 400:
+                raise ValueError(f"Error HTTP {response.status}: {url}")
+
+            response.raise_for_status()
+
+            content, size, encoding = await read_body(response, url, max_size, parser, keep_html)
+            load_time_ms = (time.perf_counter() - start) * 1000
+
+            logger.info(f"HTML descargado exitosamente de {url} ({size} bytes, {encoding})")
+            return FetchResult(
+                url,
+                html=content,
+                status=response.status,
+                etag=response.headers.get('ETag'),
+                last_modified=response.headers.get('Last-Modified'),
+                size=size,
+                encoding=encoding,
+                ttfb_ms=round(ttfb_ms, 1),
+                load_time_ms=round(load_time_ms, 1),
+                final_url=str(response.url)
+            )
+
+    except PageTooLarge as e:
+        logger.error(str(e))
+        raise
     except asyncio.TimeoutError:
         logger.error(f"Timeout descargando {url}")
         raise asyncio.TimeoutError(f"Timeout descargando {url}")
@@ -86,4 +358,26 @@ async def fetch_html(url: str, timeout: int = 30) -> str:
         logger.error(f"Error de cliente aiohttp: {e}")
         raise ValueError(f"Error descargando {url}: {str(e)}")
     finally:
-        await connector.close()
+        if owns_session:
+            await session.close()
+
+async def fetch_html(url: str, timeout: int = 30, session: aiohttp.ClientSession = None) -> str:
+    """
+    Descarga el HTML de una URL de forma asíncrona usando aiohttp.
+
+    Args:
+        url: URL a descargar
+        timeout: Timeout en segundos (default: 30)
+        session: ClientSession compartida (ver create_session). Si no se
+            indica, se crea una sesión temporal sólo para esta descarga.
+
+    Returns:
+        Contenido HTML como string
+
+    Raises:
+        ValueError: Si la URL es inválida
+        asyncio.TimeoutError: Si se excede el timeout
+        aiohttp.ClientError: Para otros errores de cliente
+    """
+    result = await fetch_page(url, timeout=timeout, session=session)
+    return result.html
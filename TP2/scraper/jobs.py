@@ -0,0 +1,192 @@
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from common.tracing import Trace
+
+logger = logging.getLogger(__name__)
+
+# Etapas de un trabajo, en el orden en que suelen completarse
+STAGES = ('scraping', 'performance', 'thumbnails', 'screenshot')
+
+# Estados de un trabajo y de cada etapa
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+class JobStoreFull(Exception):
+    """No hay lugar para otro trabajo: todos los guardados siguen en curso"""
+
+class Job:
+    """
+    Trabajo de scraping asíncrono. Los resultados se van completando por
+    etapa: primero los datos de scraping y después cada tarea del
+    Servidor B a medida que termina. Cada trabajo tiene su propia traza.
+    """
+
+    def __init__(self, url: str, webhook: str = None, client: str = None):
+        self.id = uuid.uuid4().hex
+        self.url = url
+        self.webhook = webhook
+        self.client = client
+        self.status = PENDING
+        self.stages = {stage: PENDING for stage in STAGES}
+        self.timestamp = None
+        self.scraping_data = None
+        self.processing_data = {}
+        self.error = None
+        self.webhook_status = None
+        self.trace = Trace(name='job')
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def start(self):
+        self.status = RUNNING
+        self.updated_at = time.time()
+
+    def stage_done(self, stage: str, result=None):
+        """Guarda el resultado de una etapa"""
+        if stage == 'scraping':
+            self.scraping_data = result
+        else:
+            self.processing_data[stage] = result
+        self.stages[stage] = DONE
+        self.updated_at = time.time()
+
+    def stage_failed(self, stage: str, error: str):
+        self.processing_data[stage] = {'error': error}
+        self.stages[stage] = FAILED
+        self.updated_at = time.time()
+
+    def complete(self, response: dict = None):
+        """
+        Marca el trabajo como terminado. Con response (por ejemplo, desde
+        la cache de resultados) se completan todas las etapas de una vez.
+        """
+        if response is not None:
+            self.timestamp = response.get('timestamp')
+            self.stage_done('scraping', response.get('scraping_data'))
+            for stage, result in (response.get('processing_data') or {}).items():
+                if stage in self.stages:
+                    self.stage_done(stage, result)
+        self.status = DONE
+        self.updated_at = time.time()
+
+    def fail(self, error: str):
+        """Marca el trabajo como fallido; las etapas pendientes quedan fallidas"""
+        self.error = error
+        self.status = FAILED
+        for stage, status in self.stages.items():
+            if status in (PENDING, RUNNING):
+                self.stages[stage] = FAILED
+        self.updated_at = time.time()
+
+    def to_dict(self) -> dict:
+        data = {
+            'job_id': self.id,
+            'url': self.url,
+            'status': self.status,
+            'stages': dict(self.stages),
+            'timestamp': self.timestamp,
+            'scraping_data': self.scraping_data,
+            'processing_data': dict(self.processing_data),
+            'trace_id': self.trace.id,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+        if self.error:
+            data['error'] = self.error
+        if self.webhook:
+            data['webhook'] = {'url': self.webhook, 'status': self.webhook_status}
+        return data
+
+class JobStore:
+    """
+    Almacén en memoria de trabajos asíncronos, acotado en cantidad.
+    Los trabajos terminados vencen ttl segundos después de su última
+    actualización; si se llega al tope se descartan primero los terminados
+    más viejos. Los trabajos en curso nunca se descartan.
+    """
+
+    def __init__(self, max_jobs: int = 1000, ttl: float = 600):
+        """
+        Args:
+            max_jobs: Cantidad máxima de trabajos guardados
+            ttl: Segundos que se conserva un trabajo terminado
+        """
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self._jobs = OrderedDict()
+        self.created = 0
+        self.completed = 0
+        self.failed = 0
+        self.expired = 0
+        self.rejected = 0
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def create(self, url: str, webhook: str = None, client: str = None) -> Job:
+        """
+        Crea y guarda un trabajo nuevo.
+
+        Raises:
+            JobStoreFull: Si el almacén está lleno de trabajos en curso
+        """
+        self.expire()
+        if len(self._jobs) >= self.max_jobs:
+            for job_id, job in self._jobs.items():
+                if job.finished:
+                    del self._jobs[job_id]
+                    self.expired += 1
+                    break
+            else:
+                self.rejected += 1
+                raise JobStoreFull(f"Máximo de {self.max_jobs} trabajos en curso")
+
+        job = Job(url, webhook, client)
+        self._jobs[job.id] = job
+        self.created += 1
+        return job
+
+    def get(self, job_id: str) -> Job:
+        """Devuelve el trabajo, o None si no existe o ya venció"""
+        self.expire()
+        return self._jobs.get(job_id)
+
+    def finished(self, job: Job):
+        """Registra que el trabajo terminó (lo pasa al final del orden de vencimiento)"""
+        if job.status == DONE:
+            self.completed += 1
+        else:
+            self.failed += 1
+        if job.id in self._jobs:
+            self._jobs.move_to_end(job.id)
+
+    def expire(self):
+        """Descarta los trabajos terminados cuyo TTL venció"""
+        limit = time.time() - self.ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished and job.updated_at < limit]
+        for job_id in expired:
+            del self._jobs[job_id]
+        self.expired += len(expired)
+
+    def stats(self) -> dict:
+        """Contadores para el endpoint de estadísticas"""
+        running = sum(1 for job in self._jobs.values() if not job.finished)
+        return {
+            'stored': len(self._jobs),
+            'running': running,
+            'max_jobs': self.max_jobs,
+            'created': self.created,
+            'completed': self.completed,
+            'failed': self.failed,
+            'expired': self.expired,
+            'rejected': self.rejected
+        }
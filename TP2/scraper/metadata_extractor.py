@@ -3,6 +3,37 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Meta tags estándar
+STANDARD_NAMES = [
+    'description',
+    'keywords',
+    'author',
+    'viewport',
+    'charset',
+    'robots',
+    'language'
+]
+
+# Open Graph tags
+OG_TAGS = [
+    'og:title',
+    'og:description',
+    'og:image',
+    'og:url',
+    'og:type',
+    'og:site_name'
+]
+
+# Twitter Card tags
+TWITTER_TAGS = [
+    'twitter:card',
+    'twitter:title',
+    'twitter:description',
+    'twitter:image'
+]
+
+ALL_META_NAMES = STANDARD_NAMES + OG_TAGS + TWITTER_TAGS
+
 def extract_metadata(html: str) -> dict:
     """
     Extrae meta tags relevantes (description, keywords, Open Graph).
@@ -22,48 +53,17 @@ def extract_metadata(html: str) -> dict:
     try:
         soup = BeautifulSoup(html, 'lxml')
         
-        # Meta tags estándar
-        standard_names = [
-            'description',
-            'keywords',
-            'author',
-            'viewport',
-            'charset',
-            'robots',
-            'language'
-        ]
-        
-        # Open Graph tags
-        og_tags = [
-            'og:title',
-            'og:description',
-            'og:image',
-            'og:url',
-            'og:type',
-            'og:site_name'
-        ]
-        
-        # Twitter Card tags
-        twitter_tags = [
-            'twitter:card',
-            'twitter:title',
-            'twitter:description',
-            'twitter:image'
-        ]
-        
-        all_meta_names = standard_names + og_tags + twitter_tags
-        
         for tag in soup.find_all('meta'):
             # Buscar por atributo 'name'
             name = tag.get('name')
-            if name and name.lower() in [m.lower() for m in all_meta_names]:
+            if name and name.lower() in ALL_META_NAMES:
                 content = tag.get('content', '').strip()
                 if content:
                     meta_tags[name.lower()] = content
             
             # Buscar por atributo 'property' (para Open Graph)
             prop = tag.get('property')
-            if prop and prop.lower() in [m.lower() for m in all_meta_names]:
+            if prop and prop.lower() in ALL_META_NAMES:
                 content = tag.get('content', '').strip()
                 if content:
                     meta_tags[prop.lower()] = content
@@ -0,0 +1,135 @@
+import time
+import logging
+from aiohttp import web
+from common.metrics import Registry, CONTENT_TYPE
+from common.processing_cluster import CLOSED
+
+logger = logging.getLogger(__name__)
+
+# Etapas del pipeline de scraping que se miden
+STAGES = ('fetch_html', 'parse_html', 'processing')
+
+class ScrapingMetrics:
+    """
+    Métricas del Servidor A. Las etapas del pipeline y las solicitudes
+    HTTP se miden al pasar; el estado de colas, pools y caches se lee de
+    los stats de cada componente recién al exportar.
+    """
+
+    def __init__(self, app: web.Application):
+        self.registry = registry = Registry()
+        stages = registry.histogram(
+            'tp2_stage_duration_seconds', 'Duración de cada etapa del scraping', ['stage']
+        )
+        # Referencias directas a cada etapa para no buscar el label en cada scrape
+        self.fetch_html = stages.labels('fetch_html')
+        self.parse_html = stages.labels('parse_html')
+        self.processing = stages.labels('processing')
+
+        self.http_duration = registry.histogram(
+            'tp2_http_request_duration_seconds', 'Duración de las solicitudes HTTP por ruta', ['route']
+        )
+        self.http_requests = registry.counter(
+            'tp2_http_requests_total', 'Solicitudes HTTP atendidas', ['route', 'status']
+        )
+        self.http_in_flight = registry.gauge(
+            'tp2_http_requests_in_flight', 'Solicitudes HTTP en curso'
+        )
+        self.http_bytes = registry.counter(
+            'tp2_http_bytes_total', 'Bytes de las solicitudes HTTP de los clientes', ['direction']
+        )
+        self.http_bytes_in = self.http_bytes.labels('in')
+        self.http_bytes_out = self.http_bytes.labels('out')
+        self.origin_bytes = registry.counter(
+            'tp2_origin_bytes_total', 'Bytes descargados de los sitios scrapeados'
+        )
+
+        registry.gauge_callback(
+            'tp2_scrapes_in_flight', 'Scrapes admitidos en curso',
+            lambda: app['admission'].running
+        )
+        registry.gauge_callback(
+            'tp2_scrapes_queued', 'Scrapes esperando lugar en el control de admisión',
+            lambda: app['admission'].queued
+        )
+        registry.counter_callback(
+            'tp2_scrapes_rejected_total', 'Scrapes rechazados por sobrecarga',
+            lambda: app['admission'].rejected + app['admission'].timed_out
+        )
+        registry.gauge_callback(
+            'tp2_parse_queue_depth', 'Parseos esperando o corriendo en el pool de procesos',
+            lambda: app['parse_pool'].queue_depth
+        )
+        registry.gauge_callback(
+            'tp2_processing_in_flight', 'Solicitudes en vuelo hacia cada Servidor B',
+            lambda: {(e.address,): e.pool.in_flight for e in app['processing_pool'].endpoints},
+            ['endpoint']
+        )
+        registry.gauge_callback(
+            'tp2_processing_up', '1 si el Servidor B está en el reparto (sano y con el circuito cerrado)',
+            lambda: {(e.address,): int(e.healthy and e.breaker.state == CLOSED)
+                     for e in app['processing_pool'].endpoints},
+            ['endpoint']
+        )
+        registry.counter_callback(
+            'tp2_processing_bytes_total', 'Bytes intercambiados con los Servidores B',
+            lambda: self._processing_bytes(app), ['direction']
+        )
+        registry.gauge_callback(
+            'tp2_jobs_running', 'Trabajos asíncronos en curso',
+            lambda: app['jobs'].stats()['running']
+        )
+        registry.counter_callback(
+            'tp2_cache_lookups_total', 'Consultas a la cache de resultados por resultado',
+            lambda: self._cache_lookups(app), ['result']
+        )
+
+    @staticmethod
+    def _processing_bytes(app: web.Application) -> dict:
+        endpoints = app['processing_pool'].endpoints
+        return {
+            ('out',): sum(e.pool.bytes_sent for e in endpoints),
+            ('in',): sum(e.pool.bytes_received for e in endpoints)
+        }
+
+    @staticmethod
+    def _cache_lookups(app: web.Application) -> dict:
+        stats = app['result_cache'].stats()
+        return {(result,): stats[result] for result in ('hits', 'misses', 'revalidations', 'refetches')}
+
+def _response_size(response: web.StreamResponse) -> int:
+    """Bytes del cuerpo: lo ya escrito si es streaming, o el cuerpo armado"""
+    if response.prepared:
+        return response.body_length
+    body = getattr(response, 'body', None)
+    return len(body) if isinstance(body, (bytes, bytearray)) else 0
+
+@web.middleware
+async def metrics_middleware(request: web.Request, handler):
+    """Mide duración, status y bytes de cada solicitud HTTP"""
+    metrics = request.app['metrics']
+    route = request.match_info.route.resource
+    route = route.canonical if route is not None else 'unmatched'
+    metrics.http_in_flight.inc()
+    metrics.http_bytes_in.inc(request.content_length or 0)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        metrics.http_bytes_out.inc(_response_size(response))
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        metrics.http_in_flight.dec()
+        metrics.http_duration.labels(route).observe(time.perf_counter() - start)
+        metrics.http_requests.labels(route, str(status)).inc()
+
+async def metrics_handler(request: web.Request):
+    """Endpoint /metrics en formato de texto de Prometheus"""
+    return web.Response(
+        body=request.app['metrics'].registry.render().encode('utf-8'),
+        headers={'Content-Type': CONTENT_TYPE}
+    )
@@ -0,0 +1,172 @@
+from lxml import etree
+import logging
+from scraper.metadata_extractor import ALL_META_NAMES
+
+logger = logging.getLogger(__name__)
+
+HEADING_TAGS = {f'h{i}' for i in range(1, 7)}
+META_NAMES = frozenset(ALL_META_NAMES)
+
+def _empty_result(error: str = None) -> dict:
+    """Resultado vacío con la misma forma que parse_html + meta_tags"""
+    result = {
+        'title': '',
+        'links': [],
+        'images_count': 0,
+        'structure': {f'h{i}': 0 for i in range(1, 7)},
+        'meta_tags': {}
+    }
+    if error:
+        result['error'] = error
+    return result
+
+class PageExtractor:
+    """
+    Extractor de una sola pasada basado en los eventos SAX del parser HTML
+    de lxml. No construye árbol: título, links, imágenes, headers y meta tags
+    se completan a medida que llegan los eventos de inicio de tag.
+
+    Admite alimentación incremental con feed() para procesar el HTML por
+    chunks mientras se descarga.
+
+    Con collect_resources=True también arma el inventario de recursos
+    (hojas de estilo, scripts e imágenes) bajo la clave 'resources', que el
+    Servidor B usa para el análisis de rendimiento sin volver a descargar
+    ni parsear la página.
+    """
+
+    def __init__(self, collect_resources: bool = False):
+        self.resources = {'stylesheets': [], 'scripts': [], 'images': []} if collect_resources else None
+        self.title = None
+        self.links = []
+        self.images_count = 0
+        self.structure = {f'h{i}': 0 for i in range(1, 7)}
+        self.meta_tags = {}
+        self._title_parts = None
+        self._parser = etree.HTMLParser(target=self, recover=True)
+        self._fed = False
+
+    # Eventos del parser (interfaz target de lxml)
+
+    def start(self, tag, attrib):
+        if tag == 'a':
+            href = attrib.get('href')
+            if href is not None:
+                href = href.strip()
+                if href and not href.startswith('#'):  # Ignorar anchors
+                    self.links.append(href)
+        elif tag == 'img':
+            self.images_count += 1
+            if self.resources is not None and attrib.get('src'):
+                self.resources['images'].append(attrib['src'].strip())
+        elif tag in HEADING_TAGS:
+            self.structure[tag] += 1
+        elif tag == 'meta':
+            self._add_meta(attrib)
+        elif tag == 'title' and self.title is None:
+            self._title_parts = []
+        elif self.resources is not None:
+            if tag == 'script' and attrib.get('src'):
+                self.resources['scripts'].append(attrib['src'].strip())
+            elif (tag == 'link' and attrib.get('href')
+                    and 'stylesheet' in (attrib.get('rel') or '').lower().split()):
+                self.resources['stylesheets'].append(attrib['href'].strip())
+
+    def end(self, tag):
+        if tag == 'title' and self._title_parts is not None:
+            self.title = ''.join(self._title_parts).strip()
+            self._title_parts = None
+
+    def data(self, data):
+        if self._title_parts is not None:
+            self._title_parts.append(data)
+
+    def comment(self, text):
+        pass
+
+    def close(self):
+        return self.result()
+
+    def _add_meta(self, attrib):
+        content = (attrib.get('content') or '').strip()
+        if not content:
+            return
+        for key in ('name', 'property'):
+            value = attrib.get(key)
+            if value and value.lower() in META_NAMES:
+                self.meta_tags[value.lower()] = content
+
+    # API pública
+
+    def feed(self, chunk):
+        """Alimenta el parser con un fragmento de HTML (str o bytes)"""
+        if chunk:
+            self._fed = True
+            self._parser.feed(chunk)
+
+    def finish(self) -> dict:
+        """Cierra el parser y devuelve el resultado consolidado"""
+        if not self._fed:
+            return _empty_result('HTML inválido')
+        return self._parser.close()
+
+    def result(self) -> dict:
+        """Resultado con las mismas claves que parse_html más meta_tags"""
+        if self._title_parts is not None:
+            # Documento truncado dentro de <title>
+            self.title = ''.join(self._title_parts).strip()
+            self._title_parts = None
+        result = {
+            'title': self.title or '',
+            'links': self.links,
+            'images_count': self.images_count,
+            'structure': self.structure,
+            'meta_tags': self.meta_tags
+        }
+        if self.resources is not None:
+            result['resources'] = self.resources
+        return result
+
+def extract_page(html: str, resources: bool = False) -> dict:
+    """
+    Extrae título, links, imágenes, headers y meta tags en una sola pasada.
+    Equivale a parse_html(html) con 'meta_tags' = extract_metadata(html),
+    pero sin construir el árbol BeautifulSoup ni recorrerlo varias veces.
+
+    Args:
+        html: Contenido HTML como string
+        resources: Si es True agrega el inventario de recursos ('resources')
+
+    Returns:
+        Dict con estructura de la página y meta tags
+    """
+    if not html or not isinstance(html, str):
+        logger.error("HTML inválido")
+        return _empty_result('HTML inválido')
+
+    try:
+        extractor = PageExtractor(collect_resources=resources)
+        extractor.feed(html)
+    except Exception as e:
+        logger.error(f"Error parseando HTML: {e}")
+        return _empty_result(str(e))
+    return finish_page(extractor)
+
+def finish_page(extractor: PageExtractor) -> dict:
+    """
+    Cierra un PageExtractor alimentado por chunks (p. ej. durante la
+    descarga con fetch_page(parser=...)) y devuelve el mismo resultado
+    que extract_page.
+    """
+    try:
+        result = extractor.finish()
+
+        logger.info(
+            f"HTML parseado: {len(result['links'])} links, {result['images_count']} imágenes, "
+            f"{len(result['meta_tags'])} meta tags, título: '{result['title']}'"
+        )
+        return result
+
+    except Exception as e:
+        logger.error(f"Error parseando HTML: {e}")
+        return _empty_result(str(e))
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+from scraper.page_extractor import extract_page
+
+logger = logging.getLogger(__name__)
+
+class ParsePool:
+    """
+    Ejecuta la extracción HTML en un pool de procesos para no bloquear el
+    event loop con páginas grandes.
+
+    - Las páginas más chicas que inline_threshold se parsean en el propio
+      event loop: el costo de IPC superaría al del parseo.
+    - Un semáforo limita cuántos trabajos se envían al pool a la vez
+      (back-pressure); el resto espera en cola sin acumular memoria en el
+      executor.
+    """
+
+    def __init__(self, workers: int = 4, inline_threshold: int = 256 * 1024,
+                 max_pending: int = None):
+        """
+        Args:
+            workers: Procesos del pool. Con 0 todo se parsea inline.
+            inline_threshold: Tamaño (caracteres) por debajo del cual no se usa el pool
+            max_pending: Trabajos simultáneos en el pool (default: 2 por worker)
+        """
+        self.workers = workers
+        self.inline_threshold = inline_threshold
+        self.max_pending = max_pending or max(1, workers * 2)
+        self._executor = ProcessPoolExecutor(max_workers=workers) if workers > 0 else None
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self.waiting = 0
+        self.running = 0
+        self.max_queue_depth = 0
+        self.inline_parses = 0
+        self.pool_parses = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Trabajos esperando lugar en el pool más los que están en él"""
+        return self.waiting + self.running
+
+    async def parse(self, html: str, resources: bool = False) -> dict:
+        """
+        Extrae los datos de la página (mismo resultado que extract_page).
+
+        Args:
+            html: Contenido HTML como string
+            resources: Si es True incluye el inventario de recursos
+        """
+        if self._executor is None or not html or len(html) < self.inline_threshold:
+            self.inline_parses += 1
+            return extract_page(html, resources)
+
+        self.waiting += 1
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                self._executor, partial(extract_page, html, resources)
+            )
+            self.pool_parses += 1
+            return result
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        """Estado del pool para el endpoint de estadísticas"""
+        return {
+            'workers': self.workers,
+            'inline_threshold': self.inline_threshold,
+            'max_pending': self.max_pending,
+            'queue_depth': self.queue_depth,
+            'waiting': self.waiting,
+            'running': self.running,
+            'max_queue_depth': self.max_queue_depth,
+            'inline_parses': self.inline_parses,
+            'pool_parses': self.pool_parses
+        }
+
+    def shutdown(self):
+        """Detiene los procesos del pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
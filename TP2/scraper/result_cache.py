@@ -0,0 +1,132 @@
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class CacheEntry:
+    """Respuesta cacheada con sus validadores HTTP"""
+    __slots__ = ('response', 'body', 'expires_at', 'etag', 'last_modified')
+
+    def __init__(self, response: dict, body: bytes, expires_at: float,
+                 etag: str = None, last_modified: str = None):
+        self.response = response
+        self.body = body
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    @property
+    def revalidatable(self) -> bool:
+        """True si el origen envió validadores para un GET condicional"""
+        return bool(self.etag or self.last_modified)
+
+class ResultCache:
+    """
+    Cache de respuestas de /scrape con TTL y tope de memoria con desalojo LRU.
+    Las entradas vencidas no se descartan si tienen ETag/Last-Modified:
+    se revalidan con un GET condicional contra el origen.
+    """
+
+    def __init__(self, ttl: float = 300, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            ttl: Segundos que una respuesta se considera fresca. Con 0 se desactiva.
+            max_bytes: Tope de memoria para los cuerpos cacheados
+        """
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.refetches = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: str):
+        """
+        Busca una entrada y la marca como usada recientemente.
+
+        Returns:
+            Tupla (entry, fresh). entry es None si no hay nada reutilizable.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, False
+
+        self._entries.move_to_end(key)
+        if time.monotonic() < entry.expires_at:
+            self.hits += 1
+            return entry, True
+
+        if not entry.revalidatable:
+            # Vencida y sin validadores: no sirve para un GET condicional
+            self._remove(key)
+            self.misses += 1
+            return None, False
+
+        return entry, False
+
+    def revalidated(self, key: str, etag: str = None, last_modified: str = None):
+        """Renueva el TTL de una entrada tras un 304 del origen"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.expires_at = time.monotonic() + self.ttl
+        entry.etag = etag or entry.etag
+        entry.last_modified = last_modified or entry.last_modified
+        self.revalidations += 1
+
+    def put(self, key: str, response: dict, body: bytes,
+            etag: str = None, last_modified: str = None):
+        """Guarda una respuesta, desalojando las menos usadas si se supera el tope"""
+        if not self.enabled or len(body) > self.max_bytes:
+            return
+        if key in self._entries:
+            self.refetches += 1
+            self._remove(key)
+
+        self._entries[key] = CacheEntry(
+            response, body, time.monotonic() + self.ttl, etag, last_modified
+        )
+        self.current_bytes += len(body)
+
+        while self.current_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+            logger.debug(f"Entrada desalojada de la cache: {oldest}")
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key)
+        self.current_bytes -= entry.size
+
+    def stats(self) -> dict:
+        """Contadores de la cache para el endpoint de estadísticas"""
+        lookups = self.hits + self.misses + self.revalidations + self.refetches
+        return {
+            'enabled': self.enabled,
+            'entries': len(self._entries),
+            'bytes': self.current_bytes,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'refetches': self.refetches,
+            'evictions': self.evictions,
+            'hit_ratio': round((self.hits + self.revalidations) / lookups, 3) if lookups else 0.0
+        }
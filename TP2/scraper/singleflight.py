@@ -0,0 +1,55 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    Deduplicación de trabajos concurrentes por clave.
+    Mientras hay un trabajo en vuelo para una clave, las llamadas siguientes
+    esperan el mismo resultado en lugar de repetir el trabajo.
+
+    El trabajo corre en su propia Task, de modo que si el primer solicitante
+    se cancela (por ejemplo, el cliente se desconecta) el resto sigue
+    esperando el resultado sin interrupciones.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    @property
+    def in_flight(self) -> int:
+        """Cantidad de claves con un trabajo en curso"""
+        return len(self._inflight)
+
+    async def do(self, key, coro_factory):
+        """
+        Ejecuta coro_factory() una sola vez por clave entre llamadas concurrentes.
+
+        Args:
+            key: Clave de deduplicación (por ejemplo, la URL normalizada)
+            coro_factory: Callable sin argumentos que devuelve la corrutina a ejecutar
+
+        Returns:
+            El resultado del trabajo compartido
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.debug(f"Solicitud unida a un trabajo en vuelo: {key}")
+        else:
+            self.leaders += 1
+            task = asyncio.ensure_future(coro_factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        """Contadores para el endpoint de estadísticas"""
+        return {
+            'in_flight': self.in_flight,
+            'leaders': self.leaders,
+            'coalesced': self.coalesced
+        }
@@ -1,20 +1,39 @@
 """
 Servidor de Procesamiento Distribuido (Parte B)
-Implementa el servidor de procesamiento usando multiprocessing y socketserver.
-Procesa tareas computacionalmente intensivas de forma paralela.
+Implementa el servidor de procesamiento con un front-end asyncio que despacha
+las tareas a un ProcessPoolExecutor. Procesa tareas computacionalmente
+intensivas de forma paralela sin dedicar un thread a cada conexión.
+La versión anterior (socketserver + multiprocessing.Pool) sigue disponible
+con --threaded.
 """
+import asyncio
 import socketserver
 import multiprocessing
 import struct
 import logging
 import argparse
 import socket
+import tempfile
+import threading
+import time
+import os
 from functools import partial
 from multiprocessing import Pool
-from common.protocol import parse_message, build_message
-from processor.screenshot import generate_screenshot
+from concurrent.futures import ProcessPoolExecutor
+from common.protocol import (
+    parse_message, build_message, read_frame, read_hello, build_hello, negotiate_version,
+    encode_frame, decode_frame, MUX_MAGIC, MUX_HEADER, LENGTH_HEADER, HANDSHAKE_MAGIC,
+    MAX_HELLO_SIZE, DEFAULT_MAX_MESSAGE_SIZE
+)
+from common.serialization import negotiate_codec, get_codec, DEFAULT_CODEC
+from common.metrics import serve_metrics
+from common.tracing import traced_task, make_span, MAX_TRACE_ID_LENGTH
+from processor.screenshot import capture_screenshot
 from processor.performance import analyze_performance
-from processor.image_processor import generate_thumbnails
+from processor.image_processor import render_thumbnails
+from processor.thumbnail_cache import configure_thumbnail_cache, get_thumbnail_cache
+from processor.scheduler import FairScheduler, PRIORITY_WEIGHTS, DEFAULT_PRIORITY
+from processor.metrics import ProcessingMetrics
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,131 +41,383 @@ logger = logging.getLogger(__name__)
 # Pool global para procesar tareas CPU-bound
 processing_pool = None
 
-def init_pool(num_processes):
+# Tamaño máximo aceptado por defecto para un mensaje entrante (--max-message-mb)
+MAX_MESSAGE_SIZE = DEFAULT_MAX_MESSAGE_SIZE
+
+# Timeout por tarea en segundos
+TASK_TIMEOUT = 60
+
+# Timeout de página de Chrome para un screenshot
+SCREENSHOT_TIMEOUT = 30
+
+# Margen que se reserva del deadline de la solicitud para serializar y
+# enviar la respuesta antes de que el Servidor A deje de esperarla
+RESPONSE_MARGIN = 0.5
+
+# Conexiones simultáneas aceptadas; las siguientes se cierran enseguida
+MAX_CONNECTIONS = 128
+
+# Solicitudes en curso por proceso del pool antes de responder "sobrecargado"
+PENDING_PER_WORKER = 16
+
+# Segundos sugeridos al cliente para reintentar una solicitud rechazada
+OVERLOAD_RETRY_AFTER = 1
+
+# Tareas que puede pedir una solicitud; sin 'tasks' se ejecutan todas
+TASKS = ('screenshot', 'performance', 'thumbnails')
+
+# Directorio por defecto del cache de thumbnails compartido por los workers
+DEFAULT_THUMBNAIL_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'tp2-thumbnails')
+
+def init_worker(thumbnail_cache_dir: str = None, thumbnail_cache_bytes: int = 0):
+    """Initializer de cada worker: configura el cache de thumbnails del proceso"""
+    configure_thumbnail_cache(thumbnail_cache_dir, thumbnail_cache_bytes)
+
+def init_pool(num_processes, thumbnail_cache_dir: str = None, thumbnail_cache_bytes: int = 0):
     """Inicializa el pool de procesos global"""
     global processing_pool
-    processing_pool = Pool(processes=num_processes)
+    processing_pool = Pool(
+        processes=num_processes,
+        initializer=init_worker,
+        initargs=(thumbnail_cache_dir, thumbnail_cache_bytes)
+    )
     logger.info(f"Pool de procesos inicializado con {num_processes} workers")
 
-def process_screenshot(url: str) -> str:
-    """Genera screenshot de forma segura en un proceso separado"""
+def process_screenshot(url: str, deadline: float = None) -> bytes:
+    """Genera screenshot (PNG crudo) de forma segura en un proceso separado"""
+    timeout = SCREENSHOT_TIMEOUT
+    if deadline is not None:
+        timeout = min(timeout, deadline - time.time())
+        if timeout <= 0:
+            logger.warning(f"Deadline vencido antes del screenshot de {url}")
+            return None
     try:
-        return generate_screenshot(url)
+        return capture_screenshot(url, timeout, deadline=deadline)
     except Exception as e:
         logger.error(f"Error generando screenshot para {url}: {e}")
         return None
 
-def process_performance(url: str) -> dict:
-    """Analiza rendimiento de forma segura en un proceso separado"""
+def process_performance(url: str, page: dict = None, remeasure: bool = False,
+                        deadline: float = None) -> dict:
+    """
+    Analiza rendimiento de forma segura en un proceso separado.
+    Con las mediciones de page (enviadas por el Servidor A) no se descarga
+    la página, salvo que se pida remeasure.
+    """
     try:
-        return analyze_performance(url)
+        return analyze_performance(url, page, remeasure, deadline=deadline)
     except Exception as e:
         logger.error(f"Error analizando rendimiento para {url}: {e}")
         return {'error': str(e)}
 
-def process_thumbnails(images: list) -> list:
-    """Genera thumbnails de forma segura en un proceso separado"""
+def process_thumbnails(images: list, deadline: float = None) -> list:
+    """Genera thumbnails (JPEG crudos) de forma segura en un proceso separado"""
     try:
-        return generate_thumbnails(images)
+        return render_thumbnails(images, deadline=deadline)
     except Exception as e:
         logger.error(f"Error generando thumbnails: {e}")
         return []
 
+def requested_tasks(request: dict) -> tuple:
+    """
+    Tareas pedidas en request['tasks'], en el orden de TASKS.
+
+    Raises:
+        ValueError: Si se pide una tarea desconocida o la lista está vacía
+    """
+    tasks = request.get('tasks')
+    if tasks is None:
+        return TASKS
+    if not isinstance(tasks, list) or not tasks:
+        raise ValueError("'tasks' debe ser una lista no vacía")
+    unknown = set(tasks) - set(TASKS)
+    if unknown:
+        raise ValueError(f"Tareas desconocidas: {', '.join(sorted(map(str, unknown)))}")
+    return tuple(task for task in TASKS if task in tasks)
+
+def request_deadline(request: dict) -> float:
+    """
+    Instante (time.time()) en el que deben terminar las tareas de la
+    solicitud. El Servidor A envía su presupuesto en 'deadline_ms', relativo
+    a la llegada de la solicitud para no depender de los relojes de ambos
+    hosts; se le descuenta RESPONSE_MARGIN y se acota a TASK_TIMEOUT.
+
+    Raises:
+        ValueError: Si 'deadline_ms' no es un número
+    """
+    budget = TASK_TIMEOUT
+    if request.get('deadline_ms') is not None:
+        try:
+            budget = min(budget, float(request['deadline_ms']) / 1000 - RESPONSE_MARGIN)
+        except (TypeError, ValueError):
+            raise ValueError("'deadline_ms' debe ser un número")
+    return time.time() + max(0.0, budget)
+
+def task_args(task: str, request: dict, deadline: float = None) -> tuple:
+    """Función y argumentos con los que se ejecuta una tarea de la solicitud"""
+    if task == 'screenshot':
+        return process_screenshot, (request['url'], deadline)
+    if task == 'performance':
+        return process_performance, (request['url'], request.get('page'),
+                                     request.get('remeasure', False), deadline)
+    return process_thumbnails, (request.get('images', []), deadline)
+
+def request_priority(request: dict) -> str:
+    """
+    Prioridad de la solicitud para el planificador (high, normal o low).
+
+    Raises:
+        ValueError: Si la prioridad no existe
+    """
+    priority = request.get('priority', DEFAULT_PRIORITY)
+    if priority not in PRIORITY_WEIGHTS:
+        raise ValueError(f"Prioridad desconocida: {priority}")
+    return priority
+
+def request_trace_id(request: dict) -> str:
+    """
+    Trace ID que envía el Servidor A, o None si la solicitud no se traza.
+
+    Raises:
+        ValueError: Si 'trace_id' no es un string corto
+    """
+    trace_id = request.get('trace_id')
+    if trace_id is None:
+        return None
+    if not isinstance(trace_id, str) or not trace_id or len(trace_id) > MAX_TRACE_ID_LENGTH:
+        raise ValueError(f"'trace_id' debe ser un string de hasta {MAX_TRACE_ID_LENGTH} caracteres")
+    return trace_id
+
+def traced_args(task: str, request: dict, deadline: float, trace_id: str = None) -> tuple:
+    """
+    Como task_args, pero con trace_id la función se envuelve en traced_task:
+    el worker recibe el trace ID y devuelve (resultado, inicio, fin).
+    """
+    func, args = task_args(task, request, deadline)
+    if trace_id is None:
+        return func, args
+    return traced_task, (trace_id, func) + args
+
+def task_spans(task: str, submitted: float, result) -> tuple:
+    """
+    Separa el resultado de traced_task en el resultado de la tarea y sus
+    spans: espera hasta que el worker la empieza y ejecución en el worker.
+
+    Returns:
+        Tupla (resultado, lista de spans)
+    """
+    result, start, end = result
+    return result, [make_span(f'{task}.queue', submitted, start, task),
+                    make_span(task, start, end, task)]
+
+def default_screenshot_limit(workers: int) -> int:
+    """Screenshots simultáneos por defecto: la mitad de los workers"""
+    return max(1, workers // 2)
+
+def default_max_pending(workers: int) -> int:
+    """Solicitudes en curso por defecto: PENDING_PER_WORKER por proceso"""
+    return max(1, workers) * PENDING_PER_WORKER
+
+def overloaded_response(pending: int) -> dict:
+    """Respuesta a una solicitud rechazada por exceso de solicitudes en curso"""
+    return {
+        'error': f"Servidor sobrecargado: {pending} solicitudes en curso",
+        'overloaded': True,
+        'retry_after': OVERLOAD_RETRY_AFTER
+    }
+
+def task_status(result) -> str:
+    """Estado de una tarea terminada: las tareas devuelven None o {'error': ...} si fallan"""
+    if result is None or (isinstance(result, dict) and 'error' in result):
+        return 'error'
+    return 'ok'
+
+def answer_hello(hello: dict, max_message_size: int) -> tuple:
+    """
+    Responde al handshake del cliente eligiendo la versión más alta en común
+    y el primer codec de su lista que el servidor tenga disponible.
+
+    Returns:
+        Tupla (versión negociada o None, codec, bytes de la respuesta)
+    """
+    version = negotiate_version(hello.get('versions'))
+    if version is None:
+        return None, None, build_hello({'error': f"Versiones no soportadas: {hello.get('versions')}"})
+    codec_name = negotiate_codec(hello.get('codecs', [DEFAULT_CODEC]))
+    if codec_name is None:
+        return None, None, build_hello({'error': f"Codecs no soportados: {hello.get('codecs')}"})
+    return version, get_codec(codec_name), build_hello({
+        'version': version,
+        'codec': codec_name,
+        'max_message_size': max_message_size
+    })
+
+def encode_response(response: dict, request_id: int, version: int, peer_max_size: int = None,
+                    codec=None) -> bytes:
+    """Serializa una respuesta multiplexada respetando el límite anunciado por el cliente"""
+    frame = encode_frame(response, request_id, version, codec)
+    if peer_max_size and len(frame) - MUX_HEADER.size > peer_max_size:
+        logger.error(f"Respuesta {request_id} demasiado grande: {len(frame)} bytes")
+        frame = encode_frame(
+            {'error': f"Respuesta demasiado grande: {len(frame)} bytes"}, request_id, version, codec
+        )
+    return frame
+
+def process_request(request: dict) -> dict:
+    """
+    Ejecuta las tareas de una solicitud en el pool de procesos.
+
+    Todas las tareas comparten el deadline de la solicitud: lo que terminó
+    a tiempo se devuelve y las tareas tardías quedan en None con su estado
+    en 'task_status'. Un AsyncResult de multiprocessing.Pool no se puede
+    cancelar, pero cada tarea recibe el deadline y deja de trabajar al
+    vencer, así el worker no queda ocupado con trabajo abandonado.
+
+    Con 'trace_id' cada tarea se ejecuta envuelta en traced_task y la
+    respuesta incluye sus spans en 'timings'.
+
+    Returns:
+        Payload de respuesta con las tareas pedidas (por defecto
+        screenshot, performance y thumbnails) y 'task_status'
+
+    Raises:
+        ValueError: Si la solicitud no trae URL, pide tareas desconocidas
+            o trae un deadline o un trace ID inválidos
+        RuntimeError: Si el pool no está inicializado
+    """
+    url = request.get('url')
+    images = request.get('images', [])
+    
+    if not url:
+        raise ValueError("URL faltante en solicitud")
+    tasks = requested_tasks(request)
+    deadline = request_deadline(request)
+    trace_id = request_trace_id(request)
+    
+    logger.info(f"Procesando URL: {url} con {len(images)} imágenes")
+    
+    # Procesar las tareas en paralelo usando el pool
+    # Esto es CPU-bound, así que se ejecuta en procesos separados
+    if processing_pool is None:
+        raise RuntimeError("Error interno: Pool no disponible")
+    
+    # Usar apply_async para no bloquear (aunque aquí sí bloqueamos esperando)
+    results = {}
+    submitted = time.time()
+    for task in tasks:
+        func, args = traced_args(task, request, deadline, trace_id)
+        results[task] = processing_pool.apply_async(
+            func,
+            args,
+            callback=lambda x, task=task: logger.debug(f"Tarea {task} completada"),
+            error_callback=lambda e, task=task: logger.error(f"Error en {task}: {e}")
+        )
+    
+    # Esperar cada resultado hasta el deadline compartido y construir respuesta
+    response = {}
+    status = {}
+    spans = []
+    for task, result in results.items():
+        try:
+            response[task] = result.get(timeout=max(0.0, deadline - time.time()))
+            if trace_id is not None:
+                response[task], task_timings = task_spans(task, submitted, response[task])
+                spans.extend(task_timings)
+            status[task] = task_status(response[task])
+        except multiprocessing.TimeoutError:
+            logger.warning(f"Tarea {task} sin terminar al vencer el deadline para {url}")
+            response[task] = None
+            status[task] = 'timeout'
+            spans.append(make_span(f'{task}.timeout', submitted, time.time(), task))
+        except Exception as e:
+            logger.error(f"Error en {task}: {e}")
+            response[task] = None
+            status[task] = 'error'
+            spans.append(make_span(f'{task}.error', submitted, time.time(), task))
+    response['task_status'] = status
+    if trace_id is not None:
+        response['timings'] = spans
+    return response
+
 class ProcessingRequestHandler(socketserver.BaseRequestHandler):
-    """Handler que procesa solicitudes usando multiprocessing"""
+    """
+    Handler que procesa solicitudes usando multiprocessing.
+    Soporta tres modos por conexión:
+    - Legacy: un único mensaje con prefijo de longitud por conexión.
+    - Multiplexado: la conexión abre con MUX_MAGIC y transporta muchos
+      frames con request_id; cada uno se atiende en su propio thread y
+      las respuestas se envían apenas terminan, en cualquier orden.
+    - Negociado: la conexión abre con HANDSHAKE_MAGIC, se acuerda la
+      versión del framing (la 2 lleva los binarios como adjuntos crudos)
+      y sigue como la multiplexada.
+    """
+    
+    @property
+    def max_message_size(self) -> int:
+        return getattr(self.server, 'max_message_size', MAX_MESSAGE_SIZE)
+    
+    def recv_exactly(self, size: int) -> bytes:
+        """Lee exactamente size bytes, o menos si la conexión se cierra"""
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(min(4096, size - len(data)))
+            if not chunk:
+                break
+            data += chunk
+        return data
     
     def handle(self):
         """Maneja cada solicitud de cliente"""
         try:
             # Leer la longitud del mensaje (4 bytes big-endian)
-            length_bytes = self.request.recv(4)
+            length_bytes = self.recv_exactly(4)
             if len(length_bytes) < 4:
                 logger.warning("No se pudo leer la longitud del mensaje")
                 self.request.sendall(b'')
                 return
             
+            if length_bytes == MUX_MAGIC:
+                self.handle_multiplexed()
+                return
+            
+            if length_bytes == HANDSHAKE_MAGIC:
+                self.handle_handshake()
+                return
+            
             length = struct.unpack('!I', length_bytes)[0]
             
-            # Validar que la longitud no sea excesiva (< 10MB)
-            if length > 10 * 1024 * 1024:
+            # Validar que la longitud no supere el límite configurado
+            if length > self.max_message_size:
                 logger.error(f"Mensaje demasiado grande: {length} bytes")
                 self.request.sendall(b'')
                 return
             
             # Leer el payload completo
-            data = b''
-            while len(data) < length:
-                chunk = self.request.recv(min(4096, length - len(data)))
-                if not chunk:
-                    logger.warning("Conexión cerrada antes de recibir todo el mensaje")
-                    return
-                data += chunk
+            data = self.recv_exactly(length)
+            if len(data) < length:
+                logger.warning("Conexión cerrada antes de recibir todo el mensaje")
+                return
             
             logger.info(f"Mensaje recibido: {length} bytes")
             
             # Parsear la solicitud
             request = parse_message(data)
-            url = request.get('url')
-            images = request.get('images', [])
             
-            if not url:
-                logger.error("URL faltante en solicitud")
-                self.send_error("URL faltante en solicitud")
+            if not self.server.begin_request():
+                self.request.sendall(build_message(overloaded_response(self.server.pending)))
                 return
-            
-            logger.info(f"Procesando URL: {url} con {len(images)} imágenes")
-            
-            # Procesar las tareas en paralelo usando el pool
-            # Esto es CPU-bound, así que se ejecuta en procesos separados
-            global processing_pool
-            if processing_pool is None:
-                logger.error("Pool no inicializado")
-                self.send_error("Error interno: Pool no disponible")
-                return
-            
             try:
-                # Usar apply_async para no bloquear (aunque aquí sí bloqueamos esperando)
-                screenshot_result = processing_pool.apply_async(
-                    process_screenshot,
-                    (url,),
-                    callback=lambda x: logger.debug("Screenshot completado"),
-                    error_callback=lambda e: logger.error(f"Error en screenshot: {e}")
-                )
-                
-                performance_result = processing_pool.apply_async(
-                    process_performance,
-                    (url,),
-                    callback=lambda x: logger.debug("Performance completado"),
-                    error_callback=lambda e: logger.error(f"Error en performance: {e}")
-                )
-                
-                thumbnails_result = processing_pool.apply_async(
-                    process_thumbnails,
-                    (images,),
-                    callback=lambda x: logger.debug("Thumbnails completados"),
-                    error_callback=lambda e: logger.error(f"Error en thumbnails: {e}")
-                )
-                
-                # Esperar resultados con timeout
-                screenshot = screenshot_result.get(timeout=60)
-                performance = performance_result.get(timeout=60)
-                thumbnails = thumbnails_result.get(timeout=60)
-                
-                # Construir respuesta
-                response_payload = {
-                    'screenshot': screenshot,
-                    'performance': performance,
-                    'thumbnails': thumbnails
-                }
-                
-                response_json = build_message(response_payload)
-                self.request.sendall(response_json)
-                
-                logger.info(f"Respuesta enviada para {url}")
-                
+                response_payload = process_request(request)
+                self.request.sendall(build_message(response_payload))
+                logger.info(f"Respuesta enviada para {request.get('url')}")
+            except (ValueError, RuntimeError) as e:
+                logger.error(str(e))
+                self.send_error(str(e))
             except Exception as e:
                 logger.error(f"Error procesando tareas: {e}")
                 self.send_error(f"Error procesando tareas: {str(e)}")
+            finally:
+                self.server.end_request()
         
         except struct.error as e:
             logger.error(f"Error parsing mensaje: {e}")
@@ -155,6 +426,84 @@ class ProcessingRequestHandler(socketserver.BaseRequestHandler):
             logger.error(f"Error no esperado: {e}")
             self.send_error(f"Error no esperado: {str(e)}")
     
+    def handle_handshake(self):
+        """Negocia la versión del protocolo y atiende la conexión multiplexada"""
+        header = self.recv_exactly(LENGTH_HEADER.size)
+        if len(header) < LENGTH_HEADER.size:
+            return
+        length = LENGTH_HEADER.unpack(header)[0]
+        if length > MAX_HELLO_SIZE:
+            logger.error(f"Handshake demasiado grande: {length} bytes")
+            return
+        hello = parse_message(self.recv_exactly(length))
+        
+        version, codec, reply = answer_hello(hello, self.max_message_size)
+        self.request.sendall(reply)
+        if version is None:
+            logger.warning(f"Handshake sin versión o codec en común con {self.client_address}")
+            return
+        self.handle_multiplexed(version, hello.get('max_message_size'), codec)
+    
+    def handle_multiplexed(self, version: int = 1, peer_max_size: int = None, codec=None):
+        """Lee frames hasta que el cliente cierre la conexión"""
+        self.write_lock = threading.Lock()
+        self.version = version
+        self.peer_max_size = peer_max_size
+        self.codec = codec
+        logger.info(f"Conexión multiplexada (versión {version}) desde {self.client_address}")
+        
+        while True:
+            header = self.recv_exactly(MUX_HEADER.size)
+            if len(header) < MUX_HEADER.size:
+                logger.info(f"Conexión multiplexada cerrada por {self.client_address}")
+                return
+            
+            length, request_id = MUX_HEADER.unpack(header)
+            if length > self.max_message_size:
+                logger.error(f"Mensaje demasiado grande: {length} bytes")
+                return
+            
+            data = self.recv_exactly(length)
+            if len(data) < length:
+                logger.warning("Conexión cerrada antes de recibir todo el mensaje")
+                return
+            
+            # Sin lugar se responde en este mismo thread, sin crear otro
+            if not self.server.begin_request():
+                self.send_frame(request_id, overloaded_response(self.server.pending))
+                continue
+            
+            threading.Thread(
+                target=self.serve_frame,
+                args=(request_id, data),
+                daemon=True
+            ).start()
+    
+    def serve_frame(self, request_id: int, data: bytes):
+        """Procesa un frame multiplexado y responde con el mismo request_id"""
+        try:
+            response_payload = process_request(decode_frame(data, self.version, self.codec))
+        except (ValueError, RuntimeError) as e:
+            logger.error(str(e))
+            response_payload = {'error': str(e)}
+        except Exception as e:
+            logger.error(f"Error procesando tareas: {e}")
+            response_payload = {'error': f"Error procesando tareas: {str(e)}"}
+        finally:
+            self.server.end_request()
+        self.send_frame(request_id, response_payload)
+    
+    def send_frame(self, request_id: int, response_payload: dict):
+        """Envía una respuesta multiplexada"""
+        try:
+            with self.write_lock:
+                self.request.sendall(
+                    encode_response(response_payload, request_id, self.version,
+                                    self.peer_max_size, self.codec)
+                )
+        except OSError as e:
+            logger.error(f"Error enviando respuesta {request_id}: {e}")
+    
     def send_error(self, error_msg: str):
         """Envía un mensaje de error al cliente"""
         try:
@@ -164,9 +513,384 @@ class ProcessingRequestHandler(socketserver.BaseRequestHandler):
             logger.error(f"Error enviando error message: {e}")
 
 class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
-    """Server que maneja múltiples conexiones con threads"""
+    """
+    Server que maneja múltiples conexiones con threads.
+    
+    Acota los threads que puede crear: más allá de max_connections las
+    conexiones nuevas se cierran al aceptarlas, y más allá de max_pending
+    solicitudes en curso se responde "sobrecargado" sin crear un thread
+    por frame.
+    """
     allow_reuse_address = True
     daemon_threads = True
+    max_message_size = MAX_MESSAGE_SIZE
+    max_connections = MAX_CONNECTIONS
+    max_pending = default_max_pending(os.cpu_count() or 1)
+    
+    def __init__(self, *args, **kwargs):
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.pending = 0
+        self.connections_rejected = 0
+        self.requests_rejected = 0
+        super().__init__(*args, **kwargs)
+    
+    def process_request(self, request, client_address):
+        """Crea el thread de la conexión solo si hay lugar"""
+        with self.lock:
+            accepted = self.connections < self.max_connections
+            if accepted:
+                self.connections += 1
+            else:
+                self.connections_rejected += 1
+        if not accepted:
+            logger.warning(f"Conexión de {client_address} rechazada: "
+                           f"{self.max_connections} conexiones abiertas")
+            self.shutdown_request(request)
+            return
+        super().process_request(request, client_address)
+    
+    def process_request_thread(self, request, client_address):
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            with self.lock:
+                self.connections -= 1
+    
+    def begin_request(self) -> bool:
+        """Reserva lugar para una solicitud; False si ya hay max_pending en curso"""
+        with self.lock:
+            if self.pending >= self.max_pending:
+                self.requests_rejected += 1
+                return False
+            self.pending += 1
+            return True
+    
+    def end_request(self):
+        with self.lock:
+            self.pending -= 1
+
+class AsyncProcessingServer:
+    """
+    Servidor B con front-end asyncio.
+    Lee los frames con readexactly y ejecuta las tareas en un
+    ProcessPoolExecutor mediante run_in_executor, así ninguna conexión
+    ocupa un thread mientras espera resultados. Habla el mismo protocolo
+    que ProcessingRequestHandler (legacy y multiplexado).
+    
+    Las tareas pasan por un FairScheduler: colas por tipo de tarea y por
+    cliente (campo 'client' de la solicitud), reparto justo ponderado por
+    prioridad y un límite propio de screenshots simultáneos.
+    
+    Más allá de max_connections las conexiones nuevas se cierran al
+    aceptarlas, y más allá de max_pending solicitudes en curso se responde
+    enseguida "sobrecargado" (con 'retry_after') en lugar de encolar sin límite.
+    
+    Las métricas (self.metrics) se exportan en formato Prometheus por
+    HTTP en metrics_port, si se indica.
+    """
+    
+    def __init__(self, host: str, port: int, executor=None, num_processes: int = None,
+                 max_message_size: int = MAX_MESSAGE_SIZE, screenshot_limit: int = None,
+                 max_connections: int = MAX_CONNECTIONS, max_pending: int = None,
+                 metrics_port: int = None):
+        self.host = host
+        self.port = port
+        self.max_message_size = max_message_size
+        self.executor = executor or ProcessPoolExecutor(max_workers=num_processes)
+        workers = num_processes or os.cpu_count() or 1
+        self.max_connections = max_connections
+        self.max_pending = max_pending or default_max_pending(workers)
+        self.metrics = ProcessingMetrics(self)
+        self.metrics_port = metrics_port
+        self.scheduler = FairScheduler(
+            self.executor, workers,
+            limits={'screenshot': screenshot_limit or default_screenshot_limit(workers)},
+            observer=self.metrics.observe_task
+        )
+        self.server = None
+        self.metrics_server = None
+        self.connections = 0
+        self.in_flight_requests = 0
+        self.in_flight_jobs = 0
+        self.requests_served = 0
+        self.tasks_timed_out = 0
+        self.connections_rejected = 0
+        self.requests_rejected = 0
+    
+    async def start(self):
+        """Abre el socket de escucha (IPv4 o IPv6 según host)"""
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, limit=2**16
+        )
+        if self.metrics_port is not None:
+            self.metrics_server = await serve_metrics(
+                self.metrics.registry, self.host, self.metrics_port
+            )
+            logger.info(f"Métricas en http://{self.host}:{self.metrics_port}/metrics")
+        return self.server
+    
+    @property
+    def sockets(self):
+        return self.server.sockets if self.server else []
+    
+    async def serve_forever(self):
+        await self.start()
+        try:
+            async with self.server:
+                await self.server.serve_forever()
+        finally:
+            await self.close_metrics()
+    
+    async def close_metrics(self):
+        if self.metrics_server:
+            self.metrics_server.close()
+            await self.metrics_server.wait_closed()
+            self.metrics_server = None
+    
+    async def close(self):
+        """Cierra los sockets de escucha y el executor"""
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.close_metrics()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+    
+    def stats(self) -> dict:
+        """Estado del servidor: conexiones, trabajos en vuelo y cache de thumbnails"""
+        stats = {
+            'connections': self.connections,
+            'in_flight_requests': self.in_flight_requests,
+            'in_flight_jobs': self.in_flight_jobs,
+            'requests_served': self.requests_served,
+            'tasks_timed_out': self.tasks_timed_out,
+            'connections_rejected': self.connections_rejected,
+            'requests_rejected': self.requests_rejected,
+            'scheduler': self.scheduler.stats()
+        }
+        cache = get_thumbnail_cache()
+        if cache is not None:
+            stats['thumbnail_cache'] = cache.stats()
+        return stats
+    
+    async def run_job(self, task: str, client: str, func, *args, timeout: float = TASK_TIMEOUT,
+                      priority: str = DEFAULT_PRIORITY):
+        """
+        Ejecuta una tarea en el pool de procesos, a través del planificador, con timeout.
+        Al vencer, wait_for cancela la espera: si la tarea todavía estaba
+        en cola no llega a ocupar un worker.
+        """
+        self.in_flight_jobs += 1
+        try:
+            return await asyncio.wait_for(
+                self.scheduler.run(task, client, func, *args, priority=priority),
+                timeout=timeout
+            )
+        finally:
+            self.in_flight_jobs -= 1
+    
+    async def run_task(self, task: str, request: dict, deadline: float, priority: str,
+                       trace_id: str = None, spans: list = None) -> tuple:
+        """
+        Ejecuta una tarea de la solicitud hasta el deadline compartido.
+        Con trace_id la tarea se envuelve en traced_task y sus spans se
+        agregan a spans.
+        
+        Returns:
+            Tupla (resultado o None, estado: ok, error o timeout)
+        """
+        func, args = traced_args(task, request, deadline, trace_id)
+        client = str(request.get('client') or 'anonymous')
+        submitted = time.time()
+        try:
+            result = await self.run_job(
+                task, client, func, *args,
+                timeout=max(0.0, deadline - time.time()), priority=priority
+            )
+        except asyncio.TimeoutError:
+            self.tasks_timed_out += 1
+            logger.warning(f"Tarea {task} cancelada al vencer el deadline para {request['url']}")
+            if trace_id is not None:
+                spans.append(make_span(f'{task}.timeout', submitted, time.time(), task))
+            return None, 'timeout'
+        except Exception as e:
+            logger.error(f"Error en {task}: {e}")
+            if trace_id is not None:
+                spans.append(make_span(f'{task}.error', submitted, time.time(), task))
+            return None, 'error'
+        if trace_id is not None:
+            result, task_timings = task_spans(task, submitted, result)
+            spans.extend(task_timings)
+        return result, task_status(result)
+    
+    async def process(self, request: dict) -> dict:
+        """
+        Ejecuta las tareas de una solicitud en paralelo.
+        La acción 'stats' devuelve el estado del servidor sin procesar nada.
+        
+        Con 'tasks' se ejecuta solo un subconjunto de las tareas. Las
+        tareas comparten el deadline de la solicitud ('deadline_ms'): lo que
+        terminó a tiempo se devuelve y el estado de cada una va en
+        'task_status'. Con max_pending solicitudes en curso se responde
+        "sobrecargado" sin ejecutar nada. Con 'trace_id' la respuesta trae
+        los spans de cada tarea en 'timings'.
+        
+        Raises:
+            ValueError: Si la solicitud no trae URL, pide tareas desconocidas
+                o trae un deadline, una prioridad o un trace ID inválidos
+        """
+        if request.get('action') == 'stats':
+            return self.stats()
+        
+        if self.in_flight_requests >= self.max_pending:
+            self.requests_rejected += 1
+            logger.warning(f"Solicitud rechazada: {self.in_flight_requests} en curso")
+            return overloaded_response(self.in_flight_requests)
+        
+        url = request.get('url')
+        images = request.get('images', [])
+        
+        if not url:
+            raise ValueError("URL faltante en solicitud")
+        tasks = requested_tasks(request)
+        deadline = request_deadline(request)
+        priority = request_priority(request)
+        trace_id = request_trace_id(request)
+        spans = []
+        
+        logger.info(f"Procesando URL: {url} con {len(images)} imágenes"
+                    + (f" (traza {trace_id})" if trace_id else ""))
+        
+        self.in_flight_requests += 1
+        try:
+            results = await asyncio.gather(
+                *(self.run_task(task, request, deadline, priority, trace_id, spans) for task in tasks)
+            )
+        finally:
+            self.in_flight_requests -= 1
+        
+        self.requests_served += 1
+        response = {task: result for task, (result, _) in zip(tasks, results)}
+        response['task_status'] = {task: status for task, (_, status) in zip(tasks, results)}
+        if trace_id is not None:
+            response['timings'] = spans
+        return response
+    
+    async def respond(self, request: dict) -> dict:
+        """Procesa una solicitud y traduce los errores a un payload de error"""
+        try:
+            return await self.process(request)
+        except ValueError as e:
+            logger.error(str(e))
+            return {'error': str(e)}
+        except asyncio.TimeoutError:
+            logger.error("Timeout procesando tareas")
+            return {'error': "Error procesando tareas: Timeout"}
+        except Exception as e:
+            logger.error(f"Error procesando tareas: {e}")
+            return {'error': f"Error procesando tareas: {str(e)}"}
+    
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Atiende una conexión en modo legacy, multiplexado o negociado"""
+        if self.connections >= self.max_connections:
+            self.connections_rejected += 1
+            logger.warning(f"Conexión rechazada: {self.connections} conexiones abiertas")
+            writer.close()
+            return
+        self.connections += 1
+        bytes_in, bytes_out = self.metrics.bytes_in, self.metrics.bytes_out
+        try:
+            first = await reader.readexactly(4)
+            if first == MUX_MAGIC:
+                await self.serve_multiplexed(reader, writer)
+                return
+            
+            if first == HANDSHAKE_MAGIC:
+                hello = await read_hello(reader)
+                version, codec, reply = answer_hello(hello, self.max_message_size)
+                writer.write(reply)
+                await writer.drain()
+                if version is None:
+                    logger.warning("Handshake sin versión o codec en común")
+                    return
+                await self.serve_multiplexed(
+                    reader, writer, version, hello.get('max_message_size'), codec
+                )
+                return
+            
+            length = struct.unpack('!I', first)[0]
+            if length > self.max_message_size:
+                logger.error(f"Mensaje demasiado grande: {length} bytes")
+                return
+            
+            data = await reader.readexactly(length)
+            bytes_in.inc(LENGTH_HEADER.size + length)
+            logger.info(f"Mensaje recibido: {length} bytes")
+            
+            request = {}
+            try:
+                request = parse_message(data)
+            except ValueError as e:
+                response = {'error': f"Error parsing mensaje: {str(e)}"}
+            else:
+                response = await self.respond(request)
+            
+            message = build_message(response)
+            bytes_out.inc(len(message))
+            writer.write(message)
+            await writer.drain()
+            logger.info(f"Respuesta enviada para {request.get('url')}")
+        
+        except asyncio.IncompleteReadError:
+            logger.warning("Conexión cerrada antes de recibir todo el mensaje")
+        except ConnectionError as e:
+            logger.warning(f"Conexión perdida: {e}")
+        except Exception as e:
+            logger.error(f"Error no esperado: {e}")
+        finally:
+            self.connections -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+    
+    async def serve_multiplexed(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                version: int = 1, peer_max_size: int = None, codec=None):
+        """Lee frames hasta que el cliente cierre; cada uno se atiende en su propia task"""
+        peer = writer.get_extra_info('peername')
+        logger.info(f"Conexión multiplexada (versión {version}) desde {peer}")
+        write_lock = asyncio.Lock()
+        tasks = set()
+        
+        async def serve_frame(request_id: int, data: bytes):
+            try:
+                response = await self.respond(decode_frame(data, version, codec))
+            except ValueError as e:
+                response = {'error': f"Error parsing mensaje: {str(e)}"}
+            frame = encode_response(response, request_id, version, peer_max_size, codec)
+            self.metrics.bytes_out.inc(len(frame))
+            try:
+                async with write_lock:
+                    writer.write(frame)
+                    await writer.drain()
+            except ConnectionError as e:
+                logger.error(f"Error enviando respuesta {request_id}: {e}")
+        
+        try:
+            while True:
+                try:
+                    request_id, data = await read_frame(reader, self.max_message_size)
+                except asyncio.IncompleteReadError:
+                    logger.info(f"Conexión multiplexada cerrada por {peer}")
+                    return
+                self.metrics.bytes_in.inc(MUX_HEADER.size + len(data))
+                task = asyncio.create_task(serve_frame(request_id, data))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            for task in tasks:
+                task.cancel()
 
 def parse_args():
     """Parsea argumentos de línea de comandos"""
@@ -202,22 +926,83 @@ Ejemplos de uso:
         help='Número de procesos en el pool (default: CPU count)'
     )
     
-    return parser.parse_args()
-
-if __name__ == "__main__":
-    args = parse_args()
+    parser.add_argument(
+        '--threaded',
+        action='store_true',
+        help='Usar la versión anterior con un thread por conexión (socketserver)'
+    )
     
-    # Determinar número de procesos
-    num_processes = args.processes if args.processes else multiprocessing.cpu_count()
+    parser.add_argument(
+        '--max-message-mb',
+        type=int,
+        default=MAX_MESSAGE_SIZE // (1024 * 1024),
+        help='Tamaño máximo de una solicitud entrante en MB (default: 10)'
+    )
+    
+    parser.add_argument(
+        '--thumbnail-cache-dir',
+        type=str,
+        default=DEFAULT_THUMBNAIL_CACHE_DIR,
+        help=f'Directorio del cache de thumbnails compartido por los workers (default: {DEFAULT_THUMBNAIL_CACHE_DIR})'
+    )
+    
+    parser.add_argument(
+        '--thumbnail-cache-mb',
+        type=int,
+        default=256,
+        help='Tamaño máximo del cache de thumbnails en MB, 0 lo deshabilita (default: 256)'
+    )
+    
+    parser.add_argument(
+        '--screenshot-limit',
+        type=int,
+        default=None,
+        help='Screenshots simultáneos en el pool, que usan mucha más memoria (default: la mitad de los procesos)'
+    )
+    
+    parser.add_argument(
+        '--max-connections',
+        type=int,
+        default=MAX_CONNECTIONS,
+        help=f'Conexiones simultáneas; las siguientes se cierran al aceptarlas (default: {MAX_CONNECTIONS})'
+    )
     
+    parser.add_argument(
+        '--max-pending',
+        type=int,
+        default=None,
+        help=f'Solicitudes en curso antes de responder "sobrecargado" '
+             f'(default: {PENDING_PER_WORKER} por proceso)'
+    )
+    
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        default=None,
+        help='Puerto HTTP donde exportar las métricas en formato Prometheus (solo sin --threaded)'
+    )
+    
+    return parser.parse_args()
+
+def thumbnail_cache_config(args) -> tuple:
+    """(directorio, bytes máximos) del cache de thumbnails según los argumentos"""
+    return args.thumbnail_cache_dir, args.thumbnail_cache_mb * 1024 * 1024
+
+def run_threaded(args, num_processes):
+    """Ejecuta la versión con socketserver y un thread por conexión"""
     # Inicializar el pool global
-    init_pool(num_processes)
+    init_pool(num_processes, *thumbnail_cache_config(args))
     
     # Crear servidor
     server_address = (args.ip, args.port)
     server = ThreadedTCPServer(server_address, ProcessingRequestHandler)
+    server.max_message_size = args.max_message_mb * 1024 * 1024
+    server.max_connections = args.max_connections
+    server.max_pending = args.max_pending or default_max_pending(num_processes)
+    if args.metrics_port is not None:
+        logger.warning("--metrics-port no está soportado con --threaded; se ignora")
     
-    logger.info(f"Servidor de procesamiento escuchando en {args.ip}:{args.port}")
+    logger.info(f"Servidor de procesamiento (threads) escuchando en {args.ip}:{args.port}")
     logger.info(f"Usando {num_processes} procesos de trabajo")
     
     try:
@@ -228,4 +1013,41 @@ if __name__ == "__main__":
         if processing_pool:
             processing_pool.close()
             processing_pool.join()
-        logger.info("Servidor cerrado correctamente")
\ No newline at end of file
+        logger.info("Servidor cerrado correctamente")
+
+def run_async(args, num_processes):
+    """Ejecuta el front-end asyncio con ProcessPoolExecutor"""
+    cache_config = thumbnail_cache_config(args)
+    configure_thumbnail_cache(*cache_config)
+    executor = ProcessPoolExecutor(
+        max_workers=num_processes, initializer=init_worker, initargs=cache_config
+    )
+    server = AsyncProcessingServer(
+        args.ip, args.port, executor=executor, num_processes=num_processes,
+        max_message_size=args.max_message_mb * 1024 * 1024,
+        screenshot_limit=args.screenshot_limit,
+        max_connections=args.max_connections,
+        max_pending=args.max_pending,
+        metrics_port=args.metrics_port
+    )
+    
+    logger.info(f"Servidor de procesamiento escuchando en {args.ip}:{args.port}")
+    logger.info(f"Usando {num_processes} procesos de trabajo")
+    
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        logger.info("Cerrando servidor...")
+        server.executor.shutdown(wait=True, cancel_futures=True)
+        logger.info("Servidor cerrado correctamente")
+
+if __name__ == "__main__":
+    args = parse_args()
+    
+    # Determinar número de procesos
+    num_processes = args.processes if args.processes else multiprocessing.cpu_count()
+    
+    if args.threaded:
+        run_threaded(args, num_processes)
+    else:
+        run_async(args, num_processes)
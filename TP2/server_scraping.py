@@ -5,74 +5,333 @@ Soporta IPv4 e IPv6 y comunicación asíncrona con el Servidor B.
 """
 
 import asyncio
+import aiohttp
 from aiohttp import web
 import datetime
-import struct
+import time
+import json
 import logging
 import argparse
-from scraper.async_http import fetch_html
-from scraper.html_parser import parse_html
-from scraper.metadata_extractor import extract_metadata
-from common.protocol import build_message, parse_message
+from urllib.parse import urlparse
+from scraper.async_http import fetch_page, create_session, ConnectionStats, PageTooLarge, FetchResult
+from scraper.page_extractor import PageExtractor, finish_page
+from scraper.parse_pool import ParsePool
+from scraper.result_cache import ResultCache
+from scraper.singleflight import SingleFlight
+from scraper.jobs import JobStore, JobStoreFull, RUNNING
+from scraper.admission import AdmissionControl, Overloaded
+from scraper.metrics import ScrapingMetrics, metrics_middleware, metrics_handler
+from common.processing_cluster import (
+    ProcessingCluster, CircuitOpen, parse_endpoints, BALANCE_MODES, HASH
+)
+from common.serialization import to_json, available_codecs
+from common.tracing import Trace, TraceWriter, SERVER_B
+from common.urls import normalize_url
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Timeout de la llamada al webhook de un trabajo asíncrono
+WEBHOOK_TIMEOUT = 10
+
 class ServerConfig:
     """Configuración centralizada del servidor"""
-    def __init__(self, host, port, processing_host, processing_port, workers=4):
+    def __init__(self, host, port, processing_host, processing_port, workers=4,
+                 http_limit=100, http_limit_per_host=10,
+                 processing_connections=4, processing_timeout=180,
+                 inline_parse_kb=256, cache_ttl=300, cache_mb=64,
+                 batch_concurrency=10, batch_max_urls=10000, processing_max_mb=32,
+                 processing_codecs=None, max_page_mb=50, stream_parse=False,
+                 remeasure_performance=False, max_jobs=1000, job_ttl=600,
+                 max_concurrent=50, max_queue=100, queue_timeout=10,
+                 processing_endpoints=None, circuit_failures=5, circuit_reset=10,
+                 processing_hedge=False, processing_balance=HASH, health_interval=5,
+                 trace_file=None):
         self.host = host
         self.port = port
         self.processing_host = processing_host
         self.processing_port = processing_port
         self.workers = workers
+        self.http_limit = http_limit
+        self.http_limit_per_host = http_limit_per_host
+        self.processing_connections = processing_connections
+        self.processing_timeout = processing_timeout
+        self.inline_parse_kb = inline_parse_kb
+        self.cache_ttl = cache_ttl
+        self.cache_mb = cache_mb
+        self.batch_concurrency = batch_concurrency
+        self.batch_max_urls = batch_max_urls
+        self.processing_max_mb = processing_max_mb
+        self.processing_codecs = processing_codecs or available_codecs()
+        self.max_page_mb = max_page_mb
+        self.stream_parse = stream_parse
+        self.remeasure_performance = remeasure_performance
+        self.max_jobs = max_jobs
+        self.job_ttl = job_ttl
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.processing_endpoints = processing_endpoints or [(processing_host, processing_port)]
+        self.circuit_failures = circuit_failures
+        self.circuit_reset = circuit_reset
+        self.processing_hedge = processing_hedge
+        self.processing_balance = processing_balance
+        self.health_interval = health_interval
+        self.trace_file = trace_file
+
+class ProcessingUnavailable(Exception):
+    """El Servidor B no respondió: circuito abierto, conexión caída o timeout"""
 
-async def send_to_processing_server(config: ServerConfig, request_data: dict) -> dict:
+async def send_to_processing_server(pool: ProcessingCluster, request_data: dict,
+                                    timeout: float = None) -> dict:
     """
     Envía una solicitud al servidor de procesamiento de forma asíncrona.
-    Usa asyncio.open_connection en lugar de sockets bloqueantes.
+    Usa los pools de conexiones persistentes y multiplexadas de la aplicación.
+    
+    Raises:
+        ProcessingUnavailable: Si el enlace con el Servidor B falla
     """
     try:
-        reader, writer = await asyncio.open_connection(
-            config.processing_host, 
-            config.processing_port,
-            limit=2**16  # 64KB buffer
-        )
-        
-        # Enviar solicitud
-        message = build_message(request_data)
-        writer.write(message)
-        await writer.drain()
-        
-        # Leer respuesta: primero la longitud (4 bytes)
-        length_bytes = await reader.readexactly(4)
-        if len(length_bytes) < 4:
-            raise Exception('Error: No se pudo leer la longitud del mensaje')
-        
-        length = struct.unpack('!I', length_bytes)[0]
-        
-        # Leer el payload completo
-        payload = await reader.readexactly(length)
-        
-        writer.close()
-        await writer.wait_closed()
-        
-        return parse_message(payload)
+        return await pool.request(request_data, timeout=timeout)
         
+    except CircuitOpen as e:
+        logger.warning(str(e))
+        raise ProcessingUnavailable(str(e))
     except asyncio.TimeoutError:
-        logger.error("Timeout al conectar con servidor de procesamiento")
-        raise Exception("Timeout: Servidor de procesamiento no responde")
-    except ConnectionRefusedError:
-        logger.error("Conexión rechazada por servidor de procesamiento")
-        raise Exception("Error: Servidor de procesamiento no disponible")
+        logger.error("Timeout esperando al servidor de procesamiento")
+        raise ProcessingUnavailable("Timeout: Servidor de procesamiento no responde")
+    except (ConnectionError, OSError) as e:
+        logger.error(f"Conexión con servidor de procesamiento fallida: {e}")
+        raise ProcessingUnavailable("Error: Servidor de procesamiento no disponible")
     except Exception as e:
         logger.error(f"Error comunicándose con servidor de procesamiento: {e}")
         raise
 
+def page_measurements(page: FetchResult, resources: dict) -> dict:
+    """
+    Mediciones de la descarga que ya hizo el Servidor A. Viajan al
+    Servidor B para que el análisis de rendimiento no vuelva a bajar la página.
+    """
+    return {
+        'load_time_ms': page.load_time_ms,
+        'ttfb_ms': page.ttfb_ms,
+        'size_bytes': page.size,
+        'final_url': page.final_url,
+        'resources': resources
+    }
+
+def processing_request(app: web.Application, url: str, page: FetchResult,
+                       scraping_data: dict, client: str = None, trace_id: str = None) -> dict:
+    """
+    Arma la solicitud para el Servidor B: imágenes a procesar, mediciones
+    de la descarga y el deadline. Saca el inventario de recursos de
+    scraping_data para que la respuesta al cliente no cambie de forma.
+    
+    El deadline viaja como presupuesto relativo ('deadline_ms') igual al
+    tiempo que el Servidor A espera la respuesta: el Servidor B devuelve
+    lo que terminó a tiempo en lugar de que la solicitud entera venza.
+    
+    client identifica al cliente que originó el scrape, para el reparto
+    justo del pool del Servidor B. Con trace_id el Servidor B devuelve los
+    spans de sus tareas en 'timings'.
+    """
+    resources = scraping_data.pop('resources', {})
+    images = [
+        img for img in scraping_data.get('links', []) 
+        if img.endswith(('.jpg', '.png', '.jpeg', '.gif', '.webp'))
+    ]
+    request_data = {
+        'url': url,
+        'images': images,
+        'page': page_measurements(page, resources),
+        'deadline_ms': int(app['config'].processing_timeout * 1000)
+    }
+    if client:
+        request_data['client'] = client
+    if trace_id:
+        request_data['trace_id'] = trace_id
+    if app['config'].remeasure_performance:
+        request_data['remeasure'] = True
+    return request_data
+
+async def download_page(app: web.Application, url: str, trace: Trace, entry=None) -> tuple:
+    """
+    Descarga y parsea la página (condicional si entry trae validadores).
+    Con --stream-parse cada chunk se parsea apenas llega y el HTML no se
+    guarda; si no, se parsea en una sola pasada, en el pool de procesos
+    si es grande. Con --stream-parse el parseo se superpone con la
+    descarga, así que el span parse_html mide solo el cierre.
+
+    Returns:
+        Tupla (FetchResult, scraping_data); scraping_data es None si el
+        origen respondió 304
+    """
+    config = app['config']
+    metrics = app['metrics']
+    extractor = PageExtractor(collect_resources=True) if config.stream_parse else None
+    with metrics.fetch_html.time(), trace.span('fetch_html'):
+        page = await fetch_page(
+            url,
+            timeout=30,
+            session=app['http_session'],
+            etag=entry.etag if entry else None,
+            last_modified=entry.last_modified if entry else None,
+            max_size=config.max_page_mb * 1024 * 1024,
+            parser=extractor,
+            keep_html=extractor is None
+        )
+    metrics.origin_bytes.inc(page.size)
+    if page.not_modified:
+        return page, None
+    # El parseo y la extracción de metadatos son una sola pasada: parse_html mide ambos
+    with metrics.parse_html.time(), trace.span('parse_html'):
+        if extractor is not None:
+            return page, finish_page(extractor)
+        return page, await app['parse_pool'].parse(page.html, resources=True)
+
+async def build_response(app: web.Application, url: str, page: FetchResult,
+                         scraping_data: dict, trace: Trace, client: str = None) -> dict:
+    """
+    Coordina con el Servidor B y arma la respuesta consolidada.
+    
+    Si el Servidor B no está disponible se devuelven solo los datos de
+    scraping con status 'degraded' en lugar de fallar la solicitud.
+    Los spans del Servidor B se pasan a trace y no quedan en la respuesta.
+    """
+    # Generar timestamp ISO (timezone-aware)
+    timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    
+    # Comunicarse con Servidor B de forma asíncrona
+    logger.info(f"Enviando solicitud a servidor de procesamiento")
+    status = 'success'
+    try:
+        with app['metrics'].processing.time(), trace.span('processing'):
+            processing_data = await send_to_processing_server(
+                app['processing_pool'],
+                processing_request(app, url, page, scraping_data, client, trace.id),
+                timeout=app['config'].processing_timeout
+            )
+    except ProcessingUnavailable as e:
+        logger.warning(f"Respuesta degradada para {url}: {e}")
+        processing_data = {'error': str(e)}
+        status = 'degraded'
+    trace.extend(processing_data.pop('timings', None), server=SERVER_B)
+    if processing_data.get('overloaded'):
+        raise Overloaded(processing_data['error'], processing_data.get('retry_after', 1))
+    
+    # Consolidar respuesta
+    return {
+        'url': url,
+        'timestamp': timestamp,
+        'scraping_data': scraping_data,
+        'processing_data': processing_data,
+        'status': status
+    }
+
+async def run_scrape(app: web.Application, url: str, trace: Trace, client: str = None) -> tuple:
+    """
+    Ejecuta el pipeline completo de scraping pasando por la cache de resultados.
+    Las entradas vencidas con ETag/Last-Modified se revalidan con un GET
+    condicional: si el origen responde 304 se reutiliza la respuesta sin
+    volver a parsear ni consultar al Servidor B.
+    
+    Las solicitudes concurrentes para la misma URL normalizada comparten
+    un único trabajo (single-flight): una sola descarga y una sola
+    solicitud al Servidor B, a nombre del primer cliente.
+    
+    Solo el trabajo real (descarga, parseo y Servidor B) pasa por el
+    control de admisión; los HIT de la cache no ocupan lugar.
+    
+    Los spans de cada etapa se registran en trace. Las solicitudes unidas
+    a un trabajo en curso solo registran su espera: los spans quedan en la
+    traza de quien lo inició.
+    
+    Returns:
+        Tupla (response, body, cache_status) donde body es la respuesta
+        serializada en JSON y cache_status es HIT, REVALIDATED o MISS
+    """
+    key = normalize_url(url)
+    return await app['singleflight'].do(key, lambda: _run_scrape(app, url, key, trace, client))
+
+async def _run_scrape(app: web.Application, url: str, key: str, trace: Trace,
+                      client: str = None) -> tuple:
+    """Pipeline de run_scrape para una URL sin deduplicar"""
+    cache = app['result_cache']
+    entry, fresh = cache.lookup(key)
+    if fresh:
+        logger.info(f"Respuesta cacheada para {url}")
+        return entry.response, entry.body, 'HIT'
+    
+    queued = time.time()
+    async with app['admission'].slot():
+        trace.add('admission', queued)
+        # Descargar HTML de forma asíncrona (condicional si hay validadores)
+        page, scraping_data = await download_page(app, url, trace, entry)
+        if page.not_modified:
+            cache.revalidated(key, page.etag, page.last_modified)
+            return entry.response, entry.body, 'REVALIDATED'
+        
+        response = await build_response(app, url, page, scraping_data, trace, client)
+    # Screenshot y thumbnails llegan como bytes crudos (protocolo v2) y se
+    # codifican en base64 recién acá, una sola vez
+    with trace.span('serialize'):
+        body = to_json(response).encode('utf-8')
+    if complete_processing(response['processing_data']):
+        cache.put(key, response, body, page.etag, page.last_modified)
+    return response, body, 'MISS'
+
+def complete_processing(processing_data: dict) -> bool:
+    """
+    True si el Servidor B terminó todas las tareas. Las respuestas con
+    tareas cortadas por el deadline no se cachean: otro intento puede
+    completarlas.
+    """
+    if 'error' in processing_data:
+        return False
+    return 'timeout' not in processing_data.get('task_status', {}).values()
+
+def with_timings(body: bytes, trace: Trace) -> bytes:
+    """
+    Agrega el bloque 'timings' a una respuesta ya serializada, sin volver
+    a codificarla: la respuesta cacheada queda igual y sin tiempos.
+    """
+    timings = json.dumps(trace.timings()).encode('utf-8')
+    return body[:-1] + b', "timings": ' + timings + b'}'
+
+def wants_timings(value) -> bool:
+    """True si el parámetro timings de la solicitud pide el bloque de tiempos"""
+    return str(value).lower() in ('1', 'true', 'yes')
+
+def record_trace(app: web.Application, trace: Trace, label: str = None):
+    """Cierra la traza y la escribe en --trace-file, si está configurado"""
+    trace.finish()
+    if app['trace_writer'] is not None:
+        app['trace_writer'].write(trace, label)
+
+def scrape_error(url: str, error: Exception) -> tuple:
+    """
+    Traduce una excepción del pipeline a (status HTTP, cuerpo de error).
+    """
+    if isinstance(error, PageTooLarge):
+        return 502, {'error': str(error), 'status': 'failed'}
+    if isinstance(error, Overloaded):
+        return 503, {'error': str(error), 'status': 'failed', 'retry_after': error.retry_after}
+    if isinstance(error, ValueError):
+        logger.error(f"URL inválida: {error}")
+        return 400, {'error': f'Invalid URL: {str(error)}', 'status': 'failed'}
+    if isinstance(error, asyncio.TimeoutError):
+        logger.error(f"Timeout descargando {url}")
+        return 504, {'error': 'Timeout: La página tardó demasiado en cargar', 'status': 'failed'}
+    logger.error(f"Error en scraping: {error}")
+    return 500, {'error': str(error), 'status': 'failed'}
+
 async def scrape_handler(request):
     """
     Handler principal que maneja las solicitudes de scraping.
     Coordina automáticamente con el Servidor B.
+    
+    Cada scrape recibe un trace ID (header X-Trace-Id). Con timings=1 la
+    respuesta incluye el bloque 'timings' con los spans de ambos servidores.
     """
     url = request.query.get('url')
     if not url:
@@ -81,74 +340,337 @@ async def scrape_handler(request):
             status=400
         )
     
+    trace = Trace()
+    headers = {'X-Trace-Id': trace.id}
     try:
-        logger.info(f"Iniciando scraping de {url}")
-        
-        # Paso 1: Descargar HTML de forma asíncrona
-        html = await fetch_html(url, timeout=30)
+        logger.info(f"Iniciando scraping de {url} (traza {trace.id})")
         
-        # Paso 2: Parsear HTML localmente
-        scraping_data = parse_html(html)
-        scraping_data['meta_tags'] = extract_metadata(html)
+        response, body, cache_status = await run_scrape(request.app, url, trace, request.remote)
+        trace.finish()
+        if wants_timings(request.query.get('timings')):
+            body = with_timings(body, trace)
         
-        # Paso 3: Generar timestamp ISO (timezone-aware)
-        timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
-        
-        # Paso 4: Extraer imágenes para procesamiento
-        images = [
-            img for img in scraping_data.get('links', []) 
-            if img.endswith(('.jpg', '.png', '.jpeg', '.gif', '.webp'))
-        ]
-        
-        # Paso 5: Comunicarse con Servidor B de forma asíncrona
-        logger.info(f"Enviando solicitud a servidor de procesamiento")
-        processing_data = await send_to_processing_server(
-            request.app['config'],
-            {'url': url, 'images': images}
+        logger.info(f"Scraping completado exitosamente para {url} (cache: {cache_status})")
+        headers['X-Cache'] = cache_status
+        return web.Response(
+            body=body,
+            content_type='application/json',
+            headers=headers
         )
         
-        # Paso 6: Consolidar respuesta
-        response = {
-            'url': url,
-            'timestamp': timestamp,
-            'scraping_data': scraping_data,
-            'processing_data': processing_data,
-            'status': 'success'
-        }
-        
-        logger.info(f"Scraping completado exitosamente para {url}")
-        return web.json_response(response)
-        
-    except ValueError as e:
-        logger.error(f"URL inválida: {e}")
-        return web.json_response(
-            {'error': f'Invalid URL: {str(e)}', 'status': 'failed'},
-            status=400
-        )
-    except asyncio.TimeoutError:
-        logger.error(f"Timeout descargando {url}")
-        return web.json_response(
-            {'error': 'Timeout: La página tardó demasiado en cargar', 'status': 'failed'},
-            status=504
-        )
     except Exception as e:
-        logger.error(f"Error en scraping: {e}")
-        return web.json_response(
-            {'error': str(e), 'status': 'failed'},
-            status=500
-        )
+        status, error_body = scrape_error(url, e)
+        if isinstance(e, Overloaded):
+            headers['Retry-After'] = str(e.retry_after)
+        return web.json_response(error_body, status=status, headers=headers)
+    finally:
+        record_trace(request.app, trace, url)
+
+async def batch_scrape_handler(request):
+    """
+    Scrapea muchas URLs de forma concurrente y devuelve cada resultado como
+    una línea NDJSON apenas termina, sin esperar al resto del lote.
+    
+    Cuerpo esperado: {"urls": [...], "concurrency": N (opcional),
+    "timings": true (opcional)}
+    """
+    config = request.app['config']
+    try:
+        payload = await request.json()
+        urls = payload.get('urls')
+        if not isinstance(urls, list) or not urls:
+            raise ValueError('Se requiere una lista no vacía en "urls"')
+        if len(urls) > config.batch_max_urls:
+            raise ValueError(f'Máximo {config.batch_max_urls} URLs por lote')
+        concurrency = int(payload.get('concurrency', config.batch_concurrency))
+        timings = wants_timings(payload.get('timings', False))
+    except (ValueError, TypeError, AttributeError) as e:
+        return web.json_response({'error': str(e), 'status': 'failed'}, status=400)
+    
+    concurrency = max(1, min(concurrency, config.batch_concurrency))
+    semaphore = asyncio.Semaphore(concurrency)
+    logger.info(f"Lote recibido: {len(urls)} URLs con concurrencia {concurrency}")
+    
+    async def scrape_one(url) -> bytes:
+        async with semaphore:
+            trace = Trace()
+            try:
+                if not isinstance(url, str) or not url:
+                    raise ValueError('URL vacía')
+                _, body, _ = await run_scrape(request.app, url, trace, request.remote)
+                trace.finish()
+                return with_timings(body, trace) if timings else body
+            except Exception as e:
+                _, error_body = scrape_error(url, e)
+                error_body['url'] = url
+                return json.dumps(error_body).encode('utf-8')
+            finally:
+                record_trace(request.app, trace, str(url))
+    
+    stream = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson'})
+    await stream.prepare(request)
+    
+    tasks = [asyncio.ensure_future(scrape_one(url)) for url in urls]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            body = await next_done
+            await stream.write(body + b'\n')
+    finally:
+        for task in tasks:
+            task.cancel()
+    
+    await stream.write_eof()
+    logger.info(f"Lote completado: {len(urls)} URLs")
+    return stream
+
+async def run_stage(app: web.Application, job, stage: str, request_data: dict):
+    """Pide al Servidor B una sola tarea del trabajo y guarda su resultado"""
+    job.stages[stage] = RUNNING
+    try:
+        with app['metrics'].processing.time(), job.trace.span(f'processing.{stage}', lane=stage):
+            result = await send_to_processing_server(
+                app['processing_pool'],
+                dict(request_data, tasks=[stage]),
+                timeout=app['config'].processing_timeout
+            )
+    except Exception as e:
+        job.stage_failed(stage, str(e))
+        return
+    job.trace.extend(result.pop('timings', None), server=SERVER_B)
+    status = result.get('task_status', {}).get(stage, 'ok')
+    if 'error' in result:
+        job.stage_failed(stage, result['error'])
+    elif status == 'timeout':
+        job.stage_failed(stage, 'Tiempo agotado')
+    else:
+        job.stage_done(stage, result.get(stage))
+
+async def run_job(app: web.Application, job):
+    """
+    Ejecuta un trabajo asíncrono. Los datos de scraping quedan disponibles
+    apenas se parsea la página, y cada tarea del Servidor B se pide por
+    separado (sobre la misma conexión multiplexada) para publicar su
+    resultado en cuanto termina. Al final se llama al webhook, si hay.
+    """
+    job.start()
+    trace = job.trace
+    try:
+        entry, fresh = app['result_cache'].lookup(normalize_url(job.url))
+        if fresh:
+            job.complete(entry.response)
+        else:
+            queued = time.time()
+            async with app['admission'].slot():
+                trace.add('admission', queued)
+                page, scraping_data = await download_page(app, job.url, trace)
+                request_data = processing_request(app, job.url, page, scraping_data,
+                                                  job.client, trace.id)
+                job.timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+                job.stage_done('scraping', scraping_data)
+                await asyncio.gather(*(
+                    run_stage(app, job, stage, request_data)
+                    for stage in ('performance', 'thumbnails', 'screenshot')
+                ))
+            job.complete()
+    except asyncio.CancelledError:
+        job.fail('Trabajo cancelado')
+        raise
+    except Exception as e:
+        _, error_body = scrape_error(job.url, e)
+        job.fail(error_body['error'])
+    finally:
+        app['jobs'].finished(job)
+        record_trace(app, trace, job.url)
+    
+    logger.info(f"Trabajo {job.id} terminado ({job.status}) para {job.url}")
+    if job.webhook:
+        await notify_webhook(app, job)
+
+async def notify_webhook(app: web.Application, job):
+    """Envía el trabajo terminado al webhook y guarda el status de la respuesta"""
+    try:
+        async with app['http_session'].post(
+            job.webhook,
+            data=to_json(job.to_dict()),
+            headers={'Content-Type': 'application/json'},
+            timeout=aiohttp.ClientTimeout(total=WEBHOOK_TIMEOUT)
+        ) as response:
+            job.webhook_status = response.status
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Error llamando al webhook {job.webhook}: {e}")
+        job.webhook_status = f'error: {e}'
+
+async def submit_job_handler(request):
+    """
+    Crea un trabajo de scraping asíncrono y devuelve su ID sin esperar
+    el resultado. El estado se consulta con GET /jobs/{id}.
+    
+    Cuerpo esperado: {"url": "...", "webhook": "..." (opcional)}
+    """
+    try:
+        payload = await request.json()
+        url = payload.get('url')
+        webhook = payload.get('webhook')
+        if not isinstance(url, str) or not url:
+            raise ValueError('Se requiere "url"')
+        if webhook is not None and urlparse(str(webhook)).scheme not in ('http', 'https'):
+            raise ValueError('"webhook" debe ser una URL http o https')
+    except (ValueError, TypeError, AttributeError) as e:
+        return web.json_response({'error': str(e), 'status': 'failed'}, status=400)
+    
+    try:
+        job = request.app['jobs'].create(url, webhook, request.remote)
+    except JobStoreFull as e:
+        return web.json_response({'error': str(e), 'status': 'failed'}, status=503)
+    
+    task = asyncio.ensure_future(run_job(request.app, job))
+    request.app['job_tasks'].add(task)
+    task.add_done_callback(request.app['job_tasks'].discard)
+    
+    logger.info(f"Trabajo {job.id} creado para {url}")
+    location = f'/jobs/{job.id}'
+    return web.json_response(
+        {'job_id': job.id, 'status': job.status, 'location': location},
+        status=202,
+        headers={'Location': location}
+    )
+
+async def get_job_handler(request):
+    """
+    Estado de un trabajo con los resultados parciales de cada etapa.
+    Con timings=1 incluye los spans registrados hasta el momento.
+    """
+    job = request.app['jobs'].get(request.match_info['job_id'])
+    if job is None:
+        return web.json_response({'error': 'Trabajo no encontrado', 'status': 'failed'}, status=404)
+    data = job.to_dict()
+    if wants_timings(request.query.get('timings')):
+        data['timings'] = job.trace.timings()
+    return web.Response(body=to_json(data).encode('utf-8'), content_type='application/json')
 
 async def health_check(request):
     """Endpoint de health check"""
     return web.json_response({'status': 'healthy'})
 
+async def stats_handler(request):
+    """Endpoint con estadísticas internas del servidor"""
+    return web.json_response({
+        'http': request.app['http_stats'].to_dict(),
+        'processing': request.app['processing_pool'].stats(),
+        'parsing': request.app['parse_pool'].stats(),
+        'cache': request.app['result_cache'].stats(),
+        'singleflight': request.app['singleflight'].stats(),
+        'jobs': request.app['jobs'].stats(),
+        'admission': request.app['admission'].stats()
+    })
+
+async def http_session_ctx(app: web.Application):
+    """
+    Crea la ClientSession compartida por todos los scrapes y la cierra
+    al apagar el servidor.
+    """
+    config = app['config']
+    app['http_stats'] = ConnectionStats()
+    app['http_session'] = create_session(
+        limit=config.http_limit,
+        limit_per_host=config.http_limit_per_host,
+        stats=app['http_stats']
+    )
+    logger.info(
+        f"Pool HTTP creado (limit={config.http_limit}, "
+        f"limit_per_host={config.http_limit_per_host})"
+    )
+    yield
+    await app['http_session'].close()
+    logger.info("Pool HTTP cerrado")
+
+async def processing_pool_ctx(app: web.Application):
+    """
+    Crea los pools de conexiones persistentes hacia los Servidores B, cada
+    uno con su circuit breaker, y arranca el health check. Las conexiones
+    se abren bajo demanda y se cierran al apagar el servidor.
+    """
+    config = app['config']
+    app['processing_pool'] = ProcessingCluster(
+        config.processing_endpoints,
+        size=config.processing_connections,
+        max_message_size=config.processing_max_mb * 1024 * 1024,
+        codecs=config.processing_codecs,
+        failure_threshold=config.circuit_failures,
+        reset_timeout=config.circuit_reset,
+        hedge=config.processing_hedge,
+        balance=config.processing_balance,
+        health_interval=config.health_interval
+    )
+    app['processing_pool'].start()
+    yield
+    await app['processing_pool'].close()
+    logger.info("Pool de conexiones con procesamiento cerrado")
+
+async def parse_pool_ctx(app: web.Application):
+    """
+    Crea el pool de procesos para parsear HTML, dimensionado por --workers.
+    """
+    config = app['config']
+    app['parse_pool'] = ParsePool(
+        workers=config.workers,
+        inline_threshold=config.inline_parse_kb * 1024
+    )
+    logger.info(f"Pool de parseo inicializado con {config.workers} workers")
+    yield
+    app['parse_pool'].shutdown()
+    logger.info("Pool de parseo cerrado")
+
+async def trace_writer_ctx(app: web.Application):
+    """Abre el archivo de trazas de --trace-file y lo cierra al apagar el servidor"""
+    path = app['config'].trace_file
+    app['trace_writer'] = TraceWriter(path) if path else None
+    if path:
+        logger.info(f"Trazas en formato Trace Event en {path}")
+    yield
+    if app['trace_writer'] is not None:
+        app['trace_writer'].close()
+
+async def jobs_ctx(app: web.Application):
+    """Cancela los trabajos asíncronos que siguen en curso al apagar el servidor"""
+    app['job_tasks'] = set()
+    yield
+    tasks = list(app['job_tasks'])
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if tasks:
+        logger.info(f"{len(tasks)} trabajos en curso cancelados")
+
 def create_app(config: ServerConfig) -> web.Application:
     """Factory para crear la aplicación aiohttp"""
-    app = web.Application()
+    app = web.Application(middlewares=[metrics_middleware])
     app['config'] = config
+    app['result_cache'] = ResultCache(
+        ttl=config.cache_ttl,
+        max_bytes=config.cache_mb * 1024 * 1024
+    )
+    app['singleflight'] = SingleFlight()
+    app['jobs'] = JobStore(max_jobs=config.max_jobs, ttl=config.job_ttl)
+    app['admission'] = AdmissionControl(
+        limit=config.max_concurrent,
+        max_queue=config.max_queue,
+        queue_timeout=config.queue_timeout
+    )
+    app['metrics'] = ScrapingMetrics(app)
+    app.cleanup_ctx.append(http_session_ctx)
+    app.cleanup_ctx.append(processing_pool_ctx)
+    app.cleanup_ctx.append(parse_pool_ctx)
+    app.cleanup_ctx.append(trace_writer_ctx)
+    app.cleanup_ctx.append(jobs_ctx)
     app.add_routes([
         web.get('/scrape', scrape_handler),
-        web.get('/health', health_check)
+        web.post('/scrape/batch', batch_scrape_handler),
+        web.post('/jobs', submit_job_handler),
+        web.get('/jobs/{job_id}', get_job_handler),
+        web.get('/health', health_check),
+        web.get('/stats', stats_handler),
+        web.get('/metrics', metrics_handler)
     ])
     return app
 
@@ -197,7 +719,190 @@ Ejemplos de uso:
         '-w', '--workers',
         type=int,
         default=4,
-        help='Número de workers (default: 4)'
+        help='Número de procesos para parsear HTML; 0 parsea todo en el event loop (default: 4)'
+    )
+    
+    parser.add_argument(
+        '--http-limit',
+        type=int,
+        default=100,
+        help='Máximo de conexiones HTTP simultáneas en total (default: 100)'
+    )
+    
+    parser.add_argument(
+        '--http-limit-per-host',
+        type=int,
+        default=10,
+        help='Máximo de conexiones HTTP simultáneas por host (default: 10)'
+    )
+    
+    parser.add_argument(
+        '--processing-connections',
+        type=int,
+        default=4,
+        help='Conexiones persistentes hacia el servidor de procesamiento (default: 4)'
+    )
+    
+    parser.add_argument(
+        '--processing-timeout',
+        type=float,
+        default=180,
+        help='Timeout en segundos para la respuesta del servidor de procesamiento (default: 180)'
+    )
+    
+    parser.add_argument(
+        '--inline-parse-kb',
+        type=int,
+        default=256,
+        help='Páginas más chicas que este tamaño se parsean sin usar el pool (default: 256)'
+    )
+    
+    parser.add_argument(
+        '--cache-ttl',
+        type=float,
+        default=300,
+        help='Segundos que una respuesta cacheada se considera fresca; 0 desactiva la cache (default: 300)'
+    )
+    
+    parser.add_argument(
+        '--cache-mb',
+        type=int,
+        default=64,
+        help='Memoria máxima de la cache de resultados en MB (default: 64)'
+    )
+    
+    parser.add_argument(
+        '--batch-concurrency',
+        type=int,
+        default=10,
+        help='Máximo de scrapes simultáneos por lote en /scrape/batch (default: 10)'
+    )
+    
+    parser.add_argument(
+        '--batch-max-urls',
+        type=int,
+        default=10000,
+        help='Máximo de URLs aceptadas por lote (default: 10000)'
+    )
+    
+    parser.add_argument(
+        '--processing-max-mb',
+        type=int,
+        default=32,
+        help='Tamaño máximo de una respuesta del servidor de procesamiento en MB (default: 32)'
+    )
+    
+    parser.add_argument(
+        '--processing-codecs',
+        type=lambda value: [name.strip() for name in value.split(',') if name.strip()],
+        default=None,
+        help=f'Codecs a ofrecer al servidor de procesamiento, en orden de preferencia '
+             f'(default: {",".join(available_codecs())})'
+    )
+    
+    parser.add_argument(
+        '--max-page-mb',
+        type=int,
+        default=50,
+        help='Tamaño máximo de una página descargada en MB; se corta al superarlo (default: 50)'
+    )
+    
+    parser.add_argument(
+        '--stream-parse',
+        action='store_true',
+        help='Parsear el HTML a medida que se descarga en lugar de usar el pool de parseo'
+    )
+    
+    parser.add_argument(
+        '--remeasure-performance',
+        action='store_true',
+        help='Pedir al servidor de procesamiento que vuelva a medir el rendimiento descargando la página'
+    )
+    
+    parser.add_argument(
+        '--max-jobs',
+        type=int,
+        default=1000,
+        help='Máximo de trabajos asíncronos guardados en memoria (default: 1000)'
+    )
+    
+    parser.add_argument(
+        '--job-ttl',
+        type=float,
+        default=600,
+        help='Segundos que se conserva un trabajo terminado (default: 600)'
+    )
+    
+    parser.add_argument(
+        '--max-concurrent',
+        type=int,
+        default=50,
+        help='Máximo de scrapes simultáneos; 0 desactiva el control de admisión (default: 50)'
+    )
+    
+    parser.add_argument(
+        '--max-queue',
+        type=int,
+        default=100,
+        help='Scrapes que pueden esperar lugar; con la cola llena se responde 503 (default: 100)'
+    )
+    
+    parser.add_argument(
+        '--queue-timeout',
+        type=float,
+        default=10,
+        help='Segundos máximos de espera en la cola de admisión (default: 10)'
+    )
+    
+    parser.add_argument(
+        '--processing-endpoints',
+        type=parse_endpoints,
+        default=None,
+        help='Servidores de procesamiento como host:puerto separados por comas; '
+             'reemplaza a -b/-q (ej: localhost:9999,[::1]:9998)'
+    )
+    
+    parser.add_argument(
+        '--circuit-failures',
+        type=int,
+        default=5,
+        help='Fallas seguidas que abren el circuito de un servidor de procesamiento (default: 5)'
+    )
+    
+    parser.add_argument(
+        '--circuit-reset',
+        type=float,
+        default=10,
+        help='Segundos de circuito abierto antes de la solicitud de prueba (default: 10)'
+    )
+    
+    parser.add_argument(
+        '--processing-hedge',
+        action='store_true',
+        help='Duplicar en otro servidor de procesamiento las solicitudes que tardan más que el p95'
+    )
+    
+    parser.add_argument(
+        '--processing-balance',
+        choices=BALANCE_MODES,
+        default=HASH,
+        help='Reparto entre servidores de procesamiento: hash consistente de la URL '
+             'o el menos cargado (default: hash)'
+    )
+    
+    parser.add_argument(
+        '--health-interval',
+        type=float,
+        default=5,
+        help='Segundos entre health checks a los servidores de procesamiento; 0 los desactiva (default: 5)'
+    )
+    
+    parser.add_argument(
+        '--trace-file',
+        type=str,
+        default=None,
+        help='Archivo donde escribir las trazas de cada scrape en formato Trace Event '
+             '(chrome://tracing, Perfetto); se reescribe al arrancar'
     )
     
     return parser.parse_args()
@@ -210,12 +915,38 @@ if __name__ == '__main__':
         port=args.port,
         processing_host=args.processing_ip,
         processing_port=args.processing_port,
-        workers=args.workers
+        workers=args.workers,
+        http_limit=args.http_limit,
+        http_limit_per_host=args.http_limit_per_host,
+        processing_connections=args.processing_connections,
+        processing_timeout=args.processing_timeout,
+        inline_parse_kb=args.inline_parse_kb,
+        cache_ttl=args.cache_ttl,
+        cache_mb=args.cache_mb,
+        batch_concurrency=args.batch_concurrency,
+        batch_max_urls=args.batch_max_urls,
+        processing_max_mb=args.processing_max_mb,
+        processing_codecs=args.processing_codecs,
+        max_page_mb=args.max_page_mb,
+        stream_parse=args.stream_parse,
+        remeasure_performance=args.remeasure_performance,
+        max_jobs=args.max_jobs,
+        job_ttl=args.job_ttl,
+        max_concurrent=args.max_concurrent,
+        max_queue=args.max_queue,
+        queue_timeout=args.queue_timeout,
+        processing_endpoints=args.processing_endpoints,
+        circuit_failures=args.circuit_failures,
+        circuit_reset=args.circuit_reset,
+        processing_hedge=args.processing_hedge,
+        processing_balance=args.processing_balance,
+        health_interval=args.health_interval,
+        trace_file=args.trace_file
     )
     
     app = create_app(config)
     
     logger.info(f"Iniciando servidor en {config.host}:{config.port}")
-    logger.info(f"Procesamiento en {config.processing_host}:{config.processing_port}")
+    logger.info(f"Procesamiento en {', '.join(f'{host}:{port}' for host, port in config.processing_endpoints)}")
     
     web.run_app(app, host=config.host, port=config.port)
\ No newline at end of file
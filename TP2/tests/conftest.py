@@ -0,0 +1,64 @@
+import pytest
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import server_processing
+
+def fake_screenshot(url, deadline=None):
+    if url == 'slow':
+        time.sleep(0.3)
+    return None
+
+def fake_thumbnails(images, deadline=None):
+    return []
+
+@pytest.fixture
+def processing_server(monkeypatch):
+    """
+    Servidor B asyncio real corriendo en un thread propio, con las tareas
+    del pool reemplazadas por funciones falsas y un ThreadPoolExecutor.
+    La URL 'slow' tarda 0.3s; el resto responde al instante.
+    Devuelve (host, port) y la lista de solicitudes recibidas.
+    """
+    received = []
+
+    def fake_performance(url, page=None, remeasure=False, deadline=None):
+        received.append({'url': url, 'page': page, 'remeasure': remeasure})
+        return {'load_time_ms': 1, 'total_size_kb': 1, 'num_requests': 1, 'echo': url}
+
+    monkeypatch.setattr(server_processing, 'process_screenshot', fake_screenshot)
+    monkeypatch.setattr(server_processing, 'process_performance', fake_performance)
+    monkeypatch.setattr(server_processing, 'process_thumbnails', fake_thumbnails)
+
+    loop = asyncio.new_event_loop()
+    server = server_processing.AsyncProcessingServer(
+        '127.0.0.1', 0, executor=ThreadPoolExecutor(max_workers=8), num_processes=8
+    )
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+
+    yield server.sockets[0].getsockname()[:2], received
+
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+@pytest.fixture
+def threaded_processing_server(monkeypatch):
+    """Servidor B con socketserver y process_request reemplazado por una tarea falsa"""
+    def fake_process_request(request):
+        fake_screenshot(request['url'])
+        return {'performance': {'echo': request['url']}}
+
+    monkeypatch.setattr(server_processing, 'process_request', fake_process_request)
+    server = server_processing.ThreadedTCPServer(
+        ('127.0.0.1', 0), server_processing.ProcessingRequestHandler
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
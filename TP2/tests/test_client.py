@@ -0,0 +1,79 @@
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import client
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert client.percentile(values, 50) == 50
+    assert client.percentile(values, 95) == 95
+    assert client.percentile([], 50) == 0.0
+
+def test_read_urls_closes_file(tmp_path):
+    import argparse
+    import warnings
+    path = tmp_path / 'urls.txt'
+    path.write_text('https://a.com\n\nhttps://b.com\n')
+    args = argparse.Namespace(url=None, file=str(path))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', ResourceWarning)
+        assert list(client.read_urls(args, None)) == ['https://a.com', 'https://b.com']
+
+    with pytest.raises(SystemExit):
+        client.read_urls(argparse.Namespace(url=None, file=str(tmp_path / 'falta.txt')), None)
+
+@pytest.mark.asyncio
+async def test_fetch_with_retries_honours_retry_after(monkeypatch):
+    import aiohttp
+    calls = []
+
+    async def scrape(request):
+        calls.append(request.query['url'])
+        if len(calls) == 1:
+            return web.json_response({'error': 'ocupado'}, status=503, headers={'Retry-After': '0'})
+        return web.json_response({'url': request.query['url'], 'status': 'success'})
+
+    monkeypatch.setattr(client.random, 'uniform', lambda a, b: 0)
+    app = web.Application()
+    app.add_routes([web.get('/scrape', scrape)])
+    async with TestServer(app) as server:
+        counters = {'retries': 0}
+        async with aiohttp.ClientSession() as session:
+            data = await client.fetch_with_retries(
+                session, str(server.make_url('/scrape')), 'https://example.com', 2, counters
+            )
+
+    assert data['status'] == 'success'
+    assert counters['retries'] == 1
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_scrape_async_reports_degraded_results_apart(capsys):
+    import argparse
+
+    async def scrape(request):
+        url = request.query['url']
+        if url.endswith('/b'):
+            return web.json_response({
+                'url': url, 'status': 'degraded',
+                'scraping_data': {'title': 'B'},
+                'processing_data': {'error': 'Servidor B no disponible'}
+            })
+        return web.json_response({'url': url, 'status': 'success', 'scraping_data': {'title': 'A'}})
+
+    app = web.Application()
+    app.add_routes([web.get('/scrape', scrape)])
+    async with TestServer(app) as server:
+        args = argparse.Namespace(server=str(server.make_url('/')), concurrency=2, output=None,
+                                  timeout=5, retries=0)
+        summary = await client.scrape_async(['https://a.com/a', 'https://a.com/b'], args)
+
+    assert (summary['total'], summary['ok'], summary['degraded'], summary['failed']) == (2, 1, 1, 0)
+    assert 'sin procesamiento: Servidor B no disponible' in capsys.readouterr().out
+
+    client.print_summary({'status': 'degraded', 'scraping_data': {'title': 'B'},
+                          'processing_data': {'error': 'Servidor B no disponible'}})
+    out = capsys.readouterr().out
+    assert 'Título: B' in out and 'Procesamiento no disponible: Servidor B no disponible' in out
+    assert 'Error desconocido' not in out
@@ -0,0 +1,659 @@
+import pytest
+import asyncio
+from common.protocol import (
+    build_message, parse_message, build_binary_message, parse_binary_message,
+    read_frame, MUX_HEADER, LENGTH_HEADER, MUX_MAGIC
+)
+from common.connection_pool import ProcessingConnectionPool, MultiplexedConnection
+from common.serialization import get_codec, CODECS
+import server_processing
+
+def test_build_message_framing():
+    legacy = build_message({'url': 'https://example.com'})
+    (length,) = LENGTH_HEADER.unpack(legacy[:4])
+    assert parse_message(legacy[4:4 + length]) == {'url': 'https://example.com'}
+
+    mux = build_message({'url': 'https://example.com'}, request_id=7)
+    length, request_id = MUX_HEADER.unpack(mux[:MUX_HEADER.size])
+    assert request_id == 7
+    assert parse_message(mux[MUX_HEADER.size:]) == {'url': 'https://example.com'}
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('server_fixture', ['processing_server', 'threaded_processing_server'])
+async def test_multiplexed_pool_out_of_order(request, server_fixture):
+    server = request.getfixturevalue(server_fixture)
+    host, port = server[0] if server_fixture == 'processing_server' else server
+    pool = ProcessingConnectionPool(host, port, size=1)
+    order = []
+
+    async def call(url):
+        result = await pool.request({'url': url}, timeout=5)
+        order.append(result['performance']['echo'])
+        return result
+
+    try:
+        results = await asyncio.gather(call('slow'), call('fast'))
+    finally:
+        await pool.close()
+
+    assert [r['performance']['echo'] for r in results] == ['slow', 'fast']
+    assert order == ['fast', 'slow']
+    assert pool.connections_opened == 1
+
+@pytest.mark.asyncio
+async def test_async_server_legacy_framing_and_stats(processing_server):
+    import struct
+    (host, port), _ = processing_server
+
+    async def roundtrip(message):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(build_message(message))
+        await writer.drain()
+        (length,) = struct.unpack('!I', await reader.readexactly(4))
+        response = parse_message(await reader.readexactly(length))
+        writer.close()
+        await writer.wait_closed()
+        return response
+
+    response = await roundtrip({'url': 'https://example.com', 'images': []})
+    assert response['performance']['echo'] == 'https://example.com'
+    assert await roundtrip({'images': []}) == {'error': 'URL faltante en solicitud'}
+
+    stats = await roundtrip({'action': 'stats'})
+    assert stats['in_flight_jobs'] == 0
+    assert stats['requests_served'] == 1
+
+def test_binary_message_roundtrip():
+    png = bytes(range(256)) * 8
+    data = {'screenshot': png, 'thumbnails': [b'\xff\xd8a', b''], 'performance': {'load_time_ms': 3}}
+    frame = build_binary_message(data, request_id=9)
+
+    length, request_id = MUX_HEADER.unpack(frame[:MUX_HEADER.size])
+    assert request_id == 9
+    assert length == len(frame) - MUX_HEADER.size
+    assert parse_binary_message(frame[MUX_HEADER.size:]) == data
+    # Los binarios viajan crudos: sin el ~33% extra de base64
+    assert length < len(png) + 200
+
+    with pytest.raises(ValueError):
+        parse_binary_message(frame[MUX_HEADER.size:-1])
+
+@pytest.mark.asyncio
+async def test_negotiated_binary_frames_and_v1_fallback(processing_server, monkeypatch):
+    import base64
+    (host, port), _ = processing_server
+    png = b'\x89PNG' + bytes(5000)
+    monkeypatch.setattr(server_processing, 'process_screenshot', lambda url, deadline=None: png)
+    monkeypatch.setattr(server_processing, 'process_thumbnails', lambda images, deadline=None: [b'jpg'])
+
+    v2 = MultiplexedConnection(host, port)
+    v1 = MultiplexedConnection(host, port, versions=(1,))
+    small = MultiplexedConnection(host, port, max_message_size=1000)
+    try:
+        for conn in (v2, v1, small):
+            await conn.connect()
+        binary = await v2.request({'url': 'https://example.com'})
+        legacy = await v1.request({'url': 'https://example.com'})
+        too_big = await small.request({'url': 'https://example.com'})
+    finally:
+        for conn in (v2, v1, small):
+            await conn.close()
+
+    assert (v2.version, v1.version) == (2, 1)
+    assert binary['screenshot'] == png and binary['thumbnails'] == [b'jpg']
+    assert legacy['screenshot'] == base64.b64encode(png).decode()
+    assert too_big['error'].startswith('Respuesta demasiado grande')
+
+@pytest.mark.asyncio
+async def test_client_falls_back_to_v1_with_old_server():
+    async def old_server(reader, writer):
+        # Servidor anterior al handshake: solo entiende MUX_MAGIC
+        if await reader.readexactly(4) == MUX_MAGIC:
+            request_id, payload = await read_frame(reader)
+            writer.write(build_message({'echo': parse_message(payload)['url']}, request_id))
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(old_server, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    conn = MultiplexedConnection('127.0.0.1', port)
+    try:
+        await conn.connect()
+        assert conn.version == 1
+        assert await conn.request({'url': 'x'}) == {'echo': 'x'}
+    finally:
+        await conn.close()
+        server.close()
+        await server.wait_closed()
+
+@pytest.mark.asyncio
+async def test_threaded_server_negotiates_v2(threaded_processing_server):
+    host, port = threaded_processing_server
+    conn = MultiplexedConnection(host, port)
+    try:
+        await conn.connect()
+        assert conn.version == 2
+        assert (await conn.request({'url': 'fast'}))['performance'] == {'echo': 'fast'}
+    finally:
+        await conn.close()
+
+SAMPLE = {
+    'title': 'Título ñ', 'links': ['https://example.com/' + 'a' * 300, ''],
+    'count': 3, 'big': 2**40, 'huge': 2**70, 'neg': -5, 'ratio': 0.25,
+    'flags': [True, False, None], 'nested': {'h1': 1}, 'blob': b'\x00\xff' * 10
+}
+
+@pytest.mark.parametrize('name', list(CODECS))
+def test_codecs_roundtrip(name):
+    codec = get_codec(name)
+    # Los codecs de texto no transportan bytes crudos (el frame v2 los adjunta aparte)
+    data = dict(SAMPLE, blob=SAMPLE['blob'] if codec.binary else SAMPLE['blob'].hex())
+    assert codec.decode(codec.encode(data)) == data
+
+    frame = build_binary_message(SAMPLE, 1, codec)
+    assert parse_binary_message(frame[MUX_HEADER.size:], codec) == SAMPLE
+
+    with pytest.raises(ValueError):
+        codec.decode(codec.encode(data)[:-3])
+
+def test_struct_codec_rejects_unhashable_keys():
+    import struct
+    codec = get_codec('struct')
+    # Dict de una entrada cuya clave es una lista vacía
+    payload = b'm' + struct.pack('!I', 1) + codec.encode([]) + codec.encode(None)
+
+    with pytest.raises(ValueError, match='struct inválido'):
+        codec.decode(payload)
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        get_codec('pickle')
+
+@pytest.mark.asyncio
+async def test_codec_negotiated_per_connection(processing_server, monkeypatch):
+    (host, port), _ = processing_server
+    monkeypatch.setattr(server_processing, 'process_screenshot', lambda url, deadline=None: b'\x89PNG')
+
+    struct_conn = MultiplexedConnection(host, port, codecs=['struct', 'json'])
+    default_conn = MultiplexedConnection(host, port)
+    try:
+        await struct_conn.connect()
+        await default_conn.connect()
+        assert struct_conn.codec.name == 'struct'
+        assert default_conn.codec.name == next(iter(CODECS))
+        for conn in (struct_conn, default_conn):
+            result = await conn.request({'url': 'https://example.com'})
+            assert result['screenshot'] == b'\x89PNG'
+            assert result['performance']['echo'] == 'https://example.com'
+    finally:
+        await struct_conn.close()
+        await default_conn.close()
+
+    unknown = MultiplexedConnection(host, port, codecs=['pickle'])
+    with pytest.raises(ConnectionError):
+        await unknown.connect()
+
+@pytest.mark.asyncio
+async def test_request_runs_only_requested_tasks(processing_server):
+    (host, port), received = processing_server
+    conn = MultiplexedConnection(host, port)
+    try:
+        await conn.connect()
+        only = await conn.request({'url': 'https://example.com', 'tasks': ['performance']})
+        unknown = await conn.request({'url': 'https://example.com', 'tasks': ['pdf']})
+        bad_priority = await conn.request({'url': 'https://example.com', 'priority': 'urgente'})
+    finally:
+        await conn.close()
+
+    assert list(only) == ['performance', 'task_status']
+    assert unknown == {'error': 'Tareas desconocidas: pdf'}
+    assert bad_priority == {'error': 'Prioridad desconocida: urgente'}
+    assert len(received) == 1
+
+@pytest.mark.asyncio
+async def test_deadline_returns_partial_results(processing_server, monkeypatch):
+    import time
+    (host, port), _ = processing_server
+
+    def slow_screenshot(url, deadline=None):
+        time.sleep(1.0)
+        return b'\x89PNG'
+
+    monkeypatch.setattr(server_processing, 'process_screenshot', slow_screenshot)
+    conn = MultiplexedConnection(host, port)
+    try:
+        await conn.connect()
+        start = time.perf_counter()
+        # 1000ms menos RESPONSE_MARGIN: 0.5s para las tareas
+        result = await conn.request({'url': 'https://example.com', 'deadline_ms': 1000})
+        elapsed = time.perf_counter() - start
+        invalid = await conn.request({'url': 'https://example.com', 'deadline_ms': 'pronto'})
+        stats = await conn.request({'action': 'stats'})
+    finally:
+        await conn.close()
+
+    assert elapsed < 0.9
+    assert result['screenshot'] is None
+    assert result['performance']['echo'] == 'https://example.com'
+    assert result['task_status'] == {'screenshot': 'timeout', 'performance': 'ok', 'thumbnails': 'ok'}
+    assert invalid == {'error': "'deadline_ms' debe ser un número"}
+    assert stats['tasks_timed_out'] == 1
+
+def test_threaded_process_request_waits_for_shared_deadline(monkeypatch):
+    import time
+    from multiprocessing.pool import ThreadPool
+
+    def slow(*args):
+        time.sleep(0.6)
+        return []
+
+    monkeypatch.setattr(server_processing, 'process_screenshot', slow)
+    monkeypatch.setattr(server_processing, 'process_thumbnails', slow)
+    monkeypatch.setattr(server_processing, 'process_performance', lambda *args: {'load_time_ms': 1})
+    pool = ThreadPool(3)
+    monkeypatch.setattr(server_processing, 'processing_pool', pool)
+    try:
+        start = time.perf_counter()
+        result = server_processing.process_request({'url': 'https://example.com', 'deadline_ms': 800,
+                                                    'trace_id': 'abc'})
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.terminate()
+
+    # Las tareas lentas no suman sus timeouts: todas vencen con el mismo deadline
+    assert elapsed < 0.55
+    assert result['performance'] == {'load_time_ms': 1}
+    assert result['task_status'] == {'screenshot': 'timeout', 'performance': 'ok', 'thumbnails': 'timeout'}
+    assert sorted(span['name'] for span in result['timings']) == \
+        ['performance', 'performance.queue', 'screenshot.timeout', 'thumbnails.timeout']
+
+@pytest.mark.asyncio
+async def test_async_server_limits_connections_and_pending(monkeypatch):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    def slow_screenshot(url, deadline=None):
+        time.sleep(0.3)
+        return b'\x89PNG'
+
+    monkeypatch.setattr(server_processing, 'process_screenshot', slow_screenshot)
+    server = server_processing.AsyncProcessingServer(
+        '127.0.0.1', 0, executor=ThreadPoolExecutor(max_workers=2), num_processes=2,
+        max_connections=1, max_pending=1
+    )
+    await server.start()
+    host, port = server.sockets[0].getsockname()[:2]
+    conn = MultiplexedConnection(host, port)
+    try:
+        await conn.connect()
+        first, second = await asyncio.gather(
+            conn.request({'url': 'https://a.com', 'tasks': ['screenshot']}),
+            conn.request({'url': 'https://b.com', 'tasks': ['screenshot']})
+        )
+        # La segunda conexión se cierra al aceptarla, sin leer nada
+        reader, writer = await asyncio.open_connection(host, port)
+        assert await reader.read() == b''
+        writer.close()
+        stats = await conn.request({'action': 'stats'})
+    finally:
+        await conn.close()
+        await server.close()
+
+    assert first['screenshot'] == b'\x89PNG'
+    assert second['overloaded'] is True
+    assert second['retry_after'] == server_processing.OVERLOAD_RETRY_AFTER
+    assert stats['requests_rejected'] == 1
+    assert stats['connections_rejected'] == 1
+
+def test_threaded_server_rejects_beyond_max_pending(threaded_processing_server):
+    import socket
+    host, port = threaded_processing_server
+
+    def legacy_request(url):
+        with socket.create_connection((host, port)) as sock:
+            sock.sendall(build_message({'url': url}))
+            (length,) = LENGTH_HEADER.unpack(sock.recv(4, socket.MSG_WAITALL))
+            return parse_message(sock.recv(length, socket.MSG_WAITALL))
+
+    max_pending = server_processing.ThreadedTCPServer.max_pending
+    server_processing.ThreadedTCPServer.max_pending = 0
+    try:
+        rejected = legacy_request('fast')
+    finally:
+        server_processing.ThreadedTCPServer.max_pending = max_pending
+    assert rejected['overloaded'] is True
+    assert legacy_request('fast') == {'performance': {'echo': 'fast'}}
+
+def closed_port() -> int:
+    """Puerto local sin nadie escuchando"""
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def test_circuit_breaker_opens_and_probes():
+    import time
+    from common.processing_cluster import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    breaker.failure()
+    assert breaker.state == CLOSED
+    breaker.failure()
+    assert breaker.state == OPEN and not breaker.begin()
+
+    # Vencido el reset_timeout pasa una sola solicitud de prueba
+    time.sleep(0.12)
+    assert breaker.begin()
+    assert breaker.state == HALF_OPEN and not breaker.begin()
+    breaker.failure()
+    assert breaker.state == OPEN
+
+    time.sleep(0.12)
+    assert breaker.begin()
+    breaker.success()
+    assert breaker.state == CLOSED and breaker.begin()
+    assert breaker.trips == 2
+
+@pytest.mark.asyncio
+async def test_cluster_fails_over_and_short_circuits(processing_server):
+    from common.processing_cluster import ProcessingCluster, CircuitOpen
+    (host, port), _ = processing_server
+    dead = ('127.0.0.1', closed_port())
+
+    cluster = ProcessingCluster([dead, (host, port)], size=1, failure_threshold=1, reset_timeout=60,
+                                balance='least-loaded')
+    alone = ProcessingCluster([dead], size=1, failure_threshold=1, reset_timeout=60)
+    try:
+        first = await cluster.request({'url': 'https://a.com'}, timeout=5)
+        second = await cluster.request({'url': 'https://b.com'}, timeout=5)
+        with pytest.raises(ConnectionError):
+            await alone.request({'url': 'https://a.com'}, timeout=5)
+        with pytest.raises(CircuitOpen):
+            await alone.request({'url': 'https://a.com'}, timeout=5)
+        stats = cluster.stats()
+    finally:
+        await cluster.close()
+        await alone.close()
+
+    assert first['performance']['echo'] == 'https://a.com'
+    assert second['performance']['echo'] == 'https://b.com'
+    assert stats['failovers'] == 1
+    assert stats['endpoints'][0]['circuit']['state'] == 'open'
+    assert stats['endpoints'][1]['circuit']['state'] == 'closed'
+    assert alone.stats()['short_circuited'] == 1
+
+@pytest.mark.asyncio
+async def test_cluster_hedges_slow_requests(processing_server):
+    import time
+    from common.processing_cluster import ProcessingCluster, HEDGE_MIN_SAMPLES
+    (host, port), _ = processing_server
+
+    async def slow_server(reader, writer):
+        # Servidor v1 que tarda 1s en responder cada frame
+        if await reader.readexactly(4) == MUX_MAGIC:
+            request_id, payload = await read_frame(reader)
+            await asyncio.sleep(1)
+            writer.write(build_message({'slow': True}, request_id))
+            await writer.drain()
+        writer.close()
+
+    slow = await asyncio.start_server(slow_server, '127.0.0.1', 0)
+    slow_port = slow.sockets[0].getsockname()[1]
+    cluster = ProcessingCluster([('127.0.0.1', slow_port), (host, port)], size=1, hedge=True,
+                                balance='least-loaded')
+    for _ in range(HEDGE_MIN_SAMPLES):
+        cluster.latency.record(0.05)
+    try:
+        start = time.perf_counter()
+        result = await cluster.request({'url': 'https://example.com'}, timeout=5)
+        elapsed = time.perf_counter() - start
+    finally:
+        await cluster.close()
+        slow.close()
+        await slow.wait_closed()
+
+    assert result['performance']['echo'] == 'https://example.com'
+    assert elapsed < 0.8
+    assert cluster.stats()['hedged'] == 1
+    assert cluster.stats()['hedge_wins'] == 1
+
+def test_hash_ring_moves_only_keys_of_removed_node():
+    from common.processing_cluster import HashRing
+
+    nodes = ['b1:9999', 'b2:9999', 'b3:9999']
+    full = HashRing(nodes)
+    reduced = HashRing(nodes[:2])
+    urls = [f'https://example.com/{i}' for i in range(300)]
+    owners = {url: full.preference(url)[0] for url in urls}
+
+    # Reparto parejo y estable entre llamadas
+    assert all(80 < list(owners.values()).count(node) < 120 for node in nodes)
+    assert all(full.preference(url)[0] == owners[url] for url in urls)
+    # Al sacar b3 solo cambian de dueño sus URLs, que pasan al siguiente del anillo
+    for url in urls:
+        if owners[url] != 'b3:9999':
+            assert reduced.preference(url)[0] == owners[url]
+        else:
+            assert reduced.preference(url)[0] == full.preference(url)[1]
+
+def test_cluster_routes_url_variants_to_the_same_backend():
+    from common.processing_cluster import ProcessingCluster, parse_endpoints
+
+    cluster = ProcessingCluster(parse_endpoints('b1:9999,b2:9999,b3:9999,b4:9999'))
+    for i in range(50):
+        variants = [
+            f'https://example.com/{i}?a=1&b=2',
+            f'HTTPS://Example.COM:443/{i}?b=2&a=1',
+            f'https://example.com/{i}?a=1&b=2#seccion'
+        ]
+        owners = {cluster._order({'url': url})[0].address for url in variants}
+        assert len(owners) == 1
+
+@pytest.mark.asyncio
+async def test_sharding_scales_across_backends(monkeypatch):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    from common.processing_cluster import ProcessingCluster
+
+    def slow_performance(url, page=None, remeasure=False, deadline=None):
+        time.sleep(0.1)
+        return {'echo': url}
+
+    monkeypatch.setattr(server_processing, 'process_performance', slow_performance)
+    servers = [
+        server_processing.AsyncProcessingServer(
+            '127.0.0.1', 0, executor=ThreadPoolExecutor(max_workers=2), num_processes=2
+        )
+        for _ in range(2)
+    ]
+    for server in servers:
+        await server.start()
+    backends = [server.sockets[0].getsockname()[:2] for server in servers]
+    urls = [f'https://example.com/{i}' for i in range(16)]
+
+    async def run(endpoints):
+        cluster = ProcessingCluster(endpoints + [('127.0.0.1', closed_port())], size=2)
+        try:
+            # El health check saca del reparto al backend caído antes de enviar nada
+            await cluster.check_health()
+            start = time.perf_counter()
+            results = await asyncio.gather(*(
+                cluster.request({'url': url, 'tasks': ['performance']}, timeout=10) for url in urls
+            ))
+            elapsed = time.perf_counter() - start
+            again = [cluster._pick({'url': url}) for url in urls]
+            dead = cluster.endpoints[-1]
+            moved = sum(cluster.ring.preference(url)[0] is dead for url in urls)
+            return results, elapsed, again, moved, cluster.stats()
+        finally:
+            await cluster.close()
+
+    try:
+        _, one_elapsed, _, _, _ = await run(backends[:1])
+        results, two_elapsed, again, moved, stats = await run(backends)
+    finally:
+        for server in servers:
+            await server.close()
+
+    assert [r['performance']['echo'] for r in results] == urls
+    assert two_elapsed < one_elapsed * 0.8
+    # Cada backend atendió su parte más el health check
+    served = [endpoint['requests'] for endpoint in stats['endpoints']]
+    assert served[0] > 1 and served[1] > 1 and sum(served[:2]) == len(urls) + 2
+    assert stats['endpoints'][2]['healthy'] is False
+    assert stats['failovers'] == 0
+    # Las URLs que le tocaban al backend caído se reparten entre los vivos
+    assert stats['rerouted'] == moved
+    assert all(endpoint is not None and endpoint.healthy for endpoint in again)
+
+def test_metrics_registry_renders_prometheus_text():
+    from common.metrics import Registry
+    registry = Registry()
+    requests = registry.counter('requests_total', 'Solicitudes', ['route'])
+    requests.labels('/a').inc()
+    requests.labels('/a').inc(2)
+    latency = registry.histogram('latency_seconds', 'Latencia', buckets=(0.1, 1))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+    registry.gauge_callback('queue', 'Cola', lambda: {('x',): 3}, ['name'])
+
+    lines = registry.render().splitlines()
+
+    assert '# TYPE requests_total counter' in lines
+    assert 'requests_total{route="/a"} 3' in lines
+    assert 'latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{le="1"} 2' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum 5.55' in lines
+    assert 'latency_seconds_count 3' in lines
+    assert 'queue{name="x"} 3' in lines
+    with pytest.raises(ValueError):
+        registry.counter('requests_total', 'Duplicada')
+    with pytest.raises(ValueError):
+        requests.labels()
+
+@pytest.mark.asyncio
+async def test_processing_server_exports_metrics_over_http(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.setattr(server_processing, 'process_performance',
+                        lambda url, page=None, remeasure=False, deadline=None: {'load_time_ms': 1})
+    server = server_processing.AsyncProcessingServer(
+        '127.0.0.1', 0, executor=ThreadPoolExecutor(max_workers=2), num_processes=2, metrics_port=0
+    )
+    await server.start()
+    host, port = server.sockets[0].getsockname()[:2]
+    metrics_port = server.metrics_server.sockets[0].getsockname()[1]
+    pool = ProcessingConnectionPool(host, port, size=1)
+    try:
+        await pool.request({'url': 'https://a.com', 'tasks': ['performance']}, timeout=5)
+        reader, writer = await asyncio.open_connection(host, metrics_port)
+        writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        raw = await reader.read()
+        writer.close()
+    finally:
+        await pool.close()
+        await server.close()
+
+    head, _, body = raw.decode('utf-8').partition('\r\n\r\n')
+    lines = body.splitlines()
+    assert head.startswith('HTTP/1.1 200 OK')
+    assert 'tp2_stage_duration_seconds_count{stage="performance"} 1' in lines
+    assert 'tp2_queue_wait_seconds_count{task="performance"} 1' in lines
+    assert 'tp2_requests_served_total 1' in lines
+    assert 'tp2_requests_in_flight 0' in lines
+    assert 'tp2_scheduler_running{task="performance"} 0' in lines
+    bytes_in = [line for line in lines if line.startswith('tp2_bytes_total{direction="in"}')]
+    assert int(bytes_in[0].split()[-1]) == pool.bytes_sent
+
+def test_trace_collects_spans_from_both_servers(tmp_path):
+    import json
+    import time
+    from common.tracing import Trace, TraceWriter, make_span, SERVER_B
+
+    trace = Trace()
+    with trace.span('fetch_html'):
+        time.sleep(0.01)
+    now = time.time()
+    trace.extend([make_span('screenshot', now, now + 0.02, 'screenshot'), {'name': 'roto'}], server=SERVER_B)
+    trace.finish()
+    timings = trace.timings()
+
+    assert [(span['server'], span['name']) for span in timings['spans']] == \
+        [('A', 'fetch_html'), ('B', 'screenshot')]
+    assert timings['spans'][0]['duration_ms'] >= 10
+    assert timings['spans'][1]['duration_ms'] == 20
+
+    path = tmp_path / 'trace.json'
+    writer = TraceWriter(str(path))
+    writer.write(trace, 'https://example.com')
+    writer.close()
+    events = json.loads(path.read_text().rstrip().rstrip(',') + ']')
+    complete = [event for event in events if event['ph'] == 'X']
+    lanes = {event['tid'] for event in complete if event['pid'] == 2}
+    assert [event['name'] for event in complete] == ['scrape', 'fetch_html', 'screenshot']
+    assert len(lanes) == 1 and lanes.isdisjoint({event['tid'] for event in complete if event['pid'] == 1})
+    assert complete[2]['dur'] == 20000
+
+@pytest.mark.asyncio
+async def test_processing_server_returns_task_spans(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    monkeypatch.setattr(server_processing, 'process_performance',
+                        lambda url, page=None, remeasure=False, deadline=None: {'load_time_ms': 1})
+    server = server_processing.AsyncProcessingServer(
+        '127.0.0.1', 0, executor=ThreadPoolExecutor(max_workers=2), num_processes=2
+    )
+    try:
+        traced = await server.respond({'url': 'https://a.com', 'tasks': ['performance'], 'trace_id': 'abc'})
+        plain = await server.respond({'url': 'https://a.com', 'tasks': ['performance']})
+        invalid = await server.respond({'url': 'https://a.com', 'trace_id': 7})
+    finally:
+        await server.close()
+
+    assert traced['performance'] == plain['performance'] == {'load_time_ms': 1}
+    assert [span['name'] for span in traced['timings']] == ['performance.queue', 'performance']
+    queue, run = traced['timings']
+    assert queue['start'] <= queue['end'] == run['start'] <= run['end']
+    assert 'timings' not in plain
+    assert invalid['error'].startswith("'trace_id' debe ser un string")
+
+@pytest.mark.asyncio
+async def test_health_check_survives_garbage_stats_replies():
+    from concurrent.futures import ThreadPoolExecutor
+    from common.processing_cluster import ProcessingCluster
+
+    server = server_processing.AsyncProcessingServer(
+        '127.0.0.1', 0, executor=ThreadPoolExecutor(max_workers=1), num_processes=1
+    )
+    real_stats = server.stats
+    server.stats = lambda: ['basura']
+    await server.start()
+    cluster = ProcessingCluster([server.sockets[0].getsockname()[:2]], size=1, health_interval=0.05)
+    endpoint = cluster.endpoints[0]
+    real_request = endpoint.pool.request
+
+    async def broken_request(*args, **kwargs):
+        raise RuntimeError('pool roto')
+
+    try:
+        await cluster.check_health()
+        garbage_healthy = endpoint.healthy
+
+        server.stats = real_stats
+        endpoint.pool.request = broken_request
+        cluster.start()
+        await asyncio.sleep(0.12)
+        broken_healthy = endpoint.healthy
+        loop_alive = not cluster._health_task.done()
+
+        endpoint.pool.request = real_request
+        await asyncio.sleep(0.12)
+        recovered = endpoint.healthy
+    finally:
+        await cluster.close()
+        await server.close()
+
+    assert garbage_healthy is False
+    assert broken_healthy is False
+    assert loop_alive
+    assert recovered is True
@@ -8,3 +8,486 @@ def test_analyze_performance_google():
 	assert 'total_size_kb' in result
 	assert result['load_time_ms'] > 0
 	assert result['total_size_kb'] > 0
+
+class FakeDriver:
+	"""Driver con la interfaz mínima de Selenium para probar sin Chrome"""
+	instances = 0
+
+	def __init__(self, fail_on=None, ready_state='complete'):
+		FakeDriver.instances += 1
+		self.fail_on = fail_on
+		self.ready_state = ready_state
+		self.timeouts = {}
+		self.alive = True
+		self.visited = []
+		self.quit_called = False
+
+	def set_page_load_timeout(self, timeout):
+		self.timeouts['page_load'] = timeout
+
+	def implicitly_wait(self, timeout):
+		self.timeouts['implicit'] = timeout
+
+	def get(self, url):
+		if url == self.fail_on:
+			self.alive = False
+			raise RuntimeError('chrome crashed')
+		self.visited.append(url)
+
+	def execute_script(self, script):
+		if not self.alive:
+			raise RuntimeError('session deleted')
+		return 1 if script == 'return 1' else self.ready_state
+
+	def get_screenshot_as_png(self):
+		return b'\x89PNG fake'
+
+	def delete_all_cookies(self):
+		pass
+
+	def quit(self):
+		self.quit_called = True
+
+def test_analyze_performance_reuses_scraper_measurements(monkeypatch):
+	from processor import performance
+	remeasured = {'load_time_ms': 300, 'ttfb_ms': 90, 'size_bytes': 1024, 'resources': {}}
+	monkeypatch.setattr(performance, 'measure_page', lambda url, deadline=None: remeasured)
+	page = {
+		'load_time_ms': 120.4, 'ttfb_ms': 35.2, 'size_bytes': 2048,
+		'resources': {'stylesheets': ['a.css'], 'scripts': ['a.js', 'b.js'], 'images': ['x.png']}
+	}
+	result = performance.analyze_performance('https://example.com', page, waterfall=False)
+	assert result == {
+		'load_time_ms': 120, 'ttfb_ms': 35, 'total_size_kb': 2.0,
+		'num_requests': 5, 'measured_by': 'scraper'
+	}
+	result = performance.analyze_performance('https://example.com', page, remeasure=True, waterfall=False)
+	assert (result['measured_by'], result['load_time_ms']) == ('processor', 300)
+	assert performance.analyze_performance('https://example.com', waterfall=False)['measured_by'] == 'processor'
+
+def test_analyze_performance_measures_resource_waterfall():
+	import time
+	from processor.performance import analyze_performance
+	from processor.waterfall import run_waterfall
+
+	files = {'/a.css': b'c' * 3000, '/a.js': b'j' * 5000, '/x.png': b'p' * 2000}
+	server = _serve_images(files, delay=0.3)
+	base = f'http://127.0.0.1:{server.server_address[1]}/pagina/'
+	resources = {
+		'stylesheets': ['/a.css'], 'scripts': ['/a.js', 'data:text/javascript,1'],
+		'images': ['/x.png', '/x.png', '../missing.png']
+	}
+	page = {'load_time_ms': 100, 'ttfb_ms': 40, 'size_bytes': 1024, 'resources': resources}
+	try:
+		start = time.perf_counter()
+		result = analyze_performance(base, page)
+		elapsed = time.perf_counter() - start
+		serial = run_waterfall(base, resources, limit_per_host=1)
+	finally:
+		server.shutdown()
+		server.server_close()
+
+	waterfall = result['waterfall']
+	# 4 recursos distintos y HTTP, descargados en paralelo (no 4 x 0.3s)
+	assert result['num_requests'] == 5
+	assert waterfall['resources'] == 4 and waterfall['failed'] == 1
+	assert waterfall['transfer_bytes'] == 1024 + 10000
+	assert result['total_size_kb'] == round(11024 / 1024, 2)
+	assert elapsed < 1.0
+	assert 400 <= waterfall['critical_path_ms'] < 1000
+	slowest = waterfall['slowest'][0]
+	assert slowest['ttfb_ms'] >= 300
+	assert slowest['connect_ms'] is not None
+	assert {r['type'] for r in waterfall['slowest']} == {'css', 'js', 'img'}
+	# Con una conexión por host las descargas van en serie
+	assert serial['critical_path_ms'] >= 1200
+
+def test_waterfall_resolves_resources_against_final_url():
+	from processor.performance import analyze_performance
+
+	html = b'<html><head><link rel="stylesheet" href="a.css"></head><body></body></html>'
+	server = _serve_images({'/nuevo/': html, '/nuevo/a.css': b'c' * 100}, redirects={'/viejo': '/nuevo/'})
+	base = f'http://127.0.0.1:{server.server_address[1]}'
+	try:
+		remeasured = analyze_performance(base + '/viejo', remeasure=True)
+		page = {'load_time_ms': 10, 'ttfb_ms': 5, 'size_bytes': len(html), 'final_url': base + '/nuevo/',
+			'resources': {'stylesheets': ['a.css']}}
+		forwarded = analyze_performance(base + '/viejo', page)
+	finally:
+		server.shutdown()
+		server.server_close()
+
+	# a.css es relativo a la página después de la redirección
+	for result in (remeasured, forwarded):
+		assert result['waterfall']['resources'] == 1
+		assert result['waterfall']['failed'] == 0
+		assert result['waterfall']['slowest'][0]['url'] == base + '/nuevo/a.css'
+
+def test_tasks_stop_at_deadline():
+	import time
+	from processor.waterfall import run_waterfall
+	from processor.image_processor import render_thumbnails
+
+	server = _serve_images({'/a.js': b'j' * 100, '/x.jpg': _jpeg((50, 50))}, delay=0.5)
+	base = f'http://127.0.0.1:{server.server_address[1]}'
+	try:
+		start = time.perf_counter()
+		waterfall = run_waterfall(base, {'scripts': ['/a.js']}, budget=0.1)
+		elapsed = time.perf_counter() - start
+		thumbnails = render_thumbnails([f'{base}/x.jpg'], deadline=time.time())
+	finally:
+		server.shutdown()
+		server.server_close()
+
+	assert elapsed < 0.4
+	assert waterfall['failed'] == 1
+	assert waterfall['slowest'][0]['error'] == 'Cancelado por deadline'
+	# Con el deadline vencido no se empieza ninguna imagen
+	assert thumbnails == []
+	assert '/x.jpg' not in server.paths
+
+def test_thumbnail_download_stops_at_deadline():
+	import time
+	from processor.image_processor import render_thumbnails
+
+	server = _serve_images({'/x.jpg': _jpeg((50, 50))}, delay=1.0)
+	base = f'http://127.0.0.1:{server.server_address[1]}'
+	try:
+		start = time.perf_counter()
+		thumbnails = render_thumbnails([f'{base}/x.jpg'], deadline=time.time() + 0.2)
+		elapsed = time.perf_counter() - start
+	finally:
+		server.shutdown()
+		server.server_close()
+
+	# La descarga ya empezada se corta al vencer el deadline
+	assert thumbnails == []
+	assert elapsed < 0.6
+
+def test_waterfall_skips_resources_cancelled_before_starting(monkeypatch):
+	import asyncio
+	from processor import waterfall
+
+	async def fetch(session, timing, origin, max_bytes):
+		# Solo el primer recurso llega a medirse; el resto queda sin tiempos
+		if timing.url.endswith('/a.js'):
+			timing.start, timing.end, timing.status = 0.0, 0.2, 200
+		else:
+			await asyncio.sleep(10)
+
+	monkeypatch.setattr(waterfall, '_fetch', fetch)
+	result = waterfall.run_waterfall('http://127.0.0.1:1/', {'scripts': ['/a.js', '/b.js', '/c.js']},
+		budget=0.05, document_ms=100)
+
+	assert result['resources'] == 3 and result['failed'] == 2
+	assert result['critical_path_ms'] == 300
+	assert [r['url'] for r in result['slowest']] == ['http://127.0.0.1:1/a.js']
+
+def test_fair_scheduler_shares_pool_between_clients():
+	import time
+	import asyncio
+	import threading
+	from concurrent.futures import ThreadPoolExecutor
+	from processor.scheduler import FairScheduler
+
+	started = []
+	running = {'screenshot': 0, 'max': 0}
+	lock = threading.Lock()
+
+	def work(name, task, duration):
+		with lock:
+			started.append(name)
+			if task == 'screenshot':
+				running['screenshot'] += 1
+				running['max'] = max(running['max'], running['screenshot'])
+		time.sleep(duration)
+		with lock:
+			if task == 'screenshot':
+				running['screenshot'] -= 1
+		return name
+
+	async def scenario():
+		executor = ThreadPoolExecutor(max_workers=2)
+		scheduler = FairScheduler(executor, workers=2, limits={'screenshot': 1})
+		heavy = [asyncio.ensure_future(scheduler.run('screenshot', 'heavy', work, f'shot{i}', 'screenshot', 0.1))
+				 for i in range(6)]
+		await asyncio.sleep(0)
+		light = [asyncio.ensure_future(scheduler.run('performance', 'light', work, f'perf{i}', 'performance', 0.05))
+				 for i in range(3)]
+		urgent = asyncio.ensure_future(scheduler.run('performance', 'other', work, 'urgent', 'performance', 0.05,
+													 priority='high'))
+		cancelled = asyncio.ensure_future(scheduler.run('screenshot', 'heavy', work, 'never', 'screenshot', 0.1))
+		await asyncio.sleep(0.01)
+		stats = scheduler.stats()
+		cancelled.cancel()
+		results = await asyncio.gather(*heavy, *light, urgent)
+		executor.shutdown()
+		return results, stats, scheduler.stats()
+
+	results, during, after = asyncio.run(scenario())
+
+	assert results[:6] == [f'shot{i}' for i in range(6)]
+	# Los análisis de otros clientes no esperan detrás de los seis screenshots
+	assert max(started.index(f'perf{i}') for i in range(3)) < started.index('shot2')
+	assert started.index('urgent') < started.index('shot1')
+	# Un solo screenshot a la vez y el cancelado nunca ocupa un worker
+	assert running['max'] == 1
+	assert 'never' not in started
+	assert during['tasks']['screenshot']['queued'] == 6
+	assert during['queued_by_client']['heavy'] == 6
+	assert after['queued'] == 0
+	assert after['tasks']['performance']['dispatched'] == 4
+	assert after['tasks']['screenshot']['max_wait_ms'] >= 400
+
+def test_fair_scheduler_keeps_limit_when_running_task_times_out():
+	import time
+	import asyncio
+	import threading
+	from concurrent.futures import ThreadPoolExecutor
+	from processor.scheduler import FairScheduler
+
+	running = {'now': 0, 'max': 0}
+	lock = threading.Lock()
+
+	def screenshot(duration):
+		with lock:
+			running['now'] += 1
+			running['max'] = max(running['max'], running['now'])
+		time.sleep(duration)
+		with lock:
+			running['now'] -= 1
+		return duration
+
+	async def scenario():
+		executor = ThreadPoolExecutor(max_workers=4)
+		scheduler = FairScheduler(executor, workers=4, limits={'screenshot': 1})
+		slow = asyncio.ensure_future(asyncio.wait_for(scheduler.run('screenshot', 'a', screenshot, 0.5), 0.1))
+		await asyncio.sleep(0)
+		following = asyncio.ensure_future(scheduler.run('screenshot', 'b', screenshot, 0.05))
+		try:
+			await slow
+		except asyncio.TimeoutError:
+			pass
+		# La espera venció pero el worker sigue ejecutando el screenshot
+		during = scheduler.stats()['tasks']['screenshot']
+		result = await following
+		executor.shutdown()
+		return during, result, scheduler.stats()
+
+	during, result, after = asyncio.run(scenario())
+
+	assert during['running'] == 1
+	assert during['queued'] == 1
+	assert result == 0.05
+	assert running['max'] == 1
+	assert after['running'] == 0
+
+def test_fair_scheduler_fails_tasks_when_executor_is_shut_down():
+	import asyncio
+	import pytest
+	from concurrent.futures import ThreadPoolExecutor
+	from processor.scheduler import FairScheduler
+
+	async def scenario():
+		executor = ThreadPoolExecutor(max_workers=2)
+		executor.shutdown()
+		scheduler = FairScheduler(executor, workers=2)
+		for client in ('a', 'b', 'c'):
+			with pytest.raises(RuntimeError):
+				await asyncio.wait_for(scheduler.run('performance', client, abs, -1), 1)
+		return scheduler.stats()
+
+	stats = asyncio.run(scenario())
+
+	# El submit fallido no deja lugares ocupados ni tareas encoladas
+	assert stats['running'] == 0
+	assert stats['queued'] == 0
+
+def test_browser_pool_reuses_and_recycles():
+	from processor.browser_pool import BrowserPool
+	from processor.screenshot import generate_screenshot
+
+	drivers = []
+	def factory():
+		drivers.append(FakeDriver())
+		return drivers[-1]
+
+	pool = BrowserPool(factory, size=1, max_uses=3)
+	for i in range(4):
+		assert generate_screenshot(f'https://example.com/{i}', pool=pool) is not None
+
+	assert len(drivers) == 2
+	assert drivers[0].quit_called
+	assert drivers[0].visited == ['https://example.com/0', 'about:blank',
+		'https://example.com/1', 'about:blank', 'https://example.com/2']
+	assert pool.stats()['recycled'] == 1
+
+def test_browser_pool_recovers_from_crash():
+	from processor.browser_pool import BrowserPool
+	from processor.screenshot import generate_screenshot
+
+	drivers = []
+	def factory():
+		drivers.append(FakeDriver(fail_on='https://crash.example.com'))
+		return drivers[-1]
+
+	pool = BrowserPool(factory, size=1, max_uses=10)
+	assert generate_screenshot('https://crash.example.com', pool=pool) is None
+	assert generate_screenshot('https://example.com', pool=pool) is not None
+
+	assert len(drivers) == 2
+	assert drivers[0].quit_called
+	assert pool.stats()['crashed'] == 1
+
+	# Un navegador que muere estando ocioso se detecta con el health check
+	drivers[1].alive = False
+	assert generate_screenshot('https://example.com', pool=pool) is not None
+	assert len(drivers) == 3
+
+def test_screenshot_waits_stop_at_deadline():
+	import time
+	from processor.browser_pool import BrowserPool
+	from processor.screenshot import capture_screenshot
+
+	# Una página que nunca termina de cargar
+	driver = FakeDriver(ready_state='loading')
+	pool = BrowserPool(lambda: driver, size=1, max_uses=10)
+	start = time.perf_counter()
+	assert capture_screenshot('https://example.com', pool=pool, deadline=time.time() + 0.3) is not None
+	elapsed = time.perf_counter() - start
+
+	assert elapsed < 1.0
+	assert 0 < driver.timeouts['page_load'] <= 0.3
+	assert 0 < driver.timeouts['implicit'] <= 0.3
+
+def _serve_images(images, delay=0.0, redirects=None):
+	"""
+	Servidor HTTP local que sirve images[path] tardando delay segundos.
+	Responde 304 a If-None-Match, redirige las rutas de redirects y
+	registra las rutas pedidas en server.paths.
+	"""
+	import threading
+	import time
+	from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+	class Handler(BaseHTTPRequestHandler):
+		def do_GET(self):
+			time.sleep(delay)
+			server.paths.append(self.path)
+			if self.path in (redirects or {}):
+				self.send_response(302)
+				self.send_header('Location', redirects[self.path])
+				self.end_headers()
+				return
+			body = images.get(self.path)
+			if body is None:
+				self.send_response(404)
+				self.end_headers()
+				return
+			etag = f'"{len(body)}"'
+			if self.headers.get('If-None-Match') == etag:
+				self.send_response(304)
+				self.end_headers()
+				return
+			self.send_response(200)
+			self.send_header('ETag', etag)
+			self.send_header('Content-Type', 'image/jpeg')
+			self.send_header('Content-Length', str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, *args):
+			pass
+
+	server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+	server.paths = []
+	threading.Thread(target=server.serve_forever, daemon=True).start()
+	return server
+
+def test_generate_thumbnails_concurrent_and_bounded():
+	import io
+	import base64
+	import time
+	from PIL import Image
+	from processor.image_processor import generate_thumbnails
+
+	def jpeg(size):
+		buf = io.BytesIO()
+		Image.new('RGB', size, (200, 30, 30)).save(buf, format='JPEG')
+		return buf.getvalue()
+
+	images = {f'/{i}.jpg': jpeg((800, 600)) for i in range(5)}
+	images['/big.jpg'] = jpeg((3000, 3000)) + b'\0' * 200_000
+	server = _serve_images(images, delay=0.3)
+	base = f'http://127.0.0.1:{server.server_address[1]}'
+	try:
+		urls = [f'{base}/{i}.jpg' for i in range(5)] + [f'{base}/big.jpg', f'{base}/missing.jpg']
+		start = time.perf_counter()
+		thumbnails = generate_thumbnails(urls, max_bytes=150_000)
+		elapsed = time.perf_counter() - start
+	finally:
+		server.shutdown()
+		server.server_close()
+
+	# La grande y la inexistente se descartan; el resto en paralelo (no 7 x 0.3s)
+	assert len(thumbnails) == 5
+	assert elapsed < 1.5
+	thumb = Image.open(io.BytesIO(base64.b64decode(thumbnails[0])))
+	assert thumb.format == 'JPEG'
+	assert max(thumb.size) == 100
+
+def _jpeg(size, color=(200, 30, 30)):
+	import io
+	from PIL import Image
+	buf = io.BytesIO()
+	Image.new('RGB', size, color).save(buf, format='JPEG')
+	return buf.getvalue()
+
+def test_thumbnail_cache_hits_revalidates_and_dedupes(tmp_path):
+	from processor.image_processor import generate_thumbnails
+	from processor.thumbnail_cache import ThumbnailCache
+
+	logo = _jpeg((400, 400))
+	server = _serve_images({'/logo.jpg': logo, '/cdn/logo.jpg': logo})
+	base = f'http://127.0.0.1:{server.server_address[1]}'
+	try:
+		cache = ThumbnailCache(str(tmp_path))
+		first = generate_thumbnails([f'{base}/logo.jpg'], cache=cache)
+		assert server.paths == ['/logo.jpg']
+
+		# Otro worker con su propia conexión al mismo directorio: hit sin red
+		other = ThumbnailCache(str(tmp_path))
+		assert generate_thumbnails([f'{base}/logo.jpg'], cache=other) == first
+		assert server.paths == ['/logo.jpg']
+
+		# Misma imagen en otra URL: se descarga pero no se recodifica
+		assert generate_thumbnails([f'{base}/cdn/logo.jpg'], cache=cache) == first
+
+		# Vencido el TTL se revalida con GET condicional (304)
+		stale = ThumbnailCache(str(tmp_path), ttl=0)
+		assert generate_thumbnails([f'{base}/logo.jpg'], cache=stale) == first
+		assert server.paths == ['/logo.jpg', '/cdn/logo.jpg', '/logo.jpg']
+	finally:
+		server.shutdown()
+		server.server_close()
+
+	stats = cache.stats()
+	assert (stats['misses'], stats['hits'], stats['content_hits'], stats['revalidated']) == (1, 1, 1, 1)
+	assert stats['bytes_saved'] == 2 * len(logo)
+	assert stats['hit_ratio'] == 0.75
+	assert stats['entries'] == 1
+
+def test_thumbnail_cache_evicts_least_recently_used(tmp_path):
+	from processor.thumbnail_cache import ThumbnailCache
+
+	cache = ThumbnailCache(str(tmp_path), max_bytes=2500)
+	for name in ('a', 'b', 'c'):
+		cache.put(name * 64, (100, 100), b'x' * 1000)
+		cache.link(f'https://example.com/{name}', (100, 100), name * 64)
+		if name == 'b':
+			cache.get('a' * 64, (100, 100))
+
+	assert cache.get('a' * 64, (100, 100)) is not None
+	assert cache.get('b' * 64, (100, 100)) is None
+	assert cache.lookup('https://example.com/b', (100, 100)) is None
+	assert cache.stats()['evictions'] == 1
@@ -6,3 +6,266 @@ from scraper.async_http import fetch_html
 async def test_fetch_html():
     html = await fetch_html('https://example.com')
     assert '<html' in html
+
+async def _start_local_server(routes):
+    """Levanta un servidor aiohttp local en un puerto libre"""
+    from aiohttp import web
+    app = web.Application()
+    app.add_routes(routes)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}'
+
+@pytest.mark.asyncio
+async def test_fetch_html_reuses_shared_session():
+    from aiohttp import web
+    from scraper.async_http import create_session, ConnectionStats
+
+    async def page(request):
+        return web.Response(text='<html><title>Local</title></html>', content_type='text/html')
+
+    runner, base = await _start_local_server([web.get('/', page)])
+    stats = ConnectionStats()
+    session = create_session(limit=10, limit_per_host=2, stats=stats)
+    try:
+        for _ in range(3):
+            html = await fetch_html(base + '/', session=session)
+            assert '<title>Local</title>' in html
+    finally:
+        await session.close()
+        await runner.cleanup()
+
+    assert stats.requests == 3
+    assert stats.connections_created == 1
+    assert stats.connections_reused == 2
+
+SAMPLE_HTML = '''<!DOCTYPE html><html><head><meta charset="utf-8">
+<title> Hola &amp; chau </title>
+<meta name="Description" content=" desc "><meta property="og:title" content="OG">
+<meta name="x-custom" content="ignorado"></head>
+<body><h1>a</h1><h2>b</h2><h2>c</h2>
+<a href="#top">anchor</a><a href=" /relativo ">r</a><a>sin href</a>
+<img src="a.png"><img><a href="https://example.com/img.png">i</a></body></html>'''
+
+def test_extract_page_matches_bs4_pipeline():
+    from scraper.html_parser import parse_html
+    from scraper.metadata_extractor import extract_metadata
+    from scraper.page_extractor import extract_page
+
+    expected = parse_html(SAMPLE_HTML)
+    expected['meta_tags'] = extract_metadata(SAMPLE_HTML)
+    assert extract_page(SAMPLE_HTML) == expected
+
+def test_page_extractor_incremental_feed():
+    from scraper.page_extractor import PageExtractor, extract_page
+
+    extractor = PageExtractor()
+    for i in range(0, len(SAMPLE_HTML), 7):
+        extractor.feed(SAMPLE_HTML[i:i + 7])
+    assert extractor.finish() == extract_page(SAMPLE_HTML)
+
+def test_extract_page_resource_inventory():
+    from scraper.page_extractor import extract_page
+
+    html = ('<html><head><link rel="Stylesheet" href="/a.css"><link rel="icon" href="/f.ico">'
+            '<script src="/a.js"></script><script>inline()</script></head>'
+            '<body><img src="/x.png"><img></body></html>')
+    data = extract_page(html, resources=True)
+    assert data['resources'] == {'stylesheets': ['/a.css'], 'scripts': ['/a.js'], 'images': ['/x.png']}
+    assert data['images_count'] == 2
+    assert 'resources' not in extract_page(html)
+
+@pytest.mark.asyncio
+async def test_parse_pool_inline_and_offloaded():
+    from scraper.page_extractor import extract_page
+    from scraper.parse_pool import ParsePool
+
+    pool = ParsePool(workers=1, inline_threshold=len(SAMPLE_HTML) + 1)
+    try:
+        assert await pool.parse(SAMPLE_HTML) == extract_page(SAMPLE_HTML)
+        assert pool.inline_parses == 1
+
+        pool.inline_threshold = 0
+        results = await asyncio.gather(*(pool.parse(SAMPLE_HTML) for _ in range(4)))
+        assert all(r == extract_page(SAMPLE_HTML) for r in results)
+        assert pool.pool_parses == 4
+        assert pool.queue_depth == 0
+        assert pool.max_queue_depth >= 1
+    finally:
+        pool.shutdown()
+
+def test_normalize_url():
+    from common.urls import normalize_url
+
+    assert normalize_url('HTTPS://Example.COM:443?b=2&a=1#frag') == 'https://example.com/?a=1&b=2'
+    assert normalize_url('http://example.com:8080/x') == 'http://example.com:8080/x'
+
+def test_result_cache_lru_eviction():
+    from scraper.result_cache import ResultCache
+
+    cache = ResultCache(ttl=60, max_bytes=10)
+    cache.put('a', {}, b'1234')
+    cache.put('b', {}, b'1234')
+    assert cache.lookup('a')[1] is True  # 'a' pasa a ser la más reciente
+    cache.put('c', {}, b'1234')
+    assert cache.lookup('b') == (None, False)
+    assert len(cache) == 2
+    assert cache.evictions == 1
+    assert cache.current_bytes == 8
+
+def test_stream_decoder_sniffs_charset_across_chunks():
+    from scraper.async_http import StreamDecoder
+
+    body = ('<html><head><meta charset="iso-8859-1"><title>Canción</title></head>'
+            + ' ' * 2000 + 'ñandú</html>').encode('latin-1')
+    decoder = StreamDecoder()
+    text = ''.join(decoder.feed(body[i:i + 100]) for i in range(0, len(body), 100)) + decoder.finish()
+    assert decoder.encoding == 'iso8859-1'
+    assert text == body.decode('latin-1')
+
+    # Un carácter multibyte partido entre chunks, con charset del header
+    decoder = StreamDecoder('utf-8')
+    data = 'añb'.encode('utf-8')
+    assert decoder.feed(data[:2]) + decoder.feed(data[2:]) + decoder.finish() == 'añb'
+
+    # Sin header, BOM ni <meta>: UTF-8 con reemplazo de bytes inválidos
+    decoder = StreamDecoder()
+    assert decoder.feed(b'<p>\xff</p>') + decoder.finish() == '<p>�</p>'
+    assert decoder.encoding == 'utf-8'
+
+@pytest.mark.asyncio
+async def test_fetch_page_streams_with_hard_cap_and_parser():
+    from aiohttp import web
+    from scraper.async_http import fetch_page, PageTooLarge
+    from scraper.page_extractor import PageExtractor, finish_page, extract_page
+
+    big_page = SAMPLE_HTML.replace('</body>', ''.join(
+        f'<a href="https://example.com/{i}">{i}</a>' for i in range(3000)
+    ) + '</body>')
+    sent = {'endless': 0}
+
+    async def sized(request):
+        return web.Response(body=b'x' * 300_000, content_type='text/html')
+
+    async def endless(request):
+        # Sin Content-Length: el tope sólo puede aplicarse contando lo leído
+        response = web.StreamResponse(headers={'Content-Type': 'text/html'})
+        await response.prepare(request)
+        try:
+            for _ in range(1000):
+                await response.write(b'<p>' + b'x' * 65536 + b'</p>')
+                sent['endless'] += 1
+        except (ConnectionError, RuntimeError):
+            pass
+        return response
+
+    async def chunked(request):
+        response = web.StreamResponse(headers={'Content-Type': 'text/html; charset=utf-8'})
+        await response.prepare(request)
+        data = big_page.encode('utf-8')
+        for i in range(0, len(data), 1000):
+            await response.write(data[i:i + 1000])
+        return response
+
+    runner, base = await _start_local_server([
+        web.get('/sized', sized), web.get('/endless', endless), web.get('/chunked', chunked)
+    ])
+    try:
+        with pytest.raises(PageTooLarge):
+            await fetch_page(base + '/sized', max_size=100_000)
+        with pytest.raises(PageTooLarge):
+            await fetch_page(base + '/endless', max_size=1_000_000)
+
+        extractor = PageExtractor()
+        page = await fetch_page(base + '/chunked', parser=extractor, keep_html=False)
+    finally:
+        await runner.cleanup()
+
+    assert sent['endless'] < 1000
+    assert page.html is None
+    assert page.size == len(big_page.encode('utf-8'))
+    assert finish_page(extractor) == extract_page(big_page)
+
+@pytest.mark.asyncio
+async def test_fetch_page_records_url_after_redirects():
+    from aiohttp import web
+    from scraper.async_http import fetch_page
+
+    async def old(request):
+        raise web.HTTPFound('/nuevo/')
+
+    async def new(request):
+        return web.Response(text=SAMPLE_HTML, content_type='text/html')
+
+    runner, base = await _start_local_server([web.get('/viejo', old), web.get('/nuevo/', new)])
+    try:
+        page = await fetch_page(base + '/viejo')
+    finally:
+        await runner.cleanup()
+
+    assert page.url == base + '/viejo'
+    assert page.final_url == base + '/nuevo/'
+
+def test_job_store_is_bounded_and_expires():
+    import time
+    from scraper.jobs import JobStore, JobStoreFull
+
+    store = JobStore(max_jobs=2, ttl=0.1)
+    first = store.create('https://a.com')
+    second = store.create('https://b.com')
+    with pytest.raises(JobStoreFull):
+        store.create('https://c.com')
+
+    # Al llenarse se descarta el terminado más viejo; los en curso se conservan
+    first.complete()
+    store.finished(first)
+    third = store.create('https://c.com')
+    assert store.get(first.id) is None
+    assert store.get(second.id) is second
+
+    third.fail('error')
+    store.finished(third)
+    time.sleep(0.15)
+    assert store.get(third.id) is None
+    assert store.stats()['expired'] == 2
+    assert store.stats()['rejected'] == 1
+
+@pytest.mark.asyncio
+async def test_admission_control_bounds_running_and_queued():
+    from scraper.admission import AdmissionControl, Overloaded
+
+    admission = AdmissionControl(limit=1, max_queue=1, queue_timeout=0.2)
+    await admission.acquire()
+    waiting = asyncio.ensure_future(admission.acquire())
+    await asyncio.sleep(0)
+
+    # Cola llena: se rechaza enseguida con un Retry-After sugerido
+    with pytest.raises(Overloaded) as rejected:
+        await admission.acquire()
+    assert rejected.value.retry_after >= 1
+
+    # El lugar liberado pasa directo al primero de la cola
+    admission.release(0.5)
+    await waiting
+    assert admission.running == 1 and admission.queued == 0
+
+    # Quien espera más que queue_timeout también se rechaza
+    with pytest.raises(Overloaded):
+        await admission.acquire()
+
+    # Un solicitante cancelado sale de la cola sin llevarse el lugar
+    cancelled = asyncio.ensure_future(admission.acquire())
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.gather(cancelled, return_exceptions=True)
+    admission.release(0.5)
+    assert admission.running == 0
+
+    stats = admission.stats()
+    assert stats['admitted'] == 2
+    assert stats['rejected'] == 1
+    assert stats['timed_out'] == 1
+    assert stats['avg_duration_ms'] == 500.0
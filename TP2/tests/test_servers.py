@@ -0,0 +1,314 @@
+import pytest
+import asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+import server_scraping
+
+PAGE = '<html><head><title>Origen</title></head><body><a href="/logo.png">logo</a></body></html>'
+
+def make_origin(etag='"v1"'):
+    """Servidor de origen local que soporta GET condicional con ETag"""
+    hits = {'full': 0, 'not_modified': 0}
+
+    async def page(request):
+        if request.headers.get('If-None-Match') == etag:
+            hits['not_modified'] += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        hits['full'] += 1
+        return web.Response(text=PAGE, content_type='text/html', headers={'ETag': etag})
+
+    app = web.Application()
+    app.add_routes([web.get('/', page)])
+    return TestServer(app), hits
+
+def make_client(processing_address, **kwargs):
+    host, port = processing_address
+    kwargs.setdefault('workers', 0)
+    config = server_scraping.ServerConfig('127.0.0.1', 0, host, port, **kwargs)
+    return TestClient(TestServer(server_scraping.create_app(config)))
+
+@pytest.mark.asyncio
+async def test_scrape_uses_cache_and_revalidates(processing_server):
+    address, received = processing_server
+    origin, hits = make_origin()
+    async with origin, make_client(address, cache_ttl=0.2) as client:
+        url = str(origin.make_url('/'))
+
+        first = await client.get('/scrape', params={'url': url})
+        assert first.status == 200
+        assert first.headers['X-Cache'] == 'MISS'
+        data = await first.json()
+        assert data['scraping_data']['title'] == 'Origen'
+        assert data['processing_data']['performance']['echo'] == url
+
+        second = await client.get('/scrape', params={'url': url.upper().replace('HTTP://', 'http://')})
+        assert second.headers['X-Cache'] == 'HIT'
+        assert await second.json() == data
+
+        await asyncio.sleep(0.25)
+        third = await client.get('/scrape', params={'url': url})
+        assert third.headers['X-Cache'] == 'REVALIDATED'
+        assert await third.json() == data
+
+        stats = await (await client.get('/stats')).json()
+
+    assert hits == {'full': 1, 'not_modified': 1}
+    assert len(received) == 1
+    # El Servidor B recibe las mediciones de la descarga en lugar de repetirla
+    page = received[0]['page']
+    assert page['size_bytes'] == len(PAGE)
+    assert page['load_time_ms'] >= page['ttfb_ms'] >= 0
+    assert page['resources'] == {'stylesheets': [], 'scripts': [], 'images': []}
+    assert received[0]['remeasure'] is False
+    assert 'resources' not in data['scraping_data']
+    assert stats['cache']['hits'] == 1
+    assert stats['cache']['misses'] == 1
+    assert stats['cache']['revalidations'] == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_scrapes_are_coalesced(processing_server):
+    address, received = processing_server
+    origin_hits = []
+
+    async def slow_page(request):
+        origin_hits.append(request.path)
+        await asyncio.sleep(0.2)
+        return web.Response(text=PAGE, content_type='text/html')
+
+    app = web.Application()
+    app.add_routes([web.get('/', slow_page)])
+    async with TestServer(app) as origin, make_client(address, cache_ttl=0) as client:
+        url = str(origin.make_url('/'))
+        responses = await asyncio.gather(
+            *(client.get('/scrape', params={'url': url}) for _ in range(5))
+        )
+        assert all(r.status == 200 for r in responses)
+        stats = await (await client.get('/stats')).json()
+
+    assert len(origin_hits) == 1
+    assert len(received) == 1
+    assert stats['singleflight']['coalesced'] == 4
+    assert stats['singleflight']['in_flight'] == 0
+
+@pytest.mark.asyncio
+async def test_batch_scrape_streams_ndjson(processing_server):
+    import json
+    address, _ = processing_server
+
+    async def page(request):
+        await asyncio.sleep(float(request.query.get('delay', 0)))
+        return web.Response(text=PAGE, content_type='text/html')
+
+    app = web.Application()
+    app.add_routes([web.get('/', page)])
+    async with TestServer(app) as origin, make_client(address, batch_concurrency=4) as client:
+        slow = str(origin.make_url('/').with_query(delay='0.3'))
+        fast = str(origin.make_url('/').with_query(delay='0'))
+        response = await client.post('/scrape/batch', json={'urls': [slow, fast, 'ftp://x']})
+        assert response.status == 200
+        assert response.headers['Content-Type'].startswith('application/x-ndjson')
+        lines = [json.loads(line) for line in (await response.text()).splitlines()]
+
+        bad = await client.post('/scrape/batch', json={'urls': []})
+        assert bad.status == 400
+
+    assert len(lines) == 3
+    assert lines[-1]['url'] == slow
+    assert lines[-1]['status'] == 'success'
+    failed = [line for line in lines if line['status'] == 'failed']
+    assert failed[0]['url'] == 'ftp://x'
+
+@pytest.mark.asyncio
+async def test_stream_parse_and_page_size_cap(processing_server):
+    address, received = processing_server
+    origin, _ = make_origin()
+    async with origin:
+        url = str(origin.make_url('/'))
+        async with make_client(address, cache_ttl=0) as client:
+            expected = await (await client.get('/scrape', params={'url': url})).json()
+        async with make_client(address, cache_ttl=0, stream_parse=True) as client:
+            streamed = await (await client.get('/scrape', params={'url': url})).json()
+        async with make_client(address, cache_ttl=0, max_page_mb=0) as client:
+            too_large = await client.get('/scrape', params={'url': url})
+            error = await too_large.json()
+
+    assert streamed['scraping_data'] == expected['scraping_data']
+    assert received[0]['page']['resources'] == received[1]['page']['resources']
+    assert too_large.status == 502
+    assert error['error'].startswith('Página demasiado grande')
+
+@pytest.mark.asyncio
+async def test_async_jobs_publish_stages_and_call_webhook(processing_server, monkeypatch):
+    import time
+    import server_processing
+    address, received = processing_server
+
+    def slow_screenshot(url, deadline=None):
+        time.sleep(0.5)
+        return b'\x89PNG'
+
+    monkeypatch.setattr(server_processing, 'process_screenshot', slow_screenshot)
+    hooks = []
+
+    async def page(request):
+        return web.Response(text=PAGE, content_type='text/html')
+
+    async def hook(request):
+        hooks.append(await request.json())
+        return web.Response(status=204)
+
+    app = web.Application()
+    app.add_routes([web.get('/', page), web.post('/hook', hook)])
+    async with TestServer(app) as origin, make_client(address, cache_ttl=0) as client:
+        url = str(origin.make_url('/'))
+        created = await client.post('/jobs', json={'url': url, 'webhook': str(origin.make_url('/hook'))})
+        assert created.status == 202
+        job_id = (await created.json())['job_id']
+        assert created.headers['Location'] == f'/jobs/{job_id}'
+
+        # Los datos de scraping y el rendimiento llegan antes que el screenshot
+        await asyncio.sleep(0.25)
+        partial = await (await client.get(f'/jobs/{job_id}')).json()
+        for _ in range(50):
+            job = await (await client.get(f'/jobs/{job_id}')).json()
+            if job['status'] == 'done':
+                break
+            await asyncio.sleep(0.05)
+        for _ in range(20):
+            if hooks:
+                break
+            await asyncio.sleep(0.05)
+
+        missing = await client.get('/jobs/inexistente')
+        bad = await client.post('/jobs', json={'url': url, 'webhook': 'ftp://x'})
+        stats = await (await client.get('/stats')).json()
+
+    assert partial['status'] == 'running'
+    assert partial['scraping_data']['title'] == 'Origen'
+    assert partial['stages']['performance'] == 'done'
+    assert partial['stages']['screenshot'] == 'running'
+    assert 'screenshot' not in partial['processing_data']
+
+    assert job['stages'] == {'scraping': 'done', 'performance': 'done', 'thumbnails': 'done', 'screenshot': 'done'}
+    assert job['processing_data']['performance']['echo'] == url
+    assert job['processing_data']['screenshot'] == 'iVBORw=='
+    # Una solicitud al Servidor B por tarea
+    assert len(received) == 1
+    assert hooks[0]['job_id'] == job_id and hooks[0]['status'] == 'done'
+    assert missing.status == 404
+    assert bad.status == 400
+    assert stats['jobs']['completed'] == 1
+
+@pytest.mark.asyncio
+async def test_scrape_sheds_load_with_retry_after(processing_server):
+    address, _ = processing_server
+
+    async def slow_page(request):
+        await asyncio.sleep(0.3)
+        return web.Response(text=PAGE, content_type='text/html')
+
+    app = web.Application()
+    app.add_routes([web.get('/', slow_page)])
+    async with TestServer(app) as origin, make_client(address, cache_ttl=0, max_concurrent=1,
+                                                        max_queue=1) as client:
+        # URLs distintas para que el single-flight no las una
+        urls = [str(origin.make_url('/').with_query(n=str(n))) for n in range(3)]
+        responses = await asyncio.gather(*(client.get('/scrape', params={'url': url}) for url in urls))
+        stats = await (await client.get('/stats')).json()
+        rejected = [r for r in responses if r.status == 503]
+        body = await rejected[0].json()
+
+    # Uno en curso, uno en cola y el tercero rechazado sin esperar
+    assert sorted(r.status for r in responses) == [200, 200, 503]
+    assert int(rejected[0].headers['Retry-After']) >= 1
+    assert body['error'].startswith('Servidor sobrecargado')
+    assert stats['admission']['rejected'] == 1
+    assert stats['admission']['admitted'] == 2
+    assert stats['admission']['running'] == 0
+
+@pytest.mark.asyncio
+async def test_scrape_degrades_when_processing_circuit_is_open():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        dead = sock.getsockname()[:2]
+
+    origin, hits = make_origin()
+    async with origin, make_client(dead, circuit_failures=1, circuit_reset=60) as client:
+        url = str(origin.make_url('/'))
+        first = await client.get('/scrape', params={'url': url})
+        second = await client.get('/scrape', params={'url': url})
+        data = await second.json()
+        stats = await (await client.get('/stats')).json()
+
+    # Solo datos de scraping, sin cachear, y sin volver a intentar la conexión
+    assert first.status == second.status == 200
+    assert data['status'] == 'degraded'
+    assert data['scraping_data']['title'] == 'Origen'
+    assert 'error' in data['processing_data']
+    assert second.headers['X-Cache'] == 'MISS'
+    assert hits['full'] == 2
+    assert stats['processing']['short_circuited'] == 1
+    assert stats['processing']['endpoints'][0]['circuit']['state'] == 'open'
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_reports_stages_and_bytes(processing_server):
+    address, _ = processing_server
+    origin, _ = make_origin()
+    async with origin, make_client(address, cache_ttl=0) as client:
+        url = str(origin.make_url('/'))
+        assert (await client.get('/scrape', params={'url': url})).status == 200
+        response = await client.get('/metrics')
+        text = await response.text()
+
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    for stage in ('fetch_html', 'parse_html', 'processing'):
+        assert f'tp2_stage_duration_seconds_count{{stage="{stage}"}} 1' in text
+    assert 'tp2_stage_duration_seconds_bucket{stage="fetch_html",le="+Inf"} 1' in text
+    assert 'tp2_http_requests_total{route="/scrape",status="200"} 1' in text
+    assert f'tp2_origin_bytes_total {len(PAGE)}' in text
+    assert 'tp2_scrapes_in_flight 0' in text
+    assert f'tp2_processing_up{{endpoint="{address[0]}:{address[1]}"}} 1' in text
+    bytes_out = [line for line in text.splitlines() if line.startswith('tp2_http_bytes_total{direction="out"}')]
+    assert int(bytes_out[0].split()[-1]) > len(PAGE)
+    processing_in = [line for line in text.splitlines()
+                     if line.startswith('tp2_processing_bytes_total{direction="in"}')]
+    assert int(processing_in[0].split()[-1]) > 0
+
+@pytest.mark.asyncio
+async def test_scrape_timings_and_trace_file(processing_server, tmp_path):
+    import json
+    address, _ = processing_server
+    trace_file = tmp_path / 'trace.json'
+    origin, _ = make_origin()
+    async with origin, make_client(address, trace_file=str(trace_file)) as client:
+        url = str(origin.make_url('/'))
+        first = await client.get('/scrape', params={'url': url, 'timings': '1'})
+        data = await first.json()
+        cached = await (await client.get('/scrape', params={'url': url})).json()
+
+    trace_id = first.headers['X-Trace-Id']
+    timings = data['timings']
+    spans = {(span['server'], span['name']): span for span in timings['spans']}
+    assert timings['trace_id'] == trace_id
+    for name in ('admission', 'fetch_html', 'parse_html', 'processing', 'serialize'):
+        assert ('A', name) in spans
+    for task in ('screenshot', 'performance', 'thumbnails'):
+        assert ('B', f'{task}.queue') in spans
+        assert ('B', task) in spans
+    # Los spans del Servidor B caen dentro de la ida y vuelta medida por el Servidor A
+    processing = spans[('A', 'processing')]
+    performance = spans[('B', 'performance')]
+    assert processing['start_ms'] <= performance['start_ms']
+    assert performance['start_ms'] + performance['duration_ms'] <= \
+        processing['start_ms'] + processing['duration_ms'] + 1
+    assert timings['total_ms'] >= processing['duration_ms']
+    # Ni los tiempos ni los spans del Servidor B quedan en la respuesta cacheada
+    assert 'timings' not in cached
+    assert 'timings' not in cached['processing_data']
+
+    events = json.loads(trace_file.read_text().rstrip().rstrip(',') + ']')
+    traced = [event for event in events if event.get('args', {}).get('trace_id') == trace_id]
+    assert {event['pid'] for event in traced} == {1, 2}
+    assert all(event['ph'] == 'X' and event['dur'] >= 0 for event in traced)
+    assert 'fetch_html' in {event['name'] for event in traced}